@@ -0,0 +1,61 @@
+"""Import-time regression benchmark for ``import onboot``.
+
+Runs ``python -X importtime -c "import onboot"`` in fresh interpreters and
+reports the cumulative time spent importing the package. Fails if it exceeds
+the budget or if any module that should only be loaded on first use shows up.
+
+    python benchmarks/importtime.py [--runs 20] [--budget-us 100000]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+DEFERRED_MODULES = {
+    "onboot.linux", "onboot.darwin", "onboot.windows",
+    "onboot.aio", "subprocess", "ctypes", "winreg", "concurrent.futures", "random", "shutil", "asyncio",
+}
+
+
+def measure(module: str = "onboot") -> tuple:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative[module], set(cumulative)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-us", type=int, default=100_000)
+    args = parser.parse_args()
+
+    timings = []
+    imported = set()
+    for _ in range(args.runs):
+        total, modules = measure()
+        timings.append(total)
+        imported |= modules
+
+    median = statistics.median(timings)
+    print(f"import onboot: median {median:.0f}us, min {min(timings)}us, max {max(timings)}us over {args.runs} runs")
+
+    eager = sorted(DEFERRED_MODULES & imported)
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        return 1
+    if median > args.budget_us:
+        print(f"FAIL: median {median:.0f}us exceeds budget of {args.budget_us}us")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Bulk rendering benchmark for the generated file formats.
+
+Renders N configurations with each installer's ``render_many()`` and reports
+throughput and the peak memory allocated while streaming them. Fails if any
+format renders fewer files per second than the floor.
+
+    python benchmarks/render.py [--count 100000] [--min-per-second 20000]
+"""
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from onboot import InstallerConfiguration  # noqa: E402
+from onboot.darwin import LaunchDaemonInstaller  # noqa: E402
+from onboot.linux import XDGInstaller, SystemdSystemInstaller, InitInstaller  # noqa: E402
+
+INSTALLERS = [XDGInstaller, SystemdSystemInstaller, InitInstaller, LaunchDaemonInstaller]
+
+
+def configs(count: int):
+    directory = Path("/opt/my apps/bin")
+    return (InstallerConfiguration(directory, f"app-{i}%&<x>") for i in range(count))
+
+
+def measure(installer, count: int) -> tuple:
+    tracemalloc.start()
+    start = perf_counter()
+    size = 0
+    for _, content in installer.render_many(configs(count)):
+        size += len(content)
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # tracemalloc slows allocation down; time once more without it
+    start = perf_counter()
+    for _ in installer.render_many(configs(count)):
+        pass
+    return perf_counter() - start, peak, size
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--min-per-second", type=int, default=20_000)
+    args = parser.parse_args()
+
+    failed = False
+    for installer in INSTALLERS:
+        elapsed, peak, size = measure(installer, args.count)
+        rate = args.count / elapsed
+        print(f"{installer.__name__}: {args.count} files ({size / 1e6:.1f} MB) in {elapsed:.2f}s, "
+              f"{rate:.0f} files/s, peak {peak / 1024:.0f} KiB")
+        if rate < args.min_per_second:
+            print(f"FAIL: {installer.__name__} renders fewer than {args.min_per_second} files/s")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
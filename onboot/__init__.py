@@ -1,26 +1,68 @@
-import ctypes
 from abc import abstractmethod
 from dataclasses import dataclass
-from os import geteuid
 from pathlib import Path
-from random import choices
-from string import digits, ascii_letters
 from sys import platform
-from typing import Type, Optional
+from typing import Type, Optional, Iterable, Iterator, Union
+
+from onboot import detect
+
+
+# Tags every entry onboot writes so it can be told apart from foreign ones
+MARKER = "# onboot:"
 
 
 def random_str(length: int = 8) -> str:
+    from random import choices
+    from string import digits, ascii_letters
     return ''.join(choices(digits + ascii_letters, k=length))
 
 
+def resolve_path(path: Path, root: Optional[Path] = None, home: Optional[Path] = None) -> Path:
+    # Moves an absolute (or ~) path under root, e.g. /etc/init.d -> <root>/etc/init.d;
+    # ~ is the given home (as seen inside root) or the calling user's
+    if not isinstance(path, Path):
+        path = Path(path)
+    if home is not None and path.parts[:1] == ("~",):
+        path = Path(home).joinpath(*path.parts[1:])
+    path = path.expanduser()
+    if root is None:
+        return path
+    return Path(root).joinpath(path.relative_to(path.anchor))
+
+
 @dataclass
 class InstallerConfiguration:
     directory: Path
     name: str
-
-    def __init__(self, directory: Path, name: str):
+    # Alternate root (mounted image, container rootfs) that every path is placed under
+    root: Optional[Path] = None
+    # Home directory that ~ stands for, to install for another user (see onboot.users)
+    home: Optional[Path] = None
+    # Limits for backends that can enforce them (systemd); an onboot.options.ResourceControl
+    resources: Optional["ResourceControl"] = None
+    # Start lazily on a connection or file event (systemd); an onboot.options.SocketActivation or PathActivation
+    activation: Optional[Union["SocketActivation", "PathActivation"]] = None
+    # Delayed, jittered boot start; an onboot.options.Stagger
+    stagger: Optional["Stagger"] = None
+    # Periodic runs instead of a boot start; an onboot.options.Schedule
+    schedule: Optional["Schedule"] = None
+    # Limits of the slice shared by every onboot unit (systemd); an onboot.options.SliceLimits
+    slice_limits: Optional["SliceLimits"] = None
+
+    def __init__(self, directory: Path, name: str, root: Optional[Path] = None, home: Optional[Path] = None,
+                 resources: Optional["ResourceControl"] = None,
+                 activation: Optional[Union["SocketActivation", "PathActivation"]] = None,
+                 stagger: Optional["Stagger"] = None, schedule: Optional["Schedule"] = None,
+                 slice_limits: Optional["SliceLimits"] = None):
         self.directory = directory
         self.name = name
+        self.root = root
+        self.home = home
+        self.resources = resources
+        self.activation = activation
+        self.stagger = stagger
+        self.schedule = schedule
+        self.slice_limits = slice_limits
 
     def get_path(self) -> Path:
         return self.directory.joinpath(self.name)
@@ -30,99 +72,296 @@ class Installer:
     autostart_directory: Path
     target_path: Path
     config: InstallerConfiguration
+    # True when install() edits a resource other entries live in too (crontab, .bashrc, ...)
+    shared_target: bool = False
+    file_mode: int = 0o644
+    fsync: bool = True
+    # Seconds to wait for other processes editing the same shared target
+    lock_timeout: float = 30.0
+    # Whether the backend can run an entry on config.schedule instead of at boot
+    schedules: bool = False
+    # Whether the backend writes below ~, which needs config.home under an image root
+    per_user: bool = False
 
     def __init__(self, config: InstallerConfiguration):
         self.config = config
 
     @staticmethod
-    def write_file(path: Path, data: str) -> bool:
-        return path.write_text(data) == len(data)
+    def write_file(path: Path, data: str, mode: Optional[int] = None, fsync: bool = True) -> bool:
+        from onboot.files import atomic_write
+        atomic_write(path, data, mode, fsync)
+        return True
+
+    def resolve(self, path: Path) -> Path:
+        return resolve_path(path, self.config.root, self.config.home)
+
+    def in_root(self, path: Path) -> Path:
+        # The inverse of resolve(): how a path is seen from inside the root
+        if self.config.root is None:
+            return path
+        return Path("/").joinpath(path.relative_to(self.config.root))
+
+    def get_autostart_directory(self) -> Path:
+        return self.resolve(self.autostart_directory)
 
     def get_autostart_path(self) -> Path:
-        return self.autostart_directory.joinpath(self.config.name)
+        return self.get_autostart_directory().joinpath(self.config.name)
+
+    def write_autostart_file(self, data: str) -> bool:
+        return self.write_file(self.get_autostart_path(), data, self.file_mode, self.fsync)
+
+    def get_target(self) -> str:
+        return str(self.get_autostart_path())
 
     @abstractmethod
     def install(self) -> bool:
         ...
 
+    def plan(self, plan) -> None:
+        # Adds what install() would do to an onboot.plan.Plan without doing it
+        from onboot.plan import PlanError
+        render = getattr(self, "render", None)
+        if self.shared_target:
+            # A planned file replaces the image's copy and the entries already in it
+            raise PlanError(f"{type(self).__name__} edits a shared file and cannot be planned; install with root=.")
+        if render is None:
+            raise PlanError(f"{type(self).__name__} cannot be planned.")
+        plan.add_file(self.get_autostart_path(), render(), self.file_mode)
+
+    @classmethod
+    def render_many(cls, configs: Iterable[InstallerConfiguration]) -> Iterator[tuple[Path, str]]:
+        # (path, content) of the file install() writes for each configuration,
+        # produced one at a time so any number of them can be streamed out
+        from onboot.options import staggered
+        for config in staggered(configs):
+            installer = cls(config)
+            yield installer.get_autostart_path(), installer.render()
+
     def uninstall(self) -> bool:
-        if self.is_supported() and self.get_autostart_path().is_file():
-            self.get_autostart_path().unlink()
+        path = self.get_autostart_path()
+        if self.is_supported() and path.is_file():
+            path.unlink()
             return True
         return False
 
+    @classmethod
+    def install_many(cls, configs: list[InstallerConfiguration]) -> dict[str, bool]:
+        # Backends that can batch their side effects override these
+        from onboot.options import staggered
+        return {config.name: cls(config).install() for config in staggered(configs)}
+
+    @classmethod
+    def uninstall_many(cls, configs: list[InstallerConfiguration]) -> dict[str, bool]:
+        return {config.name: cls(config).uninstall() for config in configs}
+
+    @classmethod
+    def apply_many(cls, install: list[InstallerConfiguration],
+                   uninstall: list[InstallerConfiguration]) -> dict[str, bool]:
+        results = cls.uninstall_many(uninstall) if uninstall else {}
+        if install:
+            results.update(cls.install_many(install))
+        return results
+
     def is_supported(self) -> bool:
-        return self.autostart_directory.is_dir()
+        return self.get_autostart_directory().is_dir()
+
+    def accepts(self) -> bool:
+        # False if the configuration asks for something this backend cannot do;
+        # unlike is_supported() this depends on the configuration, so is never cached
+        if self.config.schedule is not None and not self.schedules:
+            return False
+        # Under a root without a home, ~ would be the build host's home
+        return not (self.per_user and self.config.root is not None and self.config.home is None)
+
+    def probe_paths(self) -> list[Path]:
+        # Paths whose change may flip the result of is_supported()
+        if getattr(self, "autostart_directory", None) is None:
+            return []
+        return [self.get_autostart_directory()]
 
     @staticmethod
     def is_root() -> bool:
-        try:
-            r = geteuid() == 0
-        except AttributeError:
-            r = ctypes.windll.shell32.IsUserAnAdmin() != 0
-        return r
-
-
-def install_if_supported(installer: Installer) -> bool:
-    if installer.is_supported():
-        return installer.install()
+        return detect.is_root()
+
+    # asyncio variants; see onboot.aio
+    async def ais_supported(self) -> bool:
+        from onboot.aio import ais_supported
+        return await ais_supported(self)
+
+    async def ainstall(self) -> bool:
+        from onboot.aio import ainstall
+        return await ainstall(self)
+
+    async def auninstall(self) -> bool:
+        from onboot.aio import auninstall
+        return await auninstall(self)
+
+    # What ainstall() and auninstall() run; backends that spawn commands
+    # override these to await them on the loop instead of in a worker thread
+    async def _ainstall(self) -> bool:
+        from onboot.aio import offload
+        return await offload(self.install)
+
+    async def _auninstall(self) -> bool:
+        from onboot.aio import offload
+        return await offload(self.uninstall)
+
+
+def _record(installer: Installer, manifest):
+    if manifest is False:
+        return
+    from onboot.manifest import Manifest
+    try:
+        (manifest or Manifest()).record(installer)
+    except OSError:
+        pass
+
+
+def install_if_supported(installer: Installer, manifest=None) -> bool:
+    from onboot import instrument
+    if installer.accepts() and instrument.call("probe", installer, installer.is_supported) \
+            and instrument.call("install", installer, installer.install):
+        _record(installer, manifest)
+        return True
     return False
 
 
-def try_install(installers: list[Type[Installer]], config) -> [bool, Installer]:
-    ret = False
-    used: Optional[Installer] = None
+def _probe_concurrently(candidates: list[Installer], probe) -> Iterator[Installer]:
+    # Every probe runs at once; results are consumed in priority order so the
+    # first supported candidate wins no matter which probe finishes first.
+    from concurrent.futures import ThreadPoolExecutor
+    from contextvars import copy_context
+    pool = ThreadPoolExecutor(max_workers=max(len(candidates), 1), thread_name_prefix="onboot-probe")
+    try:
+        # Each probe runs in a copy of the caller's context, so instrumentation follows it
+        futures = [pool.submit(copy_context().run, probe, candidate) for candidate in candidates]
+        for candidate, future in zip(candidates, futures):
+            if future.result():
+                yield candidate
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def try_install(installers: list[Type[Installer]], config, concurrent: bool = False, cache=None,
+                manifest=None) -> [bool, Installer]:
+    from onboot import instrument
+    candidates = [installer(config) for installer in installers]
+    check = cache.is_supported if cache is not None else lambda candidate: candidate.is_supported()
+
+    def probe(candidate: Installer) -> bool:
+        if candidate.accepts() and instrument.call("probe", candidate, lambda: check(candidate)):
+            return True
+        instrument.skip(candidate, "unsupported")
+        return False
+
+    if concurrent:
+        supported = _probe_concurrently(candidates, probe)
+    else:
+        supported = (candidate for candidate in candidates if probe(candidate))
 
-    for installer in installers:
-        i = installer(config)
-        if not ret and i.is_supported():
-            ret = i.install()
-            if ret:
-                used = i
-                break
+    try:
+        for candidate in supported:
+            if instrument.call("install", candidate, candidate.install):
+                _record(candidate, manifest)
+                return True, candidate
+            instrument.skip(candidate, "install-failed")
+    finally:
+        supported.close()
 
-    return ret, used
+    return False, None
 
 
-def install_linux(config: InstallerConfiguration) -> [bool, Installer]:
+def install_linux(config: InstallerConfiguration, concurrent: bool = False, cache=None) -> [bool, Installer]:
     from onboot.linux import XDGInstaller, CrontabInstaller, ProfileInstaller, InitInstaller
-    return try_install([XDGInstaller, CrontabInstaller, ProfileInstaller, InitInstaller], config)
+    return try_install([XDGInstaller, CrontabInstaller, ProfileInstaller, InitInstaller], config, concurrent, cache)
 
 
-def install_windows(config: InstallerConfiguration) -> [bool, Installer]:
+def install_windows(config: InstallerConfiguration, concurrent: bool = False, cache=None) -> [bool, Installer]:
     from onboot.windows import StartMenuInstaller
-    return try_install([StartMenuInstaller], config)
+    return try_install([StartMenuInstaller], config, concurrent, cache)
 
 
-def install_darwin(config: InstallerConfiguration) -> [bool, Installer]:
+def install_darwin(config: InstallerConfiguration, concurrent: bool = False, cache=None) -> [bool, Installer]:
     from onboot.darwin import PListInstaller
     from onboot.linux import CrontabInstaller
-    return try_install([PListInstaller, CrontabInstaller], config)
+    return try_install([PListInstaller, CrontabInstaller], config, concurrent, cache)
 
 
-def install(config: InstallerConfiguration) -> [bool, Installer]:
+def install(config: InstallerConfiguration, concurrent: bool = False, cache=None) -> [bool, Installer]:
     if platform == "linux":
-        return install_linux(config)
+        return install_linux(config, concurrent, cache)
     elif platform == "darwin":
-        return install_darwin(config)
-    elif platform == "windows":
-        return install_windows(config)
+        return install_darwin(config, concurrent, cache)
+    elif platform == "win32":
+        return install_windows(config, concurrent, cache)
     else:
         raise NotImplementedError(f"Platform {platform} is not implemented.")
 
 
-_installers = ["install", "install_linux", "install_darwin", "install_windows", "InstallerConfiguration"]
+def status(name: str, manifest=None, target: Optional[str] = None):
+    from onboot.manifest import Manifest
+    return (manifest or Manifest()).get(name, target)
+
+
+def uninstall(name: str, manifest=None, target: Optional[str] = None) -> bool:
+    # Removes every recorded install of name, or only the one at target
+    from onboot.manifest import Manifest
+    manifest = manifest or Manifest()
+    entries = manifest.find(name, target)
+    if not entries:
+        return False
+    from onboot import instrument
+    ok = True
+    for entry in entries:
+        installer = entry.get_installer()
+        if instrument.call("uninstall", installer, installer.uninstall):
+            manifest.forget(name, entry.target)
+        else:
+            ok = False
+    return ok
+
+
+_installers = ["install", "uninstall", "status", "install_linux", "install_darwin", "install_windows", "InstallerConfiguration"]
+
+# Platform installers are resolved on first attribute access (see __getattr__)
+# so that "import onboot" does not pull in subprocess, winreg or ctypes.
+_lazy_installers: dict[str, str] = {}
 
 if platform == "linux":
-    from onboot.linux import XDGInstaller, CrontabInstaller, ProfileInstaller, InitInstaller
-    _installers += ["XDGInstaller", "CrontabInstaller", "ProfileInstaller", "InitInstaller"]
+    _lazy_installers = {
+        "XDGInstaller": "onboot.linux",
+        "CrontabInstaller": "onboot.linux",
+        "ProfileInstaller": "onboot.linux",
+        "InitInstaller": "onboot.linux",
+    }
 elif platform == "darwin":
-    from onboot.darwin import PListInstaller
-    from onboot.linux import CrontabInstaller
-    _installers += ["PListInstaller", "CrontabInstaller"]
-elif platform == "windows":
-    from onboot.windows import StartMenuInstaller, HKCUInstaller, HKLMInstaller
-    _installers += ["StartMenuInstaller", "HKCUInstaller", "HKLMInstaller"]
+    _lazy_installers = {
+        "PListInstaller": "onboot.darwin",
+        "CrontabInstaller": "onboot.linux",
+    }
+elif platform == "win32":
+    _lazy_installers = {
+        "StartMenuInstaller": "onboot.windows",
+        "HKCUInstaller": "onboot.windows",
+        "HKLMInstaller": "onboot.windows",
+    }
+
+_lazy_installers["atry_install"] = "onboot.aio"
+_installers += list(_lazy_installers)
+
+
+def __getattr__(name: str):
+    module = _lazy_installers.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_lazy_installers))
 
 
 __all__ = ["Installer", "random_str"] + _installers
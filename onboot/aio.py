@@ -0,0 +1,102 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional, Sequence, Type, TypeVar
+
+from onboot import Installer, InstallerConfiguration, _record, instrument
+from onboot.instrument import spawned
+from onboot.lock import locked
+from onboot.runner import CommandError, SubprocessRunner, get_runner
+
+T = TypeVar("T")
+
+
+async def arun(argv: Sequence[str], input: Optional[bytes] = None, timeout: Optional[float] = 60.0) -> bytes:
+    # The asyncio counterpart of onboot.runner.run(): argv, no shell, captured output
+    runner = get_runner()
+    if type(runner) is not SubprocessRunner:
+        # A runner installed with use_runner() (a fake, a batch) is used as it is
+        return await offload(runner.run, argv, input, timeout)
+    argv = [str(arg) for arg in argv]
+    with spawned(argv):
+        process = await asyncio.create_subprocess_exec(
+            *argv, stdin=asyncio.subprocess.DEVNULL if input is None else asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(input), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise CommandError(argv, None, reason=f"timed out after {timeout}s") from None
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        if process.returncode != 0:
+            raise CommandError(argv, process.returncode, stdout, stderr)
+    return stdout
+
+
+async def offload(function: Callable[..., T], *args) -> T:
+    # Runs blocking file work in a worker thread
+    return await asyncio.to_thread(function, *args)
+
+
+@asynccontextmanager
+async def alocked(resource: str, timeout: float = 30.0) -> AsyncIterator[None]:
+    # onboot.lock.locked() for an event loop: only waiting for the lock takes a thread
+    lock = locked(resource, timeout)
+    await offload(lock.__enter__)
+    try:
+        yield
+    finally:
+        lock.__exit__(None, None, None)
+
+
+async def ais_supported(installer: Installer, cache=None) -> bool:
+    if not installer.accepts():
+        return False
+    check = cache.is_supported if cache is not None else lambda candidate: candidate.is_supported()
+    return await offload(instrument.call, "probe", installer, lambda: check(installer))
+
+
+async def ainstall(installer: Installer) -> bool:
+    return await instrument.acall("install", installer, installer._ainstall)
+
+
+async def auninstall(installer: Installer) -> bool:
+    return await instrument.acall("uninstall", installer, installer._auninstall)
+
+
+async def atry_install(installers: list[Type[Installer]], config: InstallerConfiguration, cache=None,
+                       manifest=None) -> [bool, Installer]:
+    # Like try_install(concurrent=True): every probe runs at once, the first
+    # supported candidate in priority order is installed
+    candidates = [installer(config) for installer in installers]
+    probes = [asyncio.ensure_future(ais_supported(candidate, cache)) for candidate in candidates]
+    try:
+        for candidate, probe in zip(candidates, probes):
+            if not await probe:
+                instrument.skip(candidate, "unsupported")
+                continue
+            if await ainstall(candidate):
+                await offload(_record, candidate, manifest)
+                return True, candidate
+            instrument.skip(candidate, "install-failed")
+    finally:
+        for probe in probes:
+            probe.cancel()
+    return False, None
+
+
+async def atry_install_many(installers: list[Type[Installer]], configs: list[InstallerConfiguration],
+                            limit: int = 8, cache=None, manifest=None) -> dict[str, tuple]:
+    # Installs every configuration, at most limit of them at a time
+    semaphore = asyncio.Semaphore(limit)
+
+    async def one(config: InstallerConfiguration):
+        async with semaphore:
+            return await atry_install(installers, config, cache, manifest)
+
+    results = await asyncio.gather(*(one(config) for config in configs))
+    return {config.name: result for config, result in zip(configs, results)}
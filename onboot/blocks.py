@@ -0,0 +1,237 @@
+from os import chmod, fdopen, fsync as os_fsync, replace, stat, unlink
+from os.path import realpath
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Iterable, Iterator, Optional
+
+from onboot import Installer, InstallerConfiguration, templates
+from onboot.files import fsync_directory
+from onboot.instrument import transferred
+from onboot.lock import locked_file
+from onboot.options import staggered
+
+BEGIN = "# >>> onboot >>>"
+END = "# <<< onboot <<<"
+# Lines of other programs (or another encoding) pass through byte for byte
+ENCODING = {"encoding": "utf-8", "errors": "surrogateescape"}
+
+
+def _entry_name(line: str) -> Optional[str]:
+    if line.startswith("# ") and line.endswith(" autostart"):
+        return line[2:-len(" autostart")]
+    return None
+
+
+def scan_block(path: Path, bare: Optional[dict[str, str]] = None) -> tuple:
+    # Returns (entries in the managed block, whether there is a block, names of
+    # entries written by older versions outside of it). bare maps uncommented
+    # "<command> &" lines older versions wrote to the name of their entry.
+    bare = bare or {}
+    entries: dict[str, str] = {}
+    legacy = set()
+    found = in_block = False
+    name = None
+    with open(path, **ENCODING) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if in_block:
+                if line == END:
+                    in_block = False
+                elif name is not None:
+                    entries[name] = line
+                    name = None
+                else:
+                    name = _entry_name(line)
+            elif line == BEGIN:
+                found = in_block = True
+            elif _entry_name(line) is not None:
+                legacy.add(_entry_name(line))
+            elif line in bare:
+                legacy.add(bare[line])
+    return entries, found, legacy
+
+
+def render_block(entries: dict[str, str]) -> list[str]:
+    lines = [f"{BEGIN}\n"]
+    for name, command in entries.items():
+        lines += [f"# {name} autostart\n", f"{command}\n"]
+    return lines + [f"{END}\n"]
+
+
+def _rewrite(lines: Iterable[str], block: list[str], drop: set, before_exit: bool,
+             bare: dict[str, str]) -> Iterator[str]:
+    pending: list[str] = []
+    tail = False
+    emitted = in_block = skip_next = False
+    last = ""
+    for raw in lines:
+        line = raw.rstrip("\n")
+        if in_block:
+            in_block = line != END
+            continue
+        if skip_next:
+            skip_next = False
+            continue
+        if line == BEGIN:
+            yield from pending
+            pending, tail = [], False
+            if not emitted:
+                yield from block
+                emitted = True
+            in_block = True
+            continue
+        if _entry_name(line) in drop:
+            # Older versions wrote "\n# <name> autostart\n<command> &\n"
+            if pending and not tail and not pending[-1].strip():
+                pending.pop()
+            skip_next = True
+            continue
+        if bare.get(line) in drop:
+            continue
+        if not line.strip():
+            pending.append(raw)
+            continue
+        if before_exit and line == "exit 0":
+            yield from pending
+            pending, tail = [raw], True
+            continue
+        yield from pending
+        pending, tail = [], False
+        yield raw
+        last = raw
+
+    if not emitted and block:
+        if tail:
+            yield from block
+            yield from pending
+            return
+        yield from pending
+        if pending:
+            last = pending[-1]
+        if last and not last.endswith("\n"):
+            yield "\n"
+        if last.strip():
+            yield "\n"
+        yield from block
+    else:
+        yield from pending
+
+
+def edit_block(path: Path, add: dict[str, str], remove: Iterable[str] = (), before_exit: bool = False,
+               default: Optional[str] = None, default_mode: int = 0o644, fsync: bool = True,
+               bare: Optional[dict[str, str]] = None) -> bool:
+    # Rewrites the managed block of a shared file in one streaming pass; returns
+    # False without writing when the block would not change. A symlinked file
+    # is edited at its target so the link survives.
+    path = Path(realpath(path))
+    remove = set(remove)
+    bare = bare or {}
+    exists = path.exists()
+    if exists:
+        st = stat(path)
+        mode = st.st_mode & 0o7777
+        entries, found, legacy = scan_block(path, bare)
+        transferred("read", path, st.st_size)
+    elif default is None:
+        raise FileNotFoundError(path)
+    elif not add:
+        return False
+    else:
+        mode = default_mode
+        entries, found, legacy = {}, False, set()
+
+    wanted = {name: command for name, command in entries.items() if name not in remove}
+    wanted.update(add)
+    drop = (set(add) | remove) & legacy
+    if exists and wanted == entries and not drop and (found or not wanted):
+        return False
+
+    block = render_block(wanted) if wanted else []
+    fd, tmp = mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with fdopen(fd, "w", **ENCODING) as out:
+            if exists:
+                with open(path, **ENCODING) as f:
+                    out.writelines(_rewrite(f, block, drop, before_exit, bare))
+                transferred("read", path, st.st_size)
+            else:
+                out.writelines(_rewrite(default.splitlines(keepends=True), block, drop, before_exit, bare))
+            written = out.tell()
+            out.flush()
+            if fsync:
+                os_fsync(out.fileno())
+        chmod(tmp, mode)
+        replace(tmp, path)
+    except BaseException:
+        try:
+            unlink(tmp)
+        except OSError:
+            pass
+        raise
+    transferred("write", path, written)
+    if fsync:
+        fsync_directory(path.parent)
+    return True
+
+
+class BlockFileInstaller(Installer):
+    # Keeps every entry in one marker-delimited block of a shared file
+    shared_target = True
+    before_exit = False
+    default_content: Optional[str] = None
+    default_mode = 0o644
+    # Whether older versions wrote bare "<path> &" lines without a name comment
+    bare_legacy = False
+
+    def get_entry(self) -> str:
+        path = templates.shell(self.config.get_path())
+        stagger = self.config.stagger
+        if stagger is not None and stagger.delayed:
+            return f"({stagger.sleep_command()}; {path}) &"
+        return f"{path} &"
+
+    def install(self) -> bool:
+        return self.install_many([self.config])[self.config.name]
+
+    def uninstall(self) -> bool:
+        return self.uninstall_many([self.config])[self.config.name]
+
+    @classmethod
+    def install_many(cls, configs: list[InstallerConfiguration]) -> dict[str, bool]:
+        return cls.apply_many(configs, [])
+
+    @classmethod
+    def uninstall_many(cls, configs: list[InstallerConfiguration]) -> dict[str, bool]:
+        return cls.apply_many([], configs)
+
+    @classmethod
+    def apply_many(cls, install: list[InstallerConfiguration],
+                   uninstall: list[InstallerConfiguration]) -> dict[str, bool]:
+        edits: dict[Path, tuple] = {}
+        results = {}
+        for config in staggered(install):
+            installer = cls(config)
+            if not installer.accepts():
+                results[config.name] = False
+                continue
+            edit = edits.setdefault(installer.get_autostart_path(), ({}, [], {}))
+            edit[0][config.name] = installer.get_entry()
+            if cls.bare_legacy:
+                edit[2][f"{config.get_path()} &"] = config.name
+        for config in uninstall:
+            edit = edits.setdefault(cls(config).get_autostart_path(), ({}, [], {}))
+            edit[1].append(config.name)
+            if cls.bare_legacy:
+                edit[2][f"{config.get_path()} &"] = config.name
+
+        for path, (add, remove, bare) in edits.items():
+            try:
+                with locked_file(path, cls.lock_timeout):
+                    ok = path.is_file() or bool(add)
+                    edit_block(path, add, remove, cls.before_exit, cls.default_content, cls.default_mode, cls.fsync,
+                               bare)
+            except (OSError, IOError, PermissionError, FileNotFoundError):
+                ok = False
+            for name in list(add) + remove:
+                results[name] = ok
+        return results
@@ -0,0 +1,118 @@
+import json
+from os import environ, fdopen, replace, unlink
+from pathlib import Path
+from tempfile import gettempdir, mkstemp
+from threading import Lock
+from time import time
+from typing import Optional
+
+from onboot import Installer, detect
+from onboot.lock import is_private, private_directory
+
+
+def boot_id() -> str:
+    try:
+        return Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+    except OSError:
+        return ""
+
+
+def default_cache_path() -> Path:
+    runtime = environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return Path(runtime).joinpath("onboot", "capabilities.json")
+    return Path(gettempdir()).joinpath(f"onboot-{detect.euid()}", "capabilities.json")
+
+
+def installer_key(installer: Installer) -> str:
+    # Support under an image root or for another user's home is probed separately
+    cls = type(installer)
+    key = f"{cls.__module__}.{cls.__qualname__}"
+    if installer.config.root is not None:
+        key += f" root={installer.config.root}"
+    if installer.config.home is not None:
+        key += f" home={installer.config.home}"
+    return key
+
+
+class CapabilityCache:
+    def __init__(self, path: Optional[Path] = None, ttl: float = 3600):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self._entries: Optional[dict] = None
+        self._lock = Lock()
+
+    @staticmethod
+    def fingerprint(installer: Installer) -> list:
+        mtimes = []
+        for path in installer.probe_paths():
+            try:
+                mtimes.append([str(path), path.stat().st_mtime_ns])
+            except OSError:
+                mtimes.append([str(path), None])
+        return [detect.euid(), boot_id(), mtimes]
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            self._entries = {}
+            if is_private(self.path.parent):
+                try:
+                    self._entries = json.loads(self.path.read_text())
+                except (OSError, ValueError):
+                    pass
+        return self._entries
+
+    def _save(self):
+        try:
+            private_directory(self.path.parent)
+        except PermissionError:
+            return
+        fd, tmp = mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with fdopen(fd, "w") as f:
+                f.write(json.dumps(self._entries))
+            replace(tmp, self.path)
+        except BaseException:
+            try:
+                unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def get(self, installer: Installer) -> Optional[bool]:
+        with self._lock:
+            entry = self._load().get(installer_key(installer))
+        if entry is None or time() - entry["time"] > self.ttl:
+            return None
+        if entry["fingerprint"] != self.fingerprint(installer):
+            return None
+        return entry["supported"]
+
+    def put(self, installer: Installer, supported: bool):
+        entry = {"supported": supported, "fingerprint": self.fingerprint(installer), "time": time()}
+        with self._lock:
+            self._load()[installer_key(installer)] = entry
+            try:
+                self._save()
+            except OSError:
+                pass
+
+    def is_supported(self, installer: Installer) -> bool:
+        supported = self.get(installer)
+        if supported is None:
+            supported = installer.is_supported()
+            self.put(installer, supported)
+        return supported
+
+    def entries(self) -> dict:
+        with self._lock:
+            self._entries = None
+            return dict(self._load())
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,102 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Type
+
+from onboot import detect
+from onboot.linux import SystemdUserInstaller, SystemdSystemInstaller
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+@dataclass(frozen=True)
+class CgroupStats:
+    path: Path
+    # Bytes; None where the controller is not enabled for the group
+    memory_current: Optional[int] = None
+    # cpu.stat, e.g. usage_usec, user_usec, system_usec
+    cpu: dict = field(default_factory=dict)
+    # io.stat per device ("8:0"), e.g. rbytes, wbytes, rios, wios
+    io: dict = field(default_factory=dict)
+
+    @property
+    def cpu_usage_usec(self) -> int:
+        return self.cpu.get("usage_usec", 0)
+
+    @property
+    def io_read_bytes(self) -> int:
+        return sum(device.get("rbytes", 0) for device in self.io.values())
+
+    @property
+    def io_write_bytes(self) -> int:
+        return sum(device.get("wbytes", 0) for device in self.io.values())
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text()
+    except (FileNotFoundError, PermissionError):
+        return None
+
+
+def _pairs(text: str) -> dict[str, int]:
+    values = {}
+    for item in text.split():
+        key, _, value = item.partition("=")
+        if value.isdigit():
+            values[key] = int(value)
+    return values
+
+
+def read_cgroup(path: Path) -> Optional[CgroupStats]:
+    # None when the group does not exist, e.g. the unit is not running
+    if not path.is_dir():
+        return None
+    memory = _read(path.joinpath("memory.current"))
+    cpu = {}
+    for line in (_read(path.joinpath("cpu.stat")) or "").splitlines():
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            cpu[key] = int(value)
+    io = {}
+    for line in (_read(path.joinpath("io.stat")) or "").splitlines():
+        device, _, rest = line.partition(" ")
+        if device:
+            io[device] = _pairs(rest)
+    return CgroupStats(path, int(memory) if memory and memory.strip().isdigit() else None, cpu, io)
+
+
+def slice_cgroup(backend: Type[SystemdUserInstaller] = SystemdSystemInstaller,
+                 cgroup_root: Path = CGROUP_ROOT) -> Optional[Path]:
+    # The slice's group below the (system or calling user's) service manager;
+    # None when the backend leaves units in the manager's default slice
+    if not backend.slice_name:
+        return None
+    base = cgroup_root
+    if not issubclass(backend, SystemdSystemInstaller):
+        uid = detect.euid()
+        base = cgroup_root.joinpath("user.slice", f"user-{uid}.slice", f"user@{uid}.service")
+    # Slice names nest on dashes: a-b.slice lives inside a.slice
+    parts = backend.slice_name[:-len(".slice")].split("-")
+    for i in range(len(parts)):
+        base = base.joinpath("-".join(parts[:i + 1]) + ".slice")
+    return base
+
+
+def stats(backend: Type[SystemdUserInstaller] = SystemdSystemInstaller, cgroup_root: Path = CGROUP_ROOT,
+          root: Optional[Path] = None) -> Optional[dict[str, CgroupStats]]:
+    # Usage of every running onboot unit and of the slice as a whole, keyed by
+    # unit name; None for a backend without a slice of its own
+    from onboot.discovery import scan
+    group = slice_cgroup(backend, cgroup_root)
+    if group is None:
+        return None
+    results = {}
+    for entry in scan(backend, root):
+        unit = entry.path.name
+        found = read_cgroup(group.joinpath(unit))
+        if found is not None:
+            results[unit] = found
+    total = read_cgroup(group)
+    if total is not None:
+        results[backend.slice_name] = total
+    return results
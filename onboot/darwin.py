@@ -1,129 +1,136 @@
 from pathlib import Path
-from subprocess import check_output
 
-from onboot import Installer
+from onboot import Installer, templates
+from onboot.aio import arun, offload
+from onboot.blocks import BlockFileInstaller
+from onboot.runner import run
+
+
+async def aload(installer: Installer) -> bool:
+    # The install() of the launchd installers for an event loop: launchctl runs on the loop
+    try:
+        plist_path = installer.get_autostart_path()
+        await offload(installer.write_autostart_file, installer.generate_plist())
+        await arun(["launchctl", "load", "-w", str(plist_path)])
+        return True
+    except (OSError, IOError, PermissionError, FileNotFoundError):
+        return False
+
+
+async def aunload(installer: Installer) -> bool:
+    try:
+        plist_path = installer.get_autostart_path()
+        if await offload(plist_path.is_file):
+            await arun(["launchctl", "unload", str(plist_path)])
+            await offload(plist_path.unlink)
+            return True
+        return False
+    except (OSError, IOError, PermissionError, FileNotFoundError):
+        return False
 
 
 class PListInstaller(Installer):
     autostart_directory = Path("~/Library/LaunchAgents/")
+    per_user = True
 
     def generate_plist(self):
-        return f'''
-<key>{self.config.name}</key>
-<array>
-    <string>{self.config.get_path()}</string>
-</array>
-        '''
+        return templates.PLIST.render({"label": f"io.{self.config.name}.service", "path": self.config.get_path()})
+
+    def render(self) -> str:
+        return self.generate_plist()
 
     def get_autostart_path(self) -> Path:
-        return Path(f"~/Library/LaunchAgents/io.{self.config.name}.service.plist")
+        return self.resolve(Path(f"~/Library/LaunchAgents/io.{self.config.name}.service.plist"))
+
+    def plan(self, plan) -> None:
+        plan.add_file(self.get_autostart_path(), self.generate_plist(), self.file_mode)
+        plan.add_command(["launchctl", "load", "-w", str(self.get_autostart_path())])
 
     def install(self) -> bool:
         try:
-            self.get_autostart_path().write_text(self.generate_plist())
-            check_output(f"launchctl load -w {self.get_autostart_path()}")
+            plist_path = self.get_autostart_path()
+            self.write_autostart_file(self.generate_plist())
+            run(["launchctl", "load", "-w", str(plist_path)])
             return True
-        except (OSError, IOError, PermissionError, FileNotFoundError) as e:
+        except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
         try:
-            if self.get_autostart_path().is_file():
-                check_output(f"launchctl unload {self.get_autostart_path()}", shell=True)
-                self.get_autostart_path().unlink()
+            plist_path = self.get_autostart_path()
+            if plist_path.is_file():
+                run(["launchctl", "unload", str(plist_path)])
+                plist_path.unlink()
                 return True
             return False
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
+    async def _ainstall(self) -> bool:
+        return await aload(self)
+
+    async def _auninstall(self) -> bool:
+        return await aunload(self)
+
 
 class LaunchDaemonInstaller(Installer):
     autostart_directory = Path("/Library/LaunchDaemons/")
 
     def generate_plist(self):
-        return f'''<?xml version="1.0" encoding="UTF-8"?>
-<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
-<plist version="1.0">
-<dict>
-    <key>Label</key>
-    <string>io.{self.config.name}.daemon</string>
-    <key>ProgramArguments</key>
-    <array>
-        <string>{self.config.get_path()}</string>
-    </array>
-    <key>RunAtLoad</key>
-    <true/>
-    <key>KeepAlive</key>
-    <false/>
-</dict>
-</plist>
-'''
+        return templates.PLIST.render({"label": f"io.{self.config.name}.daemon", "path": self.config.get_path()})
+
+    def render(self) -> str:
+        return self.generate_plist()
 
     def get_autostart_path(self) -> Path:
-        return self.autostart_directory.joinpath(f"io.{self.config.name}.daemon.plist")
+        return self.get_autostart_directory().joinpath(f"io.{self.config.name}.daemon.plist")
+
+    def plan(self, plan) -> None:
+        plan.add_file(self.get_autostart_path(), self.generate_plist(), self.file_mode)
+        plan.add_command(["launchctl", "load", "-w", str(self.get_autostart_path())])
 
     def install(self) -> bool:
         try:
-            self.get_autostart_path().write_text(self.generate_plist())
-            check_output(f"launchctl load -w {self.get_autostart_path()}", shell=True)
+            plist_path = self.get_autostart_path()
+            self.write_autostart_file(self.generate_plist())
+            run(["launchctl", "load", "-w", str(plist_path)])
             return True
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
         try:
-            if self.get_autostart_path().is_file():
-                check_output(f"launchctl unload {self.get_autostart_path()}", shell=True)
-                self.get_autostart_path().unlink()
+            plist_path = self.get_autostart_path()
+            if plist_path.is_file():
+                run(["launchctl", "unload", str(plist_path)])
+                plist_path.unlink()
                 return True
             return False
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
+    async def _ainstall(self) -> bool:
+        return await aload(self)
+
+    async def _auninstall(self) -> bool:
+        return await aunload(self)
+
     def is_supported(self) -> bool:
         return self.is_root() and self.autostart_directory.is_dir()
 
 
-class ProfileInstaller(Installer):
+class ProfileInstaller(BlockFileInstaller):
     autostart_directory = Path("/etc/")
 
     def get_autostart_path(self) -> Path:
-        return self.autostart_directory.joinpath("profile")
-
-    def install(self) -> bool:
-        try:
-            profile_path = self.get_autostart_path()
-            command = f"\n# {self.config.name} autostart\n{self.config.get_path()} &\n"
-            
-            # Append to /etc/profile
-            with open(profile_path, 'a') as f:
-                f.write(command)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
-
-    def uninstall(self) -> bool:
-        try:
-            profile_path = self.get_autostart_path()
-            if not profile_path.is_file():
-                return False
-            
-            # Read current content
-            content = profile_path.read_text()
-            
-            # Remove our entry
-            command = f"\n# {self.config.name} autostart\n{self.config.get_path()} &\n"
-            new_content = content.replace(command, "")
-            
-            # Write back
-            profile_path.write_text(new_content)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+        return self.get_autostart_directory().joinpath("profile")
 
     def is_supported(self) -> bool:
         return self.is_root() and self.get_autostart_path().exists()
 
+    def probe_paths(self) -> list[Path]:
+        return [self.get_autostart_path()]
+
 
 # TODO: Implement LoginItemsInstaller for System Preferences > Users & Groups > Login Items
 # TODO: Implement LoginHookInstaller for /var/root/Library/Preferences/com.apple.loginwindow
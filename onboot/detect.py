@@ -0,0 +1,54 @@
+from functools import lru_cache
+from os import environ
+from pathlib import Path
+
+
+@lru_cache(maxsize=None)
+def euid() -> int:
+    try:
+        from os import geteuid
+    except ImportError:
+        return -1
+    return geteuid()
+
+
+@lru_cache(maxsize=None)
+def is_root() -> bool:
+    if euid() >= 0:
+        return euid() == 0
+    import ctypes
+    return ctypes.windll.shell32.IsUserAnAdmin() != 0
+
+
+@lru_cache(maxsize=None)
+def init_name() -> str:
+    try:
+        return Path("/proc/1/comm").read_text().strip()
+    except OSError:
+        return ""
+
+
+@lru_cache(maxsize=None)
+def has_systemd() -> bool:
+    # Same test as sd_booted(3): the directory only exists if systemd is PID 1
+    return Path("/run/systemd/system").is_dir() or init_name() == "systemd"
+
+
+@lru_cache(maxsize=None)
+def desktops() -> tuple:
+    return tuple(d.lower() for d in environ.get("XDG_CURRENT_DESKTOP", "").split(":") if d)
+
+
+@lru_cache(maxsize=None)
+def which(command: str):
+    from shutil import which as _which
+    return _which(command)
+
+
+def has_command(command: str) -> bool:
+    return which(command) is not None
+
+
+def clear():
+    for f in (euid, is_root, init_name, has_systemd, desktops, which):
+        f.cache_clear()
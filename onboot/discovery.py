@@ -0,0 +1,134 @@
+from dataclasses import dataclass, field
+from os import scandir
+from pathlib import Path
+from typing import Iterator, Optional, Type
+
+from onboot import Installer, MARKER, detect, resolve_path
+from onboot.linux import XDGInstaller, KDEPlasmaInstaller, ProfileInstaller, InitInstaller, SystemdUserInstaller, \
+    SystemdSystemInstaller, RcLocalInstaller, BashrcInstaller, CrontabInstaller, CrontabTransaction, \
+    split_schedule
+
+
+@dataclass(frozen=True)
+class InstalledEntry:
+    backend: str
+    name: str
+    path: Path
+    command: str
+    # The entry's whole line in a shared file (crontab, rc files), schedule and wrappers included
+    line: str = field(default="", compare=False)
+
+
+def _command(line: str) -> Optional[str]:
+    for key in ("Exec=", "ExecStart="):
+        if line.startswith(key):
+            return line[len(key):]
+    if line and not line.startswith(("#", "[")) and "=" not in line:
+        return line
+    return None
+
+
+def _parse_file(path: str) -> Optional[tuple]:
+    name = command = None
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if name is None and line.startswith(MARKER):
+                    name = line[len(MARKER):]
+                elif name is not None and command is None:
+                    command = _command(line)
+                if name is not None and command is not None:
+                    break
+    except (OSError, UnicodeDecodeError):
+        return None
+    if name is None:
+        return None
+    return name, command or ""
+
+
+def scan_directory(backend: str, directory: Path, suffix: str = "") -> Iterator[InstalledEntry]:
+    try:
+        it = scandir(directory.expanduser())
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            if not entry.name.endswith(suffix) or not entry.is_file():
+                continue
+            parsed = _parse_file(entry.path)
+            if parsed is not None:
+                yield InstalledEntry(backend, parsed[0], Path(entry.path), parsed[1])
+
+
+def scan_rc_file(backend: str, path: Path) -> Iterator[InstalledEntry]:
+    # Entries are "# <name> autostart" followed by "<command> &"
+    path = path.expanduser()
+    try:
+        # Foreign lines in another encoding must not stop the scan
+        f = open(path, encoding="utf-8", errors="surrogateescape")
+    except OSError:
+        return
+    with f:
+        name = None
+        for line in f:
+            line = line.strip()
+            if name is not None and line:
+                yield InstalledEntry(backend, name, path, line[:-1].rstrip() if line.endswith("&") else line, line)
+                name = None
+            elif line.startswith("# ") and line.endswith(" autostart"):
+                name = line[2:-len(" autostart")]
+
+
+def scan_crontab(transaction=CrontabTransaction, marker: str = MARKER) -> Iterator[InstalledEntry]:
+    try:
+        lines = transaction().read()
+    except OSError:
+        return
+    for line in lines:
+        command, found, name = line.partition(marker)
+        if found and not command.startswith("#"):
+            yield InstalledEntry(CrontabInstaller.__name__, name.strip(), Path("crontab"),
+                                 split_schedule(command.strip())[1], line.strip())
+
+
+def scan(installer: Type[Installer], root: Optional[Path] = None) -> Iterator[InstalledEntry]:
+    backend = installer.__name__
+
+    def resolve(path: Path) -> Path:
+        return resolve_path(path, root)
+
+    if issubclass(installer, XDGInstaller):
+        yield from scan_directory(backend, resolve(installer.autostart_directory), ".desktop")
+        yield from scan_directory(backend, resolve(installer.root_autostart_directory), ".desktop")
+    elif issubclass(installer, KDEPlasmaInstaller):
+        yield from scan_directory(backend, resolve(installer.autostart_directory), ".sh")
+    elif issubclass(installer, (ProfileInstaller, InitInstaller)):
+        yield from scan_directory(backend, resolve(installer.autostart_directory))
+    elif issubclass(installer, SystemdUserInstaller):
+        yield from scan_directory(backend, resolve(installer.autostart_directory), ".service")
+    elif issubclass(installer, RcLocalInstaller):
+        yield from scan_rc_file(backend, resolve(installer.autostart_directory).joinpath("rc.local"))
+    elif issubclass(installer, BashrcInstaller):
+        yield from scan_rc_file(backend, resolve(installer.autostart_directory).joinpath(".bashrc"))
+    elif issubclass(installer, CrontabInstaller):
+        if root is not None or detect.has_command("crontab"):
+            path = Path("crontab") if root is None else resolve(installer.spool_directory).joinpath(installer.spool_user)
+            for entry in scan_crontab(lambda: installer.open_transaction(root), installer.transaction.marker):
+                yield InstalledEntry(backend, entry.name, path, entry.command, entry.line)
+    else:
+        raise NotImplementedError(f"Discovery is not implemented for {backend}.")
+
+
+BACKENDS = [
+    XDGInstaller, KDEPlasmaInstaller, ProfileInstaller, InitInstaller, SystemdUserInstaller, SystemdSystemInstaller,
+    RcLocalInstaller, BashrcInstaller, CrontabInstaller,
+]
+
+
+def list_installed(crontab: bool = True, root: Optional[Path] = None) -> list[InstalledEntry]:
+    entries = []
+    for backend in BACKENDS:
+        if crontab or not issubclass(backend, CrontabInstaller):
+            entries += scan(backend, root)
+    return entries
@@ -0,0 +1,69 @@
+from os import chmod, close, fdopen, fsync as os_fsync, open as os_open, replace, stat, unlink, O_RDONLY
+from os.path import realpath
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Optional
+
+from onboot.instrument import transferred
+
+DEFAULT_MODE = 0o644
+
+
+def read_bytes(path: Path) -> Optional[bytes]:
+    try:
+        return path.read_bytes()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
+
+def fsync_directory(directory: Path):
+    try:
+        fd = os_open(directory, O_RDONLY)
+    except OSError:
+        return
+    try:
+        os_fsync(fd)
+    except OSError:
+        pass
+    finally:
+        close(fd)
+
+
+def atomic_write(path: Path, data: str, mode: Optional[int] = None, fsync: bool = True) -> bool:
+    # Returns False without touching the file when it already holds this content and mode.
+    # A symlink (/etc/rc.local -> rc.d/rc.local, dotfile managers) is written through, not replaced.
+    path = Path(realpath(path))
+    # surrogateescape gives back undecodable bytes read the same way
+    encoded = data.encode("utf-8", "surrogateescape")
+    try:
+        current_mode = stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        current_mode = None
+    if mode is None:
+        mode = DEFAULT_MODE if current_mode is None else current_mode
+    if current_mode == mode:
+        current = read_bytes(path)
+        if current is not None:
+            transferred("read", path, len(current))
+        if current == encoded:
+            return False
+
+    fd, tmp = mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with fdopen(fd, "wb") as f:
+            f.write(encoded)
+            f.flush()
+            if fsync:
+                os_fsync(f.fileno())
+        chmod(tmp, mode)
+        replace(tmp, path)
+    except BaseException:
+        try:
+            unlink(tmp)
+        except OSError:
+            pass
+        raise
+    transferred("write", path, len(encoded))
+    if fsync:
+        fsync_directory(path.parent)
+    return True
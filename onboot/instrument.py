@@ -0,0 +1,144 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from threading import Lock
+from time import perf_counter
+from typing import Awaitable, Callable, Iterator, Optional
+
+# Recorders currently listening; module-wide so probe worker threads report too
+_recorders: list = []
+# (installer, name) of the installer call in progress; subprocess, read and write events are tagged with it
+_current: ContextVar[Optional[tuple]] = ContextVar("onboot_instrument_current", default=None)
+
+
+@dataclass(frozen=True)
+class Event:
+    # probe, install, uninstall, skip, subprocess, read or write
+    kind: str
+    installer: Optional[str] = None
+    name: Optional[str] = None
+    duration: float = 0.0
+    ok: Optional[bool] = None
+    argv: Optional[tuple] = None
+    bytes: int = 0
+    path: Optional[str] = None
+    reason: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {key: value for key, value in asdict(self).items() if value is not None}
+
+
+class Recorder:
+    def __init__(self, callback: Optional[Callable[[Event], None]] = None, keep: bool = True):
+        self.callback = callback
+        self.keep = keep
+        self.events: list[Event] = []
+        self._lock = Lock()
+
+    def __enter__(self) -> "Recorder":
+        _recorders.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _recorders.remove(self)
+
+    def record(self, event: Event):
+        if self.keep:
+            with self._lock:
+                self.events.append(event)
+        if self.callback is not None:
+            self.callback(event)
+
+    def counters(self) -> dict[str, float]:
+        # Aggregates events into flat "<kind>.<field>" counters, per installer where known
+        counters = Counter()
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            prefixes = [event.kind] if event.installer is None else [event.kind, f"{event.installer}.{event.kind}"]
+            for prefix in prefixes:
+                counters[f"{prefix}.count"] += 1
+                counters[f"{prefix}.seconds"] += event.duration
+                if event.bytes:
+                    counters[f"{prefix}.bytes"] += event.bytes
+            if event.reason is not None:
+                counters[f"skip.{event.reason}"] += 1
+        return dict(counters)
+
+
+def active() -> bool:
+    return bool(_recorders)
+
+
+def emit(kind: str, **fields):
+    if not _recorders:
+        return
+    current = _current.get()
+    if current is not None and "installer" not in fields:
+        fields["installer"], fields["name"] = current
+    event = Event(kind, **fields)
+    for recorder in list(_recorders):
+        recorder.record(event)
+
+
+def installer_name(installer) -> str:
+    cls = type(installer)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def call(kind: str, installer, method: Callable[[], bool]) -> bool:
+    # Runs one installer method, timing it when anyone is listening
+    if not _recorders:
+        return method()
+    current = (installer_name(installer), installer.config.name)
+    token = _current.set(current)
+    start = perf_counter()
+    ok = None
+    try:
+        ok = method()
+        return ok
+    finally:
+        _current.reset(token)
+        emit(kind, installer=current[0], name=current[1], duration=perf_counter() - start, ok=ok)
+
+
+async def acall(kind: str, installer, method: Callable[[], Awaitable[bool]]) -> bool:
+    # call() for a coroutine method
+    if not _recorders:
+        return await method()
+    current = (installer_name(installer), installer.config.name)
+    token = _current.set(current)
+    start = perf_counter()
+    ok = None
+    try:
+        ok = await method()
+        return ok
+    finally:
+        _current.reset(token)
+        emit(kind, installer=current[0], name=current[1], duration=perf_counter() - start, ok=ok)
+
+
+def skip(installer, reason: str):
+    if _recorders:
+        emit("skip", installer=installer_name(installer), name=installer.config.name, reason=reason)
+
+
+@contextmanager
+def spawned(argv) -> Iterator[None]:
+    if not _recorders:
+        yield
+        return
+    start = perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        argv = (argv,) if isinstance(argv, str) else tuple(str(arg) for arg in argv)
+        emit("subprocess", argv=argv, duration=perf_counter() - start, ok=ok)
+
+
+def transferred(kind: str, path, size: int):
+    if _recorders:
+        emit(kind, path=str(path), bytes=size)
@@ -1,318 +1,890 @@
+from os import readlink
 from pathlib import Path
-from subprocess import check_output
+from typing import Optional
 
-from onboot import Installer, random_str
+from onboot import Installer, InstallerConfiguration, MARKER, detect, resolve_path, templates
+from onboot.aio import alocked, arun, offload
+from onboot.blocks import BlockFileInstaller
+from onboot.files import atomic_write
+from onboot.instrument import transferred
+from onboot.lock import locked
+from onboot.options import staggered
+from onboot.runner import CommandError, run
+
+
+def split_schedule(line: str) -> tuple[str, str]:
+    # "@reboot cmd" or "*/5 * * * * cmd" -> (schedule, cmd)
+    count = 1 if line.startswith("@") else 5
+    fields = line.split(None, count)
+    return " ".join(fields[:count]), fields[count] if len(fields) > count else ""
+
+
+def shell_script(config: InstallerConfiguration) -> str:
+    if config.stagger is not None and config.stagger.delayed:
+        return templates.STAGGERED_SHELL_SCRIPT.render({"marker": config.name, "sleep": config.stagger.sleep_command(),
+                                                        "path": config.get_path()})
+    return templates.SHELL_SCRIPT.render({"marker": config.name, "path": config.get_path()})
 
 
 class XDGInstaller(Installer):
     autostart_directory = Path("~/.config/autostart/")
     root_autostart_directory = Path("/etc/xdg/autostart/")
 
+    def get_autostart_directory(self) -> Path:
+        # Image trees are provisioned system-wide, unless a user's home is given
+        if self.config.home is None and (self.is_root() or self.config.root is not None):
+            return self.resolve(self.root_autostart_directory)
+        return self.resolve(self.autostart_directory)
+
     def get_autostart_path(self) -> Path:
-        name = f"{self.config.name}.desktop"
-        if self.is_root():
-            return self.root_autostart_directory.joinpath(name)
-        return self.autostart_directory.joinpath(name)
+        return self.get_autostart_directory().joinpath(f"{self.config.name}.desktop")
 
-    def install(self) -> bool:
-        conf = "[Desktop Entry]\n" \
-               "Type=Application\n" \
-               "Name={}\n" \
-               "Exec={}\n" \
-               "Terminal=false\n".format(self.config.name, self.config.name)
+    def render(self) -> str:
+        argv = [self.config.get_path()]
+        stagger = self.config.stagger
+        if stagger is not None and stagger.delayed:
+            # X-GNOME-Autostart-Delay is ignored by KDE, XFCE and LXQt, and cannot jitter
+            argv = ["/bin/sh", "-c", f"{stagger.sleep_command()}; exec \"$0\"", argv[0]]
+        return templates.DESKTOP.render({"marker": self.config.name, "name": self.config.name, "exec": argv})
 
+    def install(self) -> bool:
         try:
-            return self.get_autostart_path().write_text(conf) == len(conf)
+            if self.config.home is not None:
+                # Accounts that never logged into a desktop have no autostart directory yet
+                self.get_autostart_directory().mkdir(parents=True, exist_ok=True)
+            return self.write_autostart_file(self.render())
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
-        if self.get_autostart_path().is_file():
-            self.get_autostart_path().unlink()
+        path = self.get_autostart_path()
+        if path.is_file():
+            path.unlink()
             return True
         return False
 
     def is_supported(self) -> bool:
-        if self.is_root():
-            return self.root_autostart_directory.is_dir()
-        return self.autostart_directory.is_dir()
+        if self.config.home is not None:
+            return self.resolve(self.config.home).is_dir()
+        return super().is_supported()
+
+    def probe_paths(self) -> list[Path]:
+        return [self.resolve(self.root_autostart_directory), self.resolve(self.autostart_directory)]
+
+
+class CrontabTransaction:
+    marker = MARKER
+
+    def __init__(self, path: Optional[Path] = None):
+        # With a path the table is a spool file edited directly instead of through crontab(1)
+        self.path = path
+        self.lines: list[str] = []
+        self.original: list[str] = []
+
+    def __enter__(self) -> "CrontabTransaction":
+        self.read()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+
+    def _read_table(self) -> str:
+        if self.path is not None:
+            try:
+                text = self.path.read_bytes().decode("utf-8", "surrogateescape")
+            except FileNotFoundError:
+                return ""
+            transferred("read", self.path, len(text))
+            return text
+        try:
+            return run(["crontab", "-l"]).decode("utf-8", "surrogateescape")
+        except CommandError as e:
+            return self._no_table(e)
+
+    @staticmethod
+    def _no_table(e: CommandError) -> str:
+        # crontab -l exits non-zero when the user has no table yet
+        if e.stderr and b"no crontab" in e.stderr:
+            return ""
+        raise e
+
+    async def _aread_table(self) -> str:
+        if self.path is not None:
+            return await offload(self._read_table)
+        try:
+            return (await arun(["crontab", "-l"])).decode("utf-8", "surrogateescape")
+        except CommandError as e:
+            return self._no_table(e)
+
+    async def _awrite_table(self, text: str):
+        if self.path is not None:
+            await offload(self._write_table, text)
+            return
+        await arun(["crontab", "-"], input=text.encode("utf-8", "surrogateescape"))
+
+    def _write_table(self, text: str):
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.path, text, 0o600)
+            return
+        run(["crontab", "-"], input=text.encode("utf-8", "surrogateescape"))
+
+    def read(self) -> list[str]:
+        self.original = self._read_table().splitlines()
+        self.lines = list(self.original)
+        return self.lines
+
+    async def aread(self) -> list[str]:
+        self.original = (await self._aread_table()).splitlines()
+        self.lines = list(self.original)
+        return self.lines
+
+    @classmethod
+    def entry(cls, config: InstallerConfiguration) -> str:
+        # cron turns an unescaped % into a line break
+        command = templates.shell(config.get_path()).replace("%", "\\%")
+        if config.stagger is not None and config.stagger.delayed:
+            sleep = config.stagger.sleep_command().replace("%", "\\%")
+            command = f"{sleep}; {command}"
+        schedule = "@reboot" if config.schedule is None else config.schedule.cron_expression()
+        return f"{schedule} {command} {cls.marker}{config.name}"
+
+    def _matches(self, line: str, config: InstallerConfiguration) -> bool:
+        line = line.strip()
+        if line == f"@reboot {config.get_path()}":
+            return True
+        return not line.startswith("#") and line.endswith(f"{self.marker}{config.name}")
+
+    def contains(self, config: InstallerConfiguration) -> bool:
+        return self.entry(config) in self.lines
+
+    def add(self, config: InstallerConfiguration) -> bool:
+        if self.contains(config):
+            return False
+        self.remove(config)
+        self.lines.append(self.entry(config))
+        return True
+
+    def remove(self, config: InstallerConfiguration) -> bool:
+        lines = [line for line in self.lines if not self._matches(line, config)]
+        removed = len(lines) != len(self.lines)
+        self.lines = lines
+        return removed
+
+    def is_dirty(self) -> bool:
+        return self.lines != self.original
+
+    def commit(self) -> bool:
+        if not self.is_dirty():
+            return False
+        self._write_table("".join(f"{line}\n" for line in self.lines))
+        self.original = list(self.lines)
+        return True
+
+    async def acommit(self) -> bool:
+        if not self.is_dirty():
+            return False
+        await self._awrite_table("".join(f"{line}\n" for line in self.lines))
+        self.original = list(self.lines)
+        return True
 
 
 class CrontabInstaller(Installer):
+    transaction = CrontabTransaction
+    shared_target = True
+    schedules = True
+    # Used instead of crontab(1) when the configuration has an alternate root
+    spool_directory = Path("/var/spool/cron/crontabs/")
+    spool_user = "root"
+
+    def get_target(self) -> str:
+        if self.config.root is not None:
+            return str(self.get_spool_path())
+        return "crontab"
+
+    def get_spool_path(self) -> Path:
+        return self.resolve(self.spool_directory).joinpath(self.spool_user)
+
+    def get_entry(self) -> str:
+        return self.transaction.entry(self.config)
+
+    @classmethod
+    def lock_resource(cls, root: Optional[Path] = None) -> str:
+        if root is None:
+            return f"crontab:{detect.euid()}"
+        return str(resolve_path(cls.spool_directory, root).joinpath(cls.spool_user).absolute())
+
+    @classmethod
+    def open_transaction(cls, root: Optional[Path] = None) -> CrontabTransaction:
+        if root is None:
+            return cls.transaction()
+        return cls.transaction(resolve_path(cls.spool_directory, root).joinpath(cls.spool_user))
+
     def install(self) -> bool:
-        try:
-            fp = Path("/tmp").joinpath(random_str())
-            fp.write_text(f"@reboot {self.config.get_path()}\n")
-            check_output(f"crontab {fp}", shell=True)
-            fp.unlink()
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+        return self.install_many([self.config])[self.config.name]
 
     def uninstall(self) -> bool:
-        ct = check_output("crontab -l", shell=True)
-        ct = ct.replace(f"@reboot {self.config.get_path()}".encode("utf-8"), b"")
+        return self.uninstall_many([self.config])[self.config.name]
+
+    @classmethod
+    def install_many(cls, configs: list[InstallerConfiguration]) -> dict[str, bool]:
+        return cls.apply_many(configs, [])
+
+    @classmethod
+    def uninstall_many(cls, configs: list[InstallerConfiguration]) -> dict[str, bool]:
+        return cls.apply_many([], configs)
+
+    @classmethod
+    def apply_many(cls, install: list[InstallerConfiguration],
+                   uninstall: list[InstallerConfiguration]) -> dict[str, bool]:
+        # All configurations of one call are expected to share the same root
+        install, rejected = cls._accepted(install)
+        root = next((config.root for config in uninstall + install), None)
         try:
-            fp = Path("/tmp").joinpath(random_str())
-            fp.write_text(ct.decode("utf-8"))
-            check_output(f"crontab {fp}")
-            return True
+            with locked(cls.lock_resource(root), cls.lock_timeout), cls.open_transaction(root) as ct:
+                cls._edit(ct, install, uninstall)
+            ok = True
         except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+            ok = False
+        return cls._results(install, uninstall, rejected, ok)
+
+    @classmethod
+    async def aapply_many(cls, install: list[InstallerConfiguration],
+                          uninstall: list[InstallerConfiguration]) -> dict[str, bool]:
+        # apply_many() for an event loop: crontab(1) runs on the loop
+        install, rejected = cls._accepted(install)
+        root = next((config.root for config in uninstall + install), None)
+        try:
+            async with alocked(cls.lock_resource(root), cls.lock_timeout):
+                ct = cls.open_transaction(root)
+                await ct.aread()
+                cls._edit(ct, install, uninstall)
+                await ct.acommit()
+            ok = True
+        except (OSError, IOError, PermissionError, FileNotFoundError):
+            ok = False
+        return cls._results(install, uninstall, rejected, ok)
+
+    async def _ainstall(self) -> bool:
+        return (await self.aapply_many([self.config], []))[self.config.name]
+
+    async def _auninstall(self) -> bool:
+        return (await self.aapply_many([], [self.config]))[self.config.name]
+
+    @classmethod
+    def _accepted(cls, configs: list[InstallerConfiguration]) -> tuple:
+        # Returns (configurations to install, ones this backend cannot express)
+        configs = list(staggered(configs))
+        rejected = [config for config in configs if not cls(config).accepts()]
+        return [config for config in configs if config not in rejected], rejected
+
+    @staticmethod
+    def _edit(ct: CrontabTransaction, install: list[InstallerConfiguration],
+              uninstall: list[InstallerConfiguration]):
+        for config in uninstall:
+            ct.remove(config)
+        for config in install:
+            ct.add(config)
+
+    @staticmethod
+    def _results(install: list[InstallerConfiguration], uninstall: list[InstallerConfiguration],
+                 rejected: list[InstallerConfiguration], ok: bool) -> dict[str, bool]:
+        results = {config.name: ok for config in uninstall + install}
+        results.update((config.name, False) for config in rejected)
+        return results
+
+    def accepts(self) -> bool:
+        # cron cannot express every interval or calendar
+        if self.config.schedule is not None:
+            try:
+                self.config.schedule.cron_expression()
+            except ValueError:
+                return False
+        return super().accepts()
 
     def is_supported(self) -> bool:
-        return True
+        if self.config.root is not None:
+            return self.resolve(self.spool_directory).parent.is_dir()
+        return detect.has_command("crontab")
 
 
 class ProfileInstaller(Installer):
     autostart_directory = Path("/etc/profile.d/")
 
+    def render(self) -> str:
+        return shell_script(self.config)
+
     def install(self) -> bool:
         try:
-            text = f"#!/bin/sh\n{self.config.get_path()}"
-            return self.get_autostart_path().write_text(text) == len(text)
+            return self.write_autostart_file(self.render())
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
-        if self.get_autostart_path().is_file():
-            self.get_autostart_path().unlink()
+        path = self.get_autostart_path()
+        if path.is_file():
+            path.unlink()
             return True
         return False
 
 
 class KDEPlasmaInstaller(Installer):
     autostart_directory = Path("~/.config/autostart-scripts/")
+    per_user = True
+    file_mode = 0o755
 
     def get_autostart_path(self):
-        return self.autostart_directory.joinpath(f"{self.config.name}.sh")
+        return self.get_autostart_directory().joinpath(f"{self.config.name}.sh")
+
+    def render(self) -> str:
+        return shell_script(self.config)
 
     def install(self) -> bool:
         try:
-            text = f"#!/bin/sh\n{self.config.get_path()}"
-            return self.get_autostart_path().write_text(text) == len(text)
+            return self.write_autostart_file(self.render())
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
-        if self.get_autostart_path().is_file():
-            self.get_autostart_path().unlink()
+        path = self.get_autostart_path()
+        if path.is_file():
+            path.unlink()
             return True
         return False
 
 
 class InitInstaller(Installer):
     autostart_directory = Path("/etc/init.d/")
+    file_mode = 0o755
+
+    def render(self) -> str:
+        return shell_script(self.config)
 
     def install(self) -> bool:
         try:
-            text = f"#!/bin/sh\n{self.config.get_path()}"
-            return self.get_autostart_path().write_text(text) == len(text)
+            return self.write_autostart_file(self.render())
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
-        if self.get_autostart_path().is_file():
-            self.get_autostart_path().unlink()
+        path = self.get_autostart_path()
+        if path.is_file():
+            path.unlink()
             return True
         return False
 
 
+def parse_install_section(unit: str) -> dict[str, list[str]]:
+    section = None
+    install: dict[str, list[str]] = {}
+    for line in unit.splitlines():
+        line = line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+        elif section == "Install" and "=" in line:
+            key, _, value = line.partition("=")
+            install.setdefault(key.strip(), []).extend(value.split())
+    return install
+
+
+def install_links(path: Path, unit: str) -> list[Path]:
+    # The symlinks 'systemctl enable' would create for the unit file at path
+    install = parse_install_section(unit)
+    links = []
+    for key, suffix in (("WantedBy", ".wants"), ("RequiredBy", ".requires"), ("UpheldBy", ".upholds")):
+        for target in install.get(key, []):
+            links.append(path.parent.joinpath(f"{target}{suffix}", path.name))
+    for alias in install.get("Alias", []):
+        links.append(path.parent.joinpath(alias))
+    return links
+
+
+def remove_links(links: list[Path]) -> bool:
+    # Returns whether anything was removed
+    removed = False
+    for link in links:
+        if link.is_symlink():
+            link.unlink()
+            removed = True
+            try:
+                link.parent.rmdir()
+            except OSError:
+                pass
+    return removed
+
+
 class SystemdUserInstaller(Installer):
     autostart_directory = Path("~/.config/systemd/user/")
+    systemctl = ["systemctl", "--user"]
+    per_user = True
+    # Manage the [Install] symlinks directly instead of asking a running systemd
+    offline = False
+    # Every generated unit runs in this slice (None: the manager's default);
+    # config.slice_limits caps all of them together
+    slice_name: Optional[str] = "onboot.slice"
+    # Suffixes of the units that can start a service on demand (config.activation)
+    # or after a delay or periodically (config.stagger, config.schedule)
+    trigger_suffixes = (".socket", ".path", ".timer")
+    # Timer setting a staggered start or an interval counts from
+    startup_timer = "OnStartupSec"
+    schedules = True
 
     def get_autostart_path(self) -> Path:
-        return self.autostart_directory.expanduser().joinpath(f"{self.config.name}.service")
+        return self.get_autostart_directory().joinpath(f"{self.config.name}.service")
+
+    def is_offline(self) -> bool:
+        # A foreign root has no running systemd to talk to, nor can we reach
+        # another user's manager
+        return self.offline or self.config.root is not None or self.config.home is not None
+
+    def unit_sections(self) -> dict[str, list[str]]:
+        # Escaped "Key=value" lines added to the [Unit], [Service] and [Install] sections
+        service = [f"Slice={self.slice_name}"] if self.slice_name else []
+        if self.config.resources is not None:
+            service += self.config.resources.directives()
+        # An activated service is pulled in by its trigger rather than at boot
+        install = [] if self.get_trigger() is not None else ["WantedBy=default.target"]
+        return {"unit": [], "service": service, "install": install}
 
     def generate_service(self) -> str:
-        return f"""[Unit]
-Description={self.config.name} service
-After=default.target
+        return templates.SERVICE.render({"marker": self.config.name, "description": f"{self.config.name} service",
+                                         "exec": [self.config.get_path()], **self.unit_sections()})
+
+    def render(self) -> str:
+        return self.generate_service()
+
+    def get_slice_path(self) -> Optional[Path]:
+        # The slice unit is only written when there are limits to put in it
+        if not self.slice_name or self.config.slice_limits is None:
+            return None
+        return self.get_autostart_directory().joinpath(self.slice_name)
+
+    def render_slice(self) -> str:
+        return templates.SLICE.render({"marker": self.slice_name, "description": "Autostarted by onboot",
+                                       "slice": self.config.slice_limits.directives()})
+
+    def get_trigger(self):
+        # The activation whose unit starts the service, if it is not started at boot
+        if self.config.activation is not None:
+            return self.config.activation
+        if self.config.schedule is not None:
+            # A periodic run is spread by the jitter only; the delay is for boot
+            jitter = self.config.stagger.jitter if self.config.stagger is not None else 0
+            return self.config.schedule.timer(self.startup_timer, jitter)
+        if self.config.stagger is not None and self.config.stagger.delayed:
+            return self.config.stagger.timer(self.startup_timer)
+        return None
+
+    def get_trigger_path(self) -> Optional[Path]:
+        trigger = self.get_trigger()
+        if trigger is None:
+            return None
+        return self.get_autostart_directory().joinpath(f"{self.config.name}{trigger.suffix}")
+
+    def render_trigger(self) -> str:
+        activation = self.get_trigger()
+        return templates.TRIGGER.render({"marker": self.config.name, "description": f"{self.config.name} activation",
+                                         "section": activation.section, "trigger": activation.directives(),
+                                         "install": [f"WantedBy={activation.target}"]})
+
+    def get_enable_path(self) -> Path:
+        # The unit that is enabled: the trigger if there is one, else the service
+        return self.get_trigger_path() or self.get_autostart_path()
+
+    def get_unit_name(self) -> str:
+        return self.get_enable_path().name
+
+    def get_unit_names(self) -> list[str]:
+        # Every unit of this entry that exists, the service last so that
+        # 'disable --now' stops its triggers before it
+        names = [path.name for path in self.get_stale_triggers()]
+        trigger = self.get_trigger_path()
+        if trigger is not None and trigger.is_file():
+            names.append(trigger.name)
+        return names + [f"{self.config.name}.service"]
+
+    def expected_triggers(self) -> dict[Path, Optional[str]]:
+        # Every trigger unit this entry could have and its content; None where it must not exist
+        expected = {self.get_autostart_directory().joinpath(f"{self.config.name}{suffix}"): None
+                    for suffix in self.trigger_suffixes}
+        if self.get_trigger_path() is not None:
+            expected[self.get_trigger_path()] = self.render_trigger()
+        return expected
+
+    def get_stale_triggers(self) -> list[Path]:
+        # Trigger units left from an earlier install with another (or no) activation
+        current = self.get_trigger_path()
+        paths = (self.get_autostart_directory().joinpath(f"{self.config.name}{suffix}")
+                 for suffix in self.trigger_suffixes)
+        return [path for path in paths if path != current and path.is_file()]
+
+    def get_install_links(self) -> list[Path]:
+        # The symlinks 'systemctl enable' would create for this unit
+        path = self.get_enable_path()
+        return install_links(path, self.render_trigger() if path != self.get_autostart_path() else self.render())
+
+    def is_enabled(self) -> bool:
+        links = self.get_install_links()
+        return bool(links) and all(link.is_symlink() for link in links)
+
+    def enable_offline(self) -> bool:
+        target = self.in_root(self.get_enable_path())
+        for link in self.get_install_links():
+            if link.is_symlink():
+                if readlink(link) == str(target):
+                    continue
+                link.unlink()
+            link.parent.mkdir(parents=True, exist_ok=True)
+            link.symlink_to(target)
+        return True
 
-[Service]
-Type=simple
-ExecStart={self.config.get_path()}
-Restart=on-failure
+    def plan(self, plan) -> None:
+        super().plan(plan)
+        if self.get_slice_path() is not None:
+            plan.add_file(self.get_slice_path(), self.render_slice(), self.file_mode)
+        if self.get_trigger_path() is not None:
+            plan.add_file(self.get_trigger_path(), self.render_trigger(), self.file_mode)
+        target = self.in_root(self.get_enable_path())
+        for link in self.get_install_links():
+            plan.add_symlink(link, str(target))
+
+    def disable_offline(self) -> bool:
+        remove_links(self.get_install_links())
+        # Also the links of the installed files, which may predate the current configuration
+        for name in self.get_unit_names():
+            path = self.get_autostart_directory().joinpath(name)
+            if path.is_file():
+                remove_links(install_links(path, path.read_text()))
+        return True
 
-[Install]
-WantedBy=default.target
-"""
+    def remove_stale_triggers(self) -> bool:
+        # Switching activation (or dropping it) leaves the old trigger enabled
+        # otherwise; returns whether anything was removed
+        removed = False
+        for path in self.get_stale_triggers():
+            remove_links(install_links(path, path.read_text()))
+            path.unlink()
+            removed = True
+        return removed
 
     def install(self) -> bool:
-        try:
-            # Ensure directory exists
-            self.autostart_directory.expanduser().mkdir(parents=True, exist_ok=True)
-            # Write service file
-            service_path = self.get_autostart_path()
-            text = self.generate_service()
-            if service_path.write_text(text) != len(text):
-                return False
-            # Enable the service
-            check_output(f"systemctl --user enable {self.config.name}.service", shell=True)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+        return self.install_many([self.config])[self.config.name]
 
     def uninstall(self) -> bool:
+        return self.uninstall_many([self.config])[self.config.name]
+
+    @classmethod
+    def daemon_reload(cls) -> bool:
         try:
-            # Disable the service
-            check_output(f"systemctl --user disable {self.config.name}.service", shell=True)
-            # Remove service file
-            if self.get_autostart_path().is_file():
-                self.get_autostart_path().unlink()
+            run(cls.systemctl + ["daemon-reload"])
             return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
+        except OSError:
             return False
 
-    def is_supported(self) -> bool:
+    @classmethod
+    def run_systemctl(cls, verb: list[str], units: list[str]) -> set[str]:
+        # One call for every unit; only if that fails is each unit retried on
+        # its own to find out which ones are at fault. Returns the failed units.
+        if not units:
+            return set()
+        try:
+            run(cls.systemctl + verb + units)
+            return set()
+        except OSError:
+            if len(units) == 1:
+                return set(units)
+        failed = set()
+        for unit in units:
+            try:
+                run(cls.systemctl + verb + [unit])
+            except OSError:
+                failed.add(unit)
+        return failed
+
+    @classmethod
+    async def adaemon_reload(cls) -> bool:
         try:
-            # Check if systemd is available
-            check_output("systemctl --user --version", shell=True)
+            await arun(cls.systemctl + ["daemon-reload"])
             return True
-        except:
+        except OSError:
             return False
 
-
-class SystemdSystemInstaller(SystemdUserInstaller):
-    autostart_directory = Path("/etc/systemd/system/")
-
-    def get_autostart_path(self) -> Path:
-        return self.autostart_directory.joinpath(f"{self.config.name}.service")
-
-    def install(self) -> bool:
+    @classmethod
+    async def arun_systemctl(cls, verb: list[str], units: list[str]) -> set[str]:
+        if not units:
+            return set()
         try:
-            # Ensure directory exists
-            self.autostart_directory.mkdir(parents=True, exist_ok=True)
-            # Write service file
-            service_path = self.get_autostart_path()
-            text = self.generate_service()
-            if service_path.write_text(text) != len(text):
-                return False
-            # Enable the service
-            check_output(f"systemctl enable {self.config.name}.service", shell=True)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
+            await arun(cls.systemctl + verb + units)
+            return set()
+        except OSError:
+            if len(units) == 1:
+                return set(units)
+        failed = set()
+        for unit in units:
+            try:
+                await arun(cls.systemctl + verb + [unit])
+            except OSError:
+                failed.add(unit)
+        return failed
+
+    @classmethod
+    def install_many(cls, configs: list[InstallerConfiguration], now: bool = False) -> dict[str, bool]:
+        # Write every unit first, then enable them all with a single systemctl call.
+        # All configurations of one call are expected to share the same root.
+        configs = list(staggered(configs))
+        offline = bool(configs) and cls(configs[0]).is_offline()
+        if not offline:
+            cls.run_systemctl(["disable", "--now"], cls._stale_units(configs))
+        return cls._enable(*cls._write_units(configs, now), offline, now)
+
+    @classmethod
+    def uninstall_many(cls, configs: list[InstallerConfiguration], now: bool = False) -> dict[str, bool]:
+        results, removed, offline = cls._remove_units(configs, now)
+        if removed and not offline:
+            cls.daemon_reload()
+        return results
+
+    @classmethod
+    def apply_many(cls, install: list[InstallerConfiguration],
+                   uninstall: list[InstallerConfiguration]) -> dict[str, bool]:
+        # Removals and installs share one daemon-reload
+        results, removed, offline = cls._remove_units(uninstall) if uninstall else ({}, False, False)
+        install = list(staggered(install))
+        install_offline = bool(install) and cls(install[0]).is_offline()
+        if not install_offline:
+            cls.run_systemctl(["disable", "--now"], cls._stale_units(install))
+        written, enable, reload = cls._write_units(install)
+        results.update(written)
+        return cls._enable(results, enable, reload or (removed and not offline), install_offline)
+
+    @classmethod
+    async def ainstall_many(cls, configs: list[InstallerConfiguration], now: bool = False) -> dict[str, bool]:
+        # install_many() for an event loop: files are written in a worker thread,
+        # systemctl runs on the loop
+        configs = list(staggered(configs))
+        offline = bool(configs) and cls(configs[0]).is_offline()
+        if not offline:
+            await cls.arun_systemctl(["disable", "--now"], await offload(cls._stale_units, configs))
+        results, enable, reload = await offload(cls._write_units, configs, now)
+        if offline:
+            return await offload(cls._enable, results, enable, reload, offline)
+        if reload:
+            await cls.adaemon_reload()
+        verb = ["enable", "--now"] if now else ["enable"]
+        return cls._enable_results(results, enable, await cls.arun_systemctl(verb, cls._enable_units(enable)))
+
+    @classmethod
+    async def auninstall_many(cls, configs: list[InstallerConfiguration], now: bool = False) -> dict[str, bool]:
+        installers = [cls(config) for config in configs]
+        if any(installer.is_offline() for installer in installers):
+            return (await offload(cls._remove_units, configs, now))[0]
+        verb = ["disable", "--now"] if now else ["disable"]
+        units = {installer.config.name: installer.get_unit_names() for installer in installers}
+        failed = await cls.arun_systemctl(verb, [name for names in units.values() for name in names])
+        results, removed = await offload(cls._unlink_units, installers, units, failed)
+        if removed:
+            await cls.adaemon_reload()
+        return results
+
+    async def _ainstall(self) -> bool:
+        return (await self.ainstall_many([self.config]))[self.config.name]
+
+    async def _auninstall(self) -> bool:
+        return (await self.auninstall_many([self.config]))[self.config.name]
+
+    @classmethod
+    def _stale_units(cls, configs: list[InstallerConfiguration]) -> list[str]:
+        # Triggers left from an earlier activation, stopped in one call before they are removed
+        return [path.name for config in configs if cls(config).accepts() for path in cls(config).get_stale_triggers()]
+
+    @classmethod
+    def _write_units(cls, configs: list[InstallerConfiguration], now: bool = False) -> tuple:
+        # Returns (results, installers to enable, whether units systemd has loaded changed)
+        results = {}
+        enable = []
+        slices = {}
+        reload = False
+        for config in configs:
+            installer = cls(config)
+            if not installer.accepts():
+                results[config.name] = False
+                continue
+            try:
+                service_path = installer.get_autostart_path()
+                service_path.parent.mkdir(parents=True, exist_ok=True)
+                existed = service_path.is_file()
+                previous = service_path.read_text() if existed else ""
+                changed = atomic_write(service_path, installer.render(), cls.file_mode, cls.fsync)
+                # Links the old unit was enabled with that the new one no longer asks for
+                stale = set(install_links(service_path, previous)) - set(installer.get_install_links())
+                changed = remove_links(sorted(stale)) | installer.remove_stale_triggers() | changed
+                trigger_path = installer.get_trigger_path()
+                if trigger_path is not None:
+                    existed = existed or trigger_path.is_file()
+                    changed = atomic_write(trigger_path, installer.render_trigger(), cls.file_mode,
+                                           cls.fsync) or changed
+            except (OSError, IOError, PermissionError, FileNotFoundError):
+                results[config.name] = False
+                continue
+            results[config.name] = True
+            reload = reload or (existed and changed)
+            slices[installer.get_slice_path()] = installer
+            if now or not installer.is_enabled():
+                enable.append(installer)
+
+        for path, installer in slices.items():
+            if path is None:
+                continue
+            try:
+                # A slice that is already loaded only picks up new limits on reload
+                reload = atomic_write(path, installer.render_slice(), cls.file_mode, cls.fsync) or reload
+            except OSError:
+                pass
+        return results, enable, reload
+
+    @classmethod
+    def _enable(cls, results: dict[str, bool], enable: list, reload: bool, offline: bool,
+                now: bool = False) -> dict[str, bool]:
+        if offline:
+            for installer in enable:
+                try:
+                    installer.enable_offline()
+                except OSError:
+                    results[installer.config.name] = False
+            return results
+
+        if reload:
+            cls.daemon_reload()
+        verb = ["enable", "--now"] if now else ["enable"]
+        return cls._enable_results(results, enable, cls.run_systemctl(verb, cls._enable_units(enable)))
+
+    @staticmethod
+    def _enable_units(enable: list) -> list[str]:
+        return [installer.get_unit_name() for installer in enable]
+
+    @staticmethod
+    def _enable_results(results: dict[str, bool], enable: list, failed: set[str]) -> dict[str, bool]:
+        for installer in enable:
+            if installer.get_unit_name() in failed:
+                results[installer.config.name] = False
+        return results
+
+    @classmethod
+    def _remove_units(cls, configs: list[InstallerConfiguration], now: bool = False) -> tuple:
+        # Returns (results, whether a unit file was removed, offline)
+        installers = [cls(config) for config in configs]
+        verb = ["disable", "--now"] if now else ["disable"]
+        units = {installer.config.name: installer.get_unit_names() for installer in installers}
+        failed = set()
+        offline = any(installer.is_offline() for installer in installers)
+        if offline:
+            for installer in installers:
+                try:
+                    installer.disable_offline()
+                except OSError:
+                    failed.update(units[installer.config.name])
+        else:
+            failed = cls.run_systemctl(verb, [name for names in units.values() for name in names])
+        return (*cls._unlink_units(installers, units, failed), offline)
+
+    @staticmethod
+    def _unlink_units(installers: list, units: dict[str, list[str]], failed: set[str]) -> tuple:
+        # Returns (results, whether a unit file was removed)
+        results = {}
+        removed = False
+        for installer in installers:
+            if failed.intersection(units[installer.config.name]):
+                results[installer.config.name] = False
+                continue
+            try:
+                # The trigger and its service are removed together
+                for name in units[installer.config.name]:
+                    path = installer.get_autostart_directory().joinpath(name)
+                    if path.is_file():
+                        path.unlink()
+                        removed = True
+                results[installer.config.name] = True
+            except (OSError, IOError, PermissionError, FileNotFoundError):
+                results[installer.config.name] = False
+        return results, removed
+
+    def accepts(self) -> bool:
+        # A timer needs an interval or a calendar; a bare cron expression will not do
+        schedule = self.config.schedule
+        if schedule is not None and schedule.interval is None and schedule.calendar is None:
             return False
+        return super().accepts()
 
-    def uninstall(self) -> bool:
-        try:
-            # Disable the service
-            check_output(f"systemctl disable {self.config.name}.service", shell=True)
-            # Remove service file
-            if self.get_autostart_path().is_file():
-                self.get_autostart_path().unlink()
+    def is_supported(self) -> bool:
+        if self.config.home is not None:
+            return self.resolve(self.config.home).is_dir()
+        if self.config.root is not None:
+            return self.get_autostart_directory().parent.is_dir()
+        if self.offline:
             return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+        return detect.has_systemd() and detect.has_command("systemctl")
+
+    def probe_paths(self) -> list[Path]:
+        paths = [self.resolve(Path("/run/systemd/system"))]
+        if self.config.home is not None:
+            paths.append(self.resolve(self.config.home))
+        elif self.config.root is not None:
+            paths.append(self.get_autostart_directory().parent)
+        return paths
+
+
+class SystemdSystemInstaller(SystemdUserInstaller):
+    autostart_directory = Path("/etc/systemd/system/")
+    systemctl = ["systemctl"]
+    startup_timer = "OnBootSec"
+    per_user = False
 
     def is_supported(self) -> bool:
-        try:
-            # Check if systemd is available and we have root access
-            check_output("systemctl --version", shell=True)
+        if self.config.root is not None:
+            return self.get_autostart_directory().parent.is_dir()
+        if self.offline:
             return self.is_root()
-        except:
-            return False
+        return self.is_root() and detect.has_systemd() and detect.has_command("systemctl")
 
 
-class BashrcInstaller(Installer):
+class BashrcInstaller(BlockFileInstaller):
     autostart_directory = Path("~/")
+    per_user = True
+    default_content = ""
 
     def get_autostart_path(self) -> Path:
-        return self.autostart_directory.expanduser().joinpath(".bashrc")
-
-    def install(self) -> bool:
-        try:
-            bashrc_path = self.get_autostart_path()
-            command = f"\n# {self.config.name} autostart\n{self.config.get_path()} &\n"
-            
-            # Append to .bashrc
-            with open(bashrc_path, 'a') as f:
-                f.write(command)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
-
-    def uninstall(self) -> bool:
-        try:
-            bashrc_path = self.get_autostart_path()
-            if not bashrc_path.is_file():
-                return False
-            
-            # Read current content
-            content = bashrc_path.read_text()
-            
-            # Remove our entry
-            command = f"\n# {self.config.name} autostart\n{self.config.get_path()} &\n"
-            new_content = content.replace(command, "")
-            
-            # Write back
-            bashrc_path.write_text(new_content)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+        return self.get_autostart_directory().joinpath(".bashrc")
 
     def is_supported(self) -> bool:
         return self.get_autostart_path().exists()
 
+    def probe_paths(self) -> list[Path]:
+        return [self.get_autostart_path()]
 
-class RcLocalInstaller(Installer):
+
+class RcLocalInstaller(BlockFileInstaller):
     autostart_directory = Path("/etc/")
+    # Entries have to run before the script's final 'exit 0'
+    before_exit = True
+    # Versions before the managed block inserted a bare "<path> &" line
+    bare_legacy = True
+    default_content = "#!/bin/sh -e\n\nexit 0\n"
+    default_mode = 0o755
 
     def get_autostart_path(self) -> Path:
-        return self.autostart_directory.joinpath("rc.local")
-
-    def install(self) -> bool:
-        try:
-            rc_local_path = self.get_autostart_path()
-            
-            # Check if rc.local exists, create if not
-            if not rc_local_path.exists():
-                rc_local_path.write_text("#!/bin/sh -e\n\nexit 0\n")
-                rc_local_path.chmod(0o755)
-            
-            # Read current content
-            content = rc_local_path.read_text()
-            
-            # Insert our command before 'exit 0'
-            command = f"{self.config.get_path()} &\n"
-            
-            # If our command is already there, don't add it again
-            if command in content:
-                return True
-            
-            # Insert before exit 0 or at the end
-            if "exit 0" in content:
-                new_content = content.replace("exit 0", f"{command}exit 0")
-            else:
-                new_content = content + f"\n{command}"
-            
-            rc_local_path.write_text(new_content)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
-
-    def uninstall(self) -> bool:
-        try:
-            rc_local_path = self.get_autostart_path()
-            if not rc_local_path.is_file():
-                return False
-            
-            # Read current content
-            content = rc_local_path.read_text()
-            
-            # Remove our entry
-            command = f"{self.config.get_path()} &\n"
-            new_content = content.replace(command, "")
-            
-            # Write back
-            rc_local_path.write_text(new_content)
-            return True
-        except (OSError, IOError, PermissionError, FileNotFoundError):
-            return False
+        return self.get_autostart_directory().joinpath("rc.local")
 
     def is_supported(self) -> bool:
+        if self.config.root is not None:
+            return self.get_autostart_directory().is_dir()
         return self.is_root()
 
+    def probe_paths(self) -> list[Path]:
+        return []
+
 
 # TODO: Implement OpenRCInstaller for /etc/init.d/ with OpenRC-specific management
 # TODO: Implement GnomeAutostart for GNOME-specific autostart
@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from hashlib import sha1
+from os import chmod, environ, lstat, open as os_open, close, O_RDWR, O_CREAT
+from pathlib import Path
+from stat import S_ISDIR
+from tempfile import gettempdir
+from time import monotonic, sleep
+from typing import Iterator
+
+from onboot import detect
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from os import O_NOFOLLOW
+except ImportError:
+    O_NOFOLLOW = 0
+
+
+class LockTimeout(TimeoutError):
+    pass
+
+
+def lock_directory() -> Path:
+    if "ONBOOT_LOCK_DIR" in environ:
+        return Path(environ["ONBOOT_LOCK_DIR"])
+    if detect.is_root() and Path("/run/lock").is_dir():
+        return Path("/run/lock/onboot")
+    runtime = environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return Path(runtime).joinpath("onboot", "locks")
+    return Path(gettempdir()).joinpath(f"onboot-{detect.euid()}", "locks")
+
+
+def is_private(directory: Path) -> bool:
+    # Only a directory of our own that nobody else can write to is trusted: in a
+    # shared /tmp another user could create it first to plant results or symlinks
+    if detect.euid() < 0:
+        return True
+    try:
+        st = lstat(directory)
+    except OSError:
+        return False
+    return S_ISDIR(st.st_mode) and st.st_uid == detect.euid() and st.st_mode & 0o077 == 0
+
+
+def private_directory(directory: Path) -> Path:
+    # Creates directory, and the onboot* directories above it, for this user
+    # alone and refuses one that someone else planted. mkdir(parents=True) would
+    # leave the parents open, and older versions created them 0755: such a
+    # directory of ours that nobody else could write to is tightened instead.
+    parts = [directory] + [parent for parent in directory.parents if parent.name.startswith("onboot")]
+    for path in reversed(parts):
+        try:
+            path.mkdir(mode=0o700)
+        except FileExistsError:
+            if detect.euid() >= 0 and not is_private(path):
+                st = lstat(path)
+                if not S_ISDIR(st.st_mode) or st.st_uid != detect.euid() or st.st_mode & 0o022:
+                    raise PermissionError(f"{path} is not private to this user")
+                chmod(path, 0o700)
+    if not is_private(directory):
+        raise PermissionError(f"{directory} is not private to this user")
+    return directory
+
+
+def lock_path(resource: str) -> Path:
+    # Lock files live apart from the resource: it is replaced with os.replace(),
+    # so a lock on its inode would not be seen by later openers.
+    return lock_directory().joinpath(f"{sha1(resource.encode('utf-8')).hexdigest()}.lock")
+
+
+def _try_lock(fd: int) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    import msvcrt
+    try:
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        import msvcrt
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(resource: str, timeout: float = 30.0, poll: float = 0.01) -> Iterator[Path]:
+    path = lock_path(resource)
+    private_directory(path.parent)
+    fd = os_open(path, O_RDWR | O_CREAT | O_NOFOLLOW, 0o600)
+    try:
+        deadline = monotonic() + timeout
+        while not _try_lock(fd):
+            if monotonic() >= deadline:
+                raise LockTimeout(f"Timed out after {timeout}s waiting for the lock on {resource}")
+            sleep(poll)
+        try:
+            yield path
+        finally:
+            _unlock(fd)
+    finally:
+        close(fd)
+
+
+def locked_file(path: Path, timeout: float = 30.0) -> Iterator[Path]:
+    return locked(str(Path(path).absolute()), timeout)
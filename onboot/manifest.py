@@ -0,0 +1,203 @@
+import json
+from dataclasses import dataclass, asdict, field, fields
+from hashlib import sha256
+from importlib import import_module
+from os import environ, open as os_open, write, close, O_APPEND, O_CREAT, O_WRONLY, replace, getpid
+from pathlib import Path
+from time import time
+from typing import Optional, Type
+
+from onboot import Installer, InstallerConfiguration, detect
+from onboot.lock import locked_file
+
+
+def default_manifest_path() -> Path:
+    if "ONBOOT_MANIFEST" in environ:
+        return Path(environ["ONBOOT_MANIFEST"])
+    if detect.is_root():
+        return Path("/var/lib/onboot/manifest.jsonl")
+    state = environ.get("XDG_STATE_HOME") or Path("~/.local/state").expanduser()
+    return Path(state).joinpath("onboot", "manifest.jsonl")
+
+
+def content_hash(installer: Installer) -> str:
+    target = Path(installer.get_target())
+    if not installer.shared_target and target.is_file():
+        return sha256(target.read_bytes()).hexdigest()
+    # Shared targets (crontab, .bashrc, registry values) are identified by the entry itself
+    return sha256(f"{installer.get_target()}\0{installer.config.get_path()}".encode("utf-8")).hexdigest()
+
+
+# InstallerConfiguration fields holding onboot.options values
+OPTIONS = ("resources", "activation", "stagger", "schedule", "slice_limits")
+
+
+def dump_options(config: InstallerConfiguration) -> dict:
+    # {"stagger": {"type": "Stagger", "delay": 30, ...}, ...} for the options that are set
+    options = {}
+    for name in OPTIONS:
+        value = getattr(config, name, None)
+        if value is not None:
+            options[name] = {"type": type(value).__name__,
+                             **{f.name: getattr(value, f.name) for f in fields(value)}}
+    return options
+
+
+def load_options(options: dict) -> dict:
+    from onboot import options as module
+    loaded = {}
+    for name, record in options.items():
+        record = dict(record)
+        loaded[name] = getattr(module, record.pop("type"))(**record)
+    return loaded
+
+
+@dataclass
+class ManifestEntry:
+    name: str
+    installer: str
+    directory: str
+    target: str
+    hash: str
+    timestamp: float
+    # Everything else needed to rebuild the configuration; absent in older records
+    root: Optional[str] = None
+    home: Optional[str] = None
+    options: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_installer(cls, installer: Installer) -> "ManifestEntry":
+        kind = type(installer)
+        return cls(
+            name=installer.config.name,
+            installer=f"{kind.__module__}:{kind.__qualname__}",
+            directory=str(installer.config.directory),
+            target=installer.get_target(),
+            hash=content_hash(installer),
+            timestamp=time(),
+            root=None if installer.config.root is None else str(installer.config.root),
+            home=None if installer.config.home is None else str(installer.config.home),
+            options=dump_options(installer.config),
+        )
+
+    def installer_class(self) -> Type[Installer]:
+        module, _, qualname = self.installer.partition(":")
+        value = import_module(module)
+        for part in qualname.split("."):
+            value = getattr(value, part)
+        return value
+
+    def config(self) -> InstallerConfiguration:
+        return InstallerConfiguration(Path(self.directory), self.name,
+                                      root=None if self.root is None else Path(self.root),
+                                      home=None if self.home is None else Path(self.home),
+                                      **load_options(self.options))
+
+    def get_installer(self) -> Installer:
+        return self.installer_class()(self.config())
+
+    def is_present(self) -> bool:
+        target = Path(self.target)
+        return target.exists() if target.is_absolute() else True
+
+    def is_modified(self) -> bool:
+        return content_hash(self.get_installer()) != self.hash
+
+
+class Manifest:
+    # Records are appended one JSON line at a time; the newest record for a
+    # name and target wins when the file is folded back into memory. The same
+    # name can be installed once per target (per user, per root).
+    compact_threshold = 256
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or default_manifest_path()
+        # name -> target -> entry
+        self._entries: Optional[dict[str, dict[str, ManifestEntry]]] = None
+        self._records = 0
+
+    def _fold(self) -> tuple:
+        # Returns the entries on disk and the number of records they were folded from
+        entries: dict[str, dict[str, ManifestEntry]] = {}
+        records = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    records += 1
+                    if record.pop("op") == "install":
+                        entries.setdefault(record["name"], {})[record["target"]] = ManifestEntry(**record)
+                    elif "target" in record:
+                        entries.get(record["name"], {}).pop(record["target"], None)
+                    else:
+                        # Older uninstall records name no target and drop every install
+                        entries.pop(record["name"], None)
+        except FileNotFoundError:
+            pass
+        return {name: targets for name, targets in entries.items() if targets}, records
+
+    def _load(self) -> dict[str, dict[str, ManifestEntry]]:
+        if self._entries is None:
+            self._entries, self._records = self._fold()
+        return self._entries
+
+    def _count(self) -> int:
+        return sum(len(targets) for targets in self._load().values())
+
+    def _append(self, record: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The lock keeps a record from landing in a file another process is compacting
+        with locked_file(self.path):
+            fd = os_open(self.path, O_WRONLY | O_APPEND | O_CREAT, 0o644)
+            try:
+                write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+            finally:
+                close(fd)
+            self._records += 1
+            if self._records > self.compact_threshold and self._records > 2 * self._count():
+                self._compact()
+
+    def compact(self):
+        with locked_file(self.path):
+            self._compact()
+
+    def _compact(self):
+        # Other processes may have appended since _load(); fold the file again under the lock
+        self._entries, _ = self._fold()
+        entries = [entry for targets in self._entries.values() for entry in targets.values()]
+        tmp = self.path.with_name(f".{self.path.name}.{getpid()}")
+        tmp.write_text("".join(json.dumps({"op": "install", **asdict(e)}) + "\n" for e in entries))
+        replace(tmp, self.path)
+        self._records = len(entries)
+
+    def record(self, installer: Installer) -> ManifestEntry:
+        entry = ManifestEntry.from_installer(installer)
+        self._load().setdefault(entry.name, {})[entry.target] = entry
+        self._append({"op": "install", **asdict(entry)})
+        return entry
+
+    def forget(self, name: str, target: Optional[str] = None) -> bool:
+        found = self.find(name, target)
+        for entry in found:
+            targets = self._entries[name]
+            del targets[entry.target]
+            if not targets:
+                del self._entries[name]
+            self._append({"op": "uninstall", "name": entry.name, "target": entry.target})
+        return bool(found)
+
+    def find(self, name: str, target: Optional[str] = None) -> list[ManifestEntry]:
+        targets = self._load().get(name, {})
+        if target is None:
+            return list(targets.values())
+        return [targets[target]] if target in targets else []
+
+    def get(self, name: str, target: Optional[str] = None) -> Optional[ManifestEntry]:
+        # The most recently installed entry of that name when no target is given
+        return max(self.find(name, target), key=lambda entry: entry.timestamp, default=None)
+
+    def entries(self) -> list[ManifestEntry]:
+        return [entry for targets in self._load().values() for entry in targets.values()]
@@ -0,0 +1,311 @@
+import re
+from dataclasses import dataclass, field, replace
+from typing import Iterable, Iterator, Optional, Union
+
+from onboot.templates import systemd_environment, systemd_value
+
+IO_SCHEDULING_CLASSES = ("realtime", "best-effort", "idle", "none")
+
+_SIZE = re.compile(r"\d+[KMGT]?|\d+(\.\d+)?%|infinity")
+_COUNT = re.compile(r"\d+|\d+(\.\d+)?%|infinity")
+_VARIABLE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _check_range(name: str, value: Optional[int], low: int, high: int):
+    if value is not None and (isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high):
+        raise ValueError(f"{name} must be an integer from {low} to {high}, not {value!r}")
+
+
+def _check_pattern(name: str, value: Union[int, str, None], pattern: re.Pattern, minimum: int = 0):
+    if value is None:
+        return
+    if isinstance(value, int) and not isinstance(value, bool):
+        if value < minimum:
+            raise ValueError(f"{name} must be at least {minimum}, not {value!r}")
+    elif not isinstance(value, str) or pattern.fullmatch(value) is None:
+        raise ValueError(f"Invalid {name}: {value!r}")
+
+
+@dataclass(frozen=True)
+class ResourceControl:
+    # Scheduling and resource limits rendered into the [Service] section of
+    # generated systemd units; None leaves the systemd default
+    nice: Optional[int] = None
+    cpu_affinity: Optional[tuple] = None
+    cpu_weight: Union[int, str, None] = None
+    io_scheduling_class: Optional[str] = None
+    memory_max: Union[int, str, None] = None
+    tasks_max: Union[int, str, None] = None
+    oom_score_adjust: Optional[int] = None
+    environment: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        _check_range("nice", self.nice, -20, 19)
+        _check_range("oom_score_adjust", self.oom_score_adjust, -1000, 1000)
+        if self.cpu_affinity is not None:
+            object.__setattr__(self, "cpu_affinity", tuple(self.cpu_affinity))
+            if not self.cpu_affinity:
+                raise ValueError("cpu_affinity must name at least one CPU")
+            for cpu in self.cpu_affinity:
+                _check_range("cpu_affinity", cpu, 0, 8191)
+        if self.cpu_weight != "idle":
+            _check_range("cpu_weight", self.cpu_weight, 1, 10000)
+        if self.io_scheduling_class is not None and self.io_scheduling_class not in IO_SCHEDULING_CLASSES:
+            raise ValueError(f"io_scheduling_class must be one of {', '.join(IO_SCHEDULING_CLASSES)}, "
+                             f"not {self.io_scheduling_class!r}")
+        _check_pattern("memory_max", self.memory_max, _SIZE)
+        _check_pattern("tasks_max", self.tasks_max, _COUNT, 1)
+        for name, value in self.environment.items():
+            if not isinstance(name, str) or _VARIABLE.fullmatch(name) is None:
+                raise ValueError(f"Invalid environment variable name: {name!r}")
+            if "\n" in str(value) or "\0" in str(value):
+                raise ValueError(f"Environment variable {name} must not contain line breaks or NUL")
+
+    def directives(self) -> list[str]:
+        lines = []
+        if self.nice is not None:
+            lines.append(f"Nice={self.nice}")
+        if self.cpu_affinity is not None:
+            lines.append(f"CPUAffinity={' '.join(str(cpu) for cpu in self.cpu_affinity)}")
+        if self.cpu_weight is not None:
+            lines.append(f"CPUWeight={self.cpu_weight}")
+        if self.io_scheduling_class is not None:
+            lines.append(f"IOSchedulingClass={self.io_scheduling_class}")
+        if self.memory_max is not None:
+            lines.append(f"MemoryMax={systemd_value(self.memory_max)}")
+        if self.tasks_max is not None:
+            lines.append(f"TasksMax={systemd_value(self.tasks_max)}")
+        if self.oom_score_adjust is not None:
+            lines.append(f"OOMScoreAdjust={self.oom_score_adjust}")
+        for name, value in self.environment.items():
+            lines.append(f"Environment={systemd_environment(name, value)}")
+        return lines
+
+
+@dataclass(frozen=True)
+class SliceLimits:
+    # Aggregate limits of the slice every generated unit runs in
+    cpu_quota: Optional[int] = None
+    cpu_weight: Optional[int] = None
+    io_weight: Optional[int] = None
+    memory_high: Union[int, str, None] = None
+    memory_max: Union[int, str, None] = None
+    tasks_max: Union[int, str, None] = None
+
+    def __post_init__(self):
+        # CPUQuota is a percentage of one CPU, so may exceed 100
+        _check_range("cpu_quota", self.cpu_quota, 1, 100 * 8192)
+        _check_range("cpu_weight", self.cpu_weight, 1, 10000)
+        _check_range("io_weight", self.io_weight, 1, 10000)
+        _check_pattern("memory_high", self.memory_high, _SIZE)
+        _check_pattern("memory_max", self.memory_max, _SIZE)
+        _check_pattern("tasks_max", self.tasks_max, _COUNT, 1)
+
+    def directives(self) -> list[str]:
+        lines = []
+        if self.cpu_quota is not None:
+            lines.append(f"CPUQuota={self.cpu_quota}%")
+        if self.cpu_weight is not None:
+            lines.append(f"CPUWeight={self.cpu_weight}")
+        if self.io_weight is not None:
+            lines.append(f"IOWeight={self.io_weight}")
+        for key, value in (("MemoryHigh", self.memory_high), ("MemoryMax", self.memory_max),
+                           ("TasksMax", self.tasks_max)):
+            if value is not None:
+                lines.append(f"{key}={systemd_value(value)}")
+        return lines
+
+
+_ADDRESS = re.compile(r"[^\s]+")
+
+
+def _check_values(name: str, values: tuple, pattern: re.Pattern):
+    for value in values:
+        if not isinstance(value, str) or pattern.fullmatch(value) is None:
+            raise ValueError(f"Invalid {name}: {value!r}")
+
+
+@dataclass(frozen=True)
+class SocketActivation:
+    # Start the service on the first connection instead of at boot. Addresses
+    # are port numbers, "address:port" strings or socket paths; the service
+    # receives the listening sockets (sd_listen_fds) and must not bind them itself
+    listen_stream: tuple = ()
+    listen_datagram: tuple = ()
+
+    suffix = ".socket"
+    section = "Socket"
+    target = "sockets.target"
+
+    def __post_init__(self):
+        for name in ("listen_stream", "listen_datagram"):
+            values = tuple(getattr(self, name))
+            object.__setattr__(self, name, values)
+            for value in values:
+                if isinstance(value, int):
+                    _check_range(name, value, 1, 65535)
+                else:
+                    _check_values(name, (value,), _ADDRESS)
+        if not self.listen_stream and not self.listen_datagram:
+            raise ValueError("SocketActivation needs at least one address to listen on")
+
+    def directives(self) -> list[str]:
+        return [f"ListenStream={systemd_value(address)}" for address in self.listen_stream] + \
+            [f"ListenDatagram={systemd_value(address)}" for address in self.listen_datagram]
+
+
+_ABSOLUTE = re.compile(r"/[^\n]*")
+
+
+@dataclass(frozen=True)
+class PathActivation:
+    # Start the service when a path appears, changes or a directory fills up
+    path_exists: tuple = ()
+    path_exists_glob: tuple = ()
+    path_changed: tuple = ()
+    path_modified: tuple = ()
+    directory_not_empty: tuple = ()
+
+    suffix = ".path"
+    section = "Path"
+    target = "paths.target"
+
+    _KEYS = (("path_exists", "PathExists"), ("path_exists_glob", "PathExistsGlob"), ("path_changed", "PathChanged"),
+             ("path_modified", "PathModified"), ("directory_not_empty", "DirectoryNotEmpty"))
+
+    def __post_init__(self):
+        for name, _ in self._KEYS:
+            values = tuple(str(value) for value in getattr(self, name))
+            object.__setattr__(self, name, values)
+            _check_values(name, values, _ABSOLUTE)
+        if not any(getattr(self, name) for name, _ in self._KEYS):
+            raise ValueError("PathActivation needs at least one path to watch")
+
+    def directives(self) -> list[str]:
+        return [f"{key}={systemd_value(path)}" for name, key in self._KEYS for path in getattr(self, name)]
+
+
+@dataclass(frozen=True)
+class TimerActivation:
+    # Start the service from a .timer unit; lines are its escaped [Timer] settings
+    lines: tuple
+
+    suffix = ".timer"
+    section = "Timer"
+    target = "timers.target"
+
+    def directives(self) -> list[str]:
+        return list(self.lines)
+
+
+@dataclass(frozen=True)
+class Stagger:
+    # Spreads boot starts out: wait delay seconds plus a random 0..jitter more.
+    # With a concurrency cap, entries installed together that share this
+    # Stagger are scheduled in waves of that many, window seconds apart.
+    delay: int = 0
+    jitter: int = 0
+    concurrency: Optional[int] = None
+    window: int = 10
+
+    def __post_init__(self):
+        _check_range("delay", self.delay, 0, 86400)
+        _check_range("jitter", self.jitter, 0, 86400)
+        _check_range("window", self.window, 0, 86400)
+        _check_range("concurrency", self.concurrency, 1, 1 << 16)
+
+    @property
+    def delayed(self) -> bool:
+        return bool(self.delay or self.jitter)
+
+    def at(self, position: int) -> "Stagger":
+        # This Stagger for the entry at position in its batch, cap resolved into the delay
+        if self.concurrency is None:
+            return self
+        return Stagger(self.delay + position // self.concurrency * self.window, self.jitter)
+
+    def sleep_command(self) -> str:
+        # POSIX sh; /dev/urandom keeps entries started in the same second apart
+        if not self.jitter:
+            return f"sleep {self.delay}"
+        return f"sleep $(({self.delay} + $(od -An -N4 -tu4 /dev/urandom) % {self.jitter + 1}))"
+
+    def timer(self, since: str = "OnBootSec") -> TimerActivation:
+        return TimerActivation((f"{since}={self.delay}", f"RandomizedDelaySec={self.jitter}", "AccuracySec=1s"))
+
+
+def staggered(configs: Iterable) -> Iterator:
+    # Resolves concurrency caps: the n-th configuration sharing a capped
+    # Stagger gets that Stagger.at(n)
+    positions: dict[Stagger, int] = {}
+    for config in configs:
+        stagger = getattr(config, "stagger", None)
+        if stagger is None or stagger.concurrency is None:
+            yield config
+            continue
+        position = positions[stagger] = positions.get(stagger, -1) + 1
+        yield replace(config, stagger=stagger.at(position))
+
+
+# Calendar shortcuts systemd and cron both understand
+CALENDAR_SHORTCUTS = {"minutely": "* * * * *", "hourly": "@hourly", "daily": "@daily", "weekly": "@weekly",
+                      "monthly": "@monthly", "yearly": "@yearly"}
+
+_CRON = re.compile(r"@(hourly|daily|weekly|monthly|yearly|annually|midnight)|[^\s%]+( [^\s%]+){4}")
+
+
+@dataclass(frozen=True)
+class Schedule:
+    # Runs the entry periodically instead of at boot: every interval seconds
+    # and/or on a systemd calendar expression. cron only knows the shortcuts
+    # and intervals that divide an hour or a day; pass any other cron
+    # expression alongside as cron.
+    interval: Optional[int] = None
+    calendar: Optional[str] = None
+    cron: Optional[str] = None
+    # Coalescing window: systemd may postpone a run by up to this many seconds
+    # to batch it with other wakeups
+    accuracy: int = 60
+    # Catch up on calendar runs missed while the machine was off
+    persistent: bool = True
+
+    def __post_init__(self):
+        _check_range("interval", self.interval, 1, 1 << 31)
+        _check_range("accuracy", self.accuracy, 1, 86400)
+        if self.calendar is not None and (not isinstance(self.calendar, str) or not self.calendar.strip()
+                                          or "\n" in self.calendar):
+            raise ValueError(f"Invalid calendar: {self.calendar!r}")
+        if self.cron is not None and (not isinstance(self.cron, str) or _CRON.fullmatch(self.cron) is None):
+            raise ValueError(f"Invalid cron expression: {self.cron!r}")
+        if self.interval is None and self.calendar is None and self.cron is None:
+            raise ValueError("Schedule needs an interval, a calendar or a cron expression")
+
+    def timer(self, since: str = "OnBootSec", jitter: int = 0) -> TimerActivation:
+        if self.interval is None and self.calendar is None:
+            raise ValueError("systemd timers need an interval or a calendar, not only a cron expression")
+        lines = []
+        if self.interval is not None:
+            lines += [f"{since}={self.interval}", f"OnUnitActiveSec={self.interval}"]
+        if self.calendar is not None:
+            lines.append(f"OnCalendar={systemd_value(self.calendar)}")
+            if self.persistent:
+                lines.append("Persistent=true")
+        lines.append(f"AccuracySec={self.accuracy}")
+        if jitter:
+            lines.append(f"RandomizedDelaySec={jitter}")
+        return TimerActivation(tuple(lines))
+
+    def cron_expression(self) -> str:
+        if self.cron is not None:
+            return self.cron
+        if self.interval is None and self.calendar in CALENDAR_SHORTCUTS:
+            return CALENDAR_SHORTCUTS[self.calendar]
+        if self.calendar is None:
+            minutes, hours = self.interval // 60, self.interval // 3600
+            if self.interval % 60 == 0 and minutes < 60 and 60 % minutes == 0:
+                return "* * * * *" if minutes == 1 else f"*/{minutes} * * * *"
+            if self.interval % 3600 == 0 and hours < 24 and 24 % hours == 0:
+                return "0 * * * *" if hours == 1 else f"0 */{hours} * * *"
+            if self.interval == 86400:
+                return "@daily"
+        raise ValueError(f"{self} has no cron equivalent; pass cron= as well")
@@ -0,0 +1,85 @@
+import tarfile
+from dataclasses import dataclass, field
+from io import BytesIO
+from os import symlink, unlink
+from pathlib import Path
+from typing import BinaryIO, Optional, Type
+
+from onboot import Installer, InstallerConfiguration, resolve_path
+from onboot.files import atomic_write
+from onboot.options import staggered
+
+
+class PlanError(ValueError):
+    # The backend's install cannot be expressed as files, symlinks and commands
+    pass
+
+
+@dataclass
+class PlannedFile:
+    path: Path
+    content: str
+    mode: int = 0o644
+
+
+@dataclass
+class PlannedSymlink:
+    path: Path
+    target: str
+
+
+@dataclass
+class Plan:
+    files: dict[Path, PlannedFile] = field(default_factory=dict)
+    symlinks: dict[Path, PlannedSymlink] = field(default_factory=dict)
+    commands: list[list[str]] = field(default_factory=list)
+
+    def add_file(self, path: Path, content: str, mode: int = 0o644):
+        self.files[Path(path)] = PlannedFile(Path(path), content, mode)
+
+    def add_symlink(self, path: Path, target: str):
+        self.symlinks[Path(path)] = PlannedSymlink(Path(path), str(target))
+
+    def add_command(self, argv: list[str]):
+        self.commands.append(list(argv))
+
+    def add(self, installer: Installer) -> "Plan":
+        installer.plan(self)
+        return self
+
+    def to_tar(self, fileobj: BinaryIO, mtime: int = 0):
+        # Streamed ('w|') so the archive can be piped straight into 'tar -x'
+        with tarfile.open(fileobj=fileobj, mode="w|") as tar:
+            for planned in self.files.values():
+                data = planned.content.encode("utf-8")
+                info = tarfile.TarInfo(str(planned.path).lstrip("/"))
+                info.size = len(data)
+                info.mode = planned.mode
+                info.mtime = mtime
+                tar.addfile(info, BytesIO(data))
+            for planned in self.symlinks.values():
+                info = tarfile.TarInfo(str(planned.path).lstrip("/"))
+                info.type = tarfile.SYMTYPE
+                info.linkname = planned.target
+                info.mtime = mtime
+                tar.addfile(info)
+
+    def to_directory(self, directory: Path):
+        for planned in self.files.values():
+            path = resolve_path(planned.path, directory)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, planned.content, planned.mode, fsync=False)
+        for planned in self.symlinks.values():
+            path = resolve_path(planned.path, directory)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.is_symlink():
+                unlink(path)
+            symlink(planned.target, path)
+
+
+def compile_plan(configs: list[InstallerConfiguration], backend: Type[Installer],
+                 plan: Optional[Plan] = None) -> Plan:
+    plan = plan or Plan()
+    for config in staggered(configs):
+        plan.add(backend(config))
+    return plan
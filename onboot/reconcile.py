@@ -0,0 +1,111 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Type
+
+from onboot import Installer, InstallerConfiguration
+from onboot.discovery import InstalledEntry, scan
+from onboot.linux import XDGInstaller
+from onboot.options import staggered
+
+
+@dataclass
+class ReconcileResult:
+    created: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    failed: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.updated or self.removed)
+
+
+def entry_config(entry: InstalledEntry, root: Optional[Path] = None) -> InstallerConfiguration:
+    return InstallerConfiguration(Path(entry.command).parent, entry.name, root)
+
+
+def _read(path: Path) -> Optional[str]:
+    try:
+        return path.read_text()
+    except FileNotFoundError:
+        return None
+
+
+def is_current(installer: Installer, entry: InstalledEntry) -> bool:
+    render = getattr(installer, "render", None)
+    if render is not None and not installer.shared_target:
+        try:
+            if entry.path.read_text() != render():
+                return False
+        except OSError:
+            return False
+        # The .socket/.path/.timer unit of a systemd entry counts as part of it
+        expected = getattr(installer, "expected_triggers", dict)()
+        return all(_read(path) == content for path, content in expected.items())
+    # Shared files hold one line per entry; schedule and stagger are part of it
+    get_entry = getattr(installer, "get_entry", None)
+    if get_entry is not None and entry.line:
+        return entry.line == get_entry()
+    return entry.command == str(installer.config.get_path())
+
+
+def diff(desired: list[InstallerConfiguration], backend: Type[Installer], root: Optional[Path] = None) -> tuple:
+    # Concurrency caps are resolved over the whole desired set, the way a
+    # single install_many() would, so later waves keep their delay
+    desired = list(staggered(desired))
+    installed = {}
+    for entry in scan(backend, root):
+        # Only entries at the location this backend would write to right now
+        if str(entry.path) == backend(entry_config(entry, root)).get_target():
+            installed[entry.name] = entry
+
+    create, update = [], []
+    for config in desired:
+        entry = installed.pop(config.name, None)
+        if entry is None:
+            create.append(config)
+        elif not is_current(backend(config), entry):
+            update.append(config)
+    remove = [entry_config(entry, root) for entry in installed.values()]
+    return create, update, remove
+
+
+def reconcile(desired: list[InstallerConfiguration], backend: Type[Installer] = XDGInstaller,
+              dry_run: bool = False, root: Optional[Path] = None, manifest=None) -> ReconcileResult:
+    if root is None:
+        root = next((config.root for config in desired if config.root is not None), None)
+    create, update, remove = diff(desired, backend, root)
+    result = ReconcileResult(
+        created=[c.name for c in create],
+        updated=[c.name for c in update],
+        removed=[c.name for c in remove],
+    )
+    if dry_run:
+        return result
+
+    if not result.changed:
+        return result
+
+    # A single batched call lets each backend coalesce its side effects
+    outcome = backend.apply_many(create + update, remove)
+    result.failed = [name for name, ok in outcome.items() if not ok]
+    _update_manifest(backend, create + update, remove, outcome, manifest)
+    return result
+
+
+def _update_manifest(backend: Type[Installer], installed: list[InstallerConfiguration],
+                     removed: list[InstallerConfiguration], outcome: dict[str, bool], manifest):
+    # Keeps status() and uninstall() in step with what reconcile changed
+    if manifest is False:
+        return
+    from onboot.manifest import Manifest
+    manifest = manifest or Manifest()
+    try:
+        for config in removed:
+            if outcome.get(config.name):
+                manifest.forget(config.name, backend(config).get_target())
+        for config in installed:
+            if outcome.get(config.name):
+                manifest.record(backend(config))
+    except OSError:
+        pass
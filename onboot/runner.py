@@ -0,0 +1,165 @@
+from abc import abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional, Sequence
+
+from onboot.instrument import spawned
+
+
+class CommandError(OSError):
+    # An OSError so that installers treat a failed command like any other I/O failure
+    def __init__(self, argv: Sequence[str], returncode: Optional[int], stdout: bytes = b"", stderr: bytes = b"",
+                 reason: Optional[str] = None):
+        self.argv = tuple(argv)
+        self.returncode = returncode
+        self.stdout = stdout or b""
+        self.stderr = stderr or b""
+        if reason is None:
+            reason = f"exited with status {returncode}"
+        super().__init__(f"{' '.join(self.argv)}: {reason}")
+
+
+class Runner:
+    # Runs an argv list (never through a shell) and returns its stdout; raises
+    # CommandError on a non-zero exit or timeout
+    timeout: Optional[float] = 60.0
+
+    @abstractmethod
+    def run(self, argv: Sequence[str], input: Optional[bytes] = None, timeout: Optional[float] = None) -> bytes:
+        ...
+
+
+class SubprocessRunner(Runner):
+    def __init__(self, timeout: Optional[float] = 60.0):
+        self.timeout = timeout
+
+    def run(self, argv: Sequence[str], input: Optional[bytes] = None, timeout: Optional[float] = None) -> bytes:
+        from subprocess import run as spawn, DEVNULL, PIPE, TimeoutExpired
+        argv = [str(arg) for arg in argv]
+        timeout = self.timeout if timeout is None else timeout
+        with spawned(argv):
+            try:
+                result = spawn(argv, input=input, stdin=DEVNULL if input is None else None,
+                               stdout=PIPE, stderr=PIPE, timeout=timeout)
+            except TimeoutExpired as e:
+                raise CommandError(argv, None, e.stdout, e.stderr, f"timed out after {timeout}s") from None
+            if result.returncode != 0:
+                raise CommandError(argv, result.returncode, result.stdout, result.stderr)
+        return result.stdout
+
+
+class RecordingRunner(Runner):
+    # In-process fake: records every call and answers from handler(argv, input),
+    # which may return stdout or raise CommandError
+    def __init__(self, handler: Optional[Callable[[tuple, Optional[bytes]], Optional[bytes]]] = None):
+        self.handler = handler
+        self.calls: list[tuple] = []
+        self.inputs: list[Optional[bytes]] = []
+
+    def run(self, argv: Sequence[str], input: Optional[bytes] = None, timeout: Optional[float] = None) -> bytes:
+        argv = tuple(str(arg) for arg in argv)
+        self.calls.append(argv)
+        self.inputs.append(input)
+        if self.handler is None:
+            return b""
+        return self.handler(argv, input) or b""
+
+
+# Commands whose trailing operands can be merged into one call: program -> verbs
+MERGEABLE = {
+    "systemctl": {"enable", "disable", "start", "stop", "restart", "daemon-reload"},
+    "launchctl": {"load", "unload"},
+}
+
+
+def merge_prefix(argv: tuple) -> Optional[int]:
+    # Length of the part of argv (program, options, verb and its options) that
+    # must match for two calls to be merged; None if argv cannot be merged
+    verbs = MERGEABLE.get(argv[0]) if argv else None
+    if not verbs:
+        return None
+    index = 1
+    while index < len(argv) and argv[index].startswith("-"):
+        index += 1
+    if index == len(argv) or argv[index] not in verbs:
+        return None
+    index += 1
+    while index < len(argv) and argv[index].startswith("-"):
+        index += 1
+    return index
+
+
+class BatchingRunner(Runner):
+    # Defers mergeable commands and joins consecutive ones that only differ in
+    # their operands ("systemctl enable a", "systemctl enable b" -> "systemctl
+    # enable a b"). Deferred calls return b"" at once; their failures surface
+    # when the batch is flushed, on exit or before the next unmergeable command.
+    def __init__(self, inner: Optional[Runner] = None, merge: Callable[[tuple], Optional[int]] = merge_prefix):
+        self.inner = inner
+        self.merge = merge
+        self.pending: list[tuple[tuple, list[str]]] = []
+        self._previous: Optional[Runner] = None
+
+    def run(self, argv: Sequence[str], input: Optional[bytes] = None, timeout: Optional[float] = None) -> bytes:
+        argv = tuple(str(arg) for arg in argv)
+        length = self.merge(argv) if input is None else None
+        if length is None:
+            self.flush()
+            return self._inner().run(argv, input, timeout)
+        prefix, operands = argv[:length], argv[length:]
+        if self.pending and self.pending[-1][0] == prefix:
+            queued = self.pending[-1][1]
+            queued.extend(operand for operand in operands if operand not in queued)
+        else:
+            self.pending.append((prefix, list(operands)))
+        return b""
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for prefix, operands in pending:
+            self._inner().run(prefix + tuple(operands))
+
+    def _inner(self) -> Runner:
+        return self.inner or self._previous or SubprocessRunner()
+
+    def __enter__(self) -> "BatchingRunner":
+        self._previous = set_runner(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.flush()
+            else:
+                self.pending = []
+        finally:
+            set_runner(self._previous)
+
+
+_runner: Optional[Runner] = None
+
+
+def get_runner() -> Runner:
+    global _runner
+    if _runner is None:
+        _runner = SubprocessRunner()
+    return _runner
+
+
+def set_runner(runner: Optional[Runner]) -> Optional[Runner]:
+    # Replaces the process-wide runner and returns the previous one
+    global _runner
+    previous, _runner = _runner, runner
+    return previous
+
+
+@contextmanager
+def use_runner(runner: Runner) -> Iterator[Runner]:
+    previous = set_runner(runner)
+    try:
+        yield runner
+    finally:
+        set_runner(previous)
+
+
+def run(argv: Sequence[str], input: Optional[bytes] = None, timeout: Optional[float] = None) -> bytes:
+    return get_runner().run(argv, input, timeout)
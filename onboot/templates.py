@@ -0,0 +1,243 @@
+import re
+from string import Formatter
+from typing import Callable, Iterable, Iterator, Mapping, Sequence
+
+from onboot import MARKER
+
+
+_DESKTOP_STRING = re.compile(r"[\\\n\t\r]")
+_DESKTOP_STRING_ESCAPES = {"\\": "\\\\", "\n": "\\n", "\t": "\\t", "\r": "\\r"}
+_DESKTOP_RESERVED = re.compile(r"[\s\"'\\><~|&;$*?#()`]")
+_DESKTOP_QUOTED = re.compile(r"[\"`$\\]")
+_SYSTEMD_QUOTE = re.compile(r"[\s\"'\\]")
+_SHELL_SAFE = re.compile(r"[\w@%+=:,./-]+", re.ASCII)
+
+
+def desktop_string(value) -> str:
+    # "string" values of the Desktop Entry spec
+    value = str(value)
+    if _DESKTOP_STRING.search(value) is None:
+        return value
+    return _DESKTOP_STRING.sub(lambda m: _DESKTOP_STRING_ESCAPES[m.group()], value)
+
+
+def desktop_exec(argv: Sequence) -> str:
+    # Exec= quoting: reserved characters need a double-quoted argument, % starts
+    # a field code; the string escape rule is applied on top of that
+    args = []
+    for arg in argv:
+        arg = str(arg).replace("%", "%%")
+        if _DESKTOP_RESERVED.search(arg) is not None:
+            arg = '"' + _DESKTOP_QUOTED.sub(r"\\\g<0>", arg) + '"'
+        args.append(arg)
+    return desktop_string(" ".join(args))
+
+
+def systemd_value(value) -> str:
+    # % starts a specifier; a line break would end the setting
+    return str(value).replace("%", "%%").replace("\n", " ")
+
+
+def systemd_exec(argv: Sequence) -> str:
+    # ExecStart= quoting: specifiers, $ variable expansion, whitespace and quotes
+    args = []
+    for arg in argv:
+        arg = str(arg).replace("%", "%%").replace("$", "$$")
+        if arg == ";":
+            arg = "\\;"
+        elif not arg or _SYSTEMD_QUOTE.search(arg) is not None:
+            arg = '"' + arg.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        args.append(arg)
+    return " ".join(args)
+
+
+def systemd_environment(name: str, value) -> str:
+    # One quoted Environment= assignment; only specifiers are expanded there
+    value = str(value).replace("%", "%%").replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{name}={value}"'
+
+
+def directives(lines: Iterable[str]) -> str:
+    # "Key=value" lines whose values the caller has escaped already
+    return "".join(f"{line}\n" for line in lines)
+
+
+def xml(value) -> str:
+    return str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") \
+        .replace('"', "&quot;").replace("'", "&apos;")
+
+
+def shell(value) -> str:
+    value = str(value)
+    if _SHELL_SAFE.fullmatch(value) is not None:
+        return value
+    return "'" + value.replace("'", "'\"'\"'") + "'"
+
+
+def batch(value) -> str:
+    value = str(value).replace("%", "%%")
+    if any(c.isspace() or c in '&|<>^()"' for c in value):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def line(value) -> str:
+    # Free text on a comment line
+    return str(value).replace("\n", " ").replace("\r", " ")
+
+
+class Template:
+    # A str.format template whose fields are each bound to an escaper once, at
+    # compile time; render() escapes the values and fills them in with format_map
+    def __init__(self, source: str, **escapers: Callable[[object], str]):
+        fields = {field for _, field, _, _ in Formatter().parse(source) if field is not None}
+        unknown = fields - set(escapers)
+        if unknown:
+            raise ValueError(f"No escaper for fields: {', '.join(sorted(unknown))}")
+        self.source = source
+        self.escapers = tuple(escapers.items())
+
+    def render(self, values: Mapping[str, object]) -> str:
+        return self.source.format_map({field: escape(values[field]) for field, escape in self.escapers})
+
+    def render_many(self, rows: Iterable[Mapping[str, object]]) -> Iterator[str]:
+        source, escapers = self.source, self.escapers
+        for values in rows:
+            yield source.format_map({field: escape(values[field]) for field, escape in escapers})
+
+
+DESKTOP = Template(
+    "[Desktop Entry]\n"
+    f"{MARKER}{{marker}}\n"
+    "Type=Application\n"
+    "Name={name}\n"
+    "Exec={exec}\n"
+    "Terminal=false\n",
+    marker=line, name=desktop_string, exec=desktop_exec,
+)
+
+SERVICE = Template(
+    f"{MARKER}{{marker}}\n"
+    "[Unit]\n"
+    "Description={description}\n"
+    "After=default.target\n"
+    "{unit}"
+    "\n"
+    "[Service]\n"
+    "Type=simple\n"
+    "ExecStart={exec}\n"
+    "Restart=on-failure\n"
+    "{service}"
+    "\n"
+    "[Install]\n"
+    "{install}",
+    marker=line, description=systemd_value, exec=systemd_exec, unit=directives, service=directives,
+    install=directives,
+)
+
+SLICE = Template(
+    f"{MARKER}{{marker}}\n"
+    "[Unit]\n"
+    "Description={description}\n"
+    "Before=slices.target\n"
+    "\n"
+    "[Slice]\n"
+    "{slice}",
+    marker=line, description=systemd_value, slice=directives,
+)
+
+# The .socket or .path unit that starts a service on demand
+TRIGGER = Template(
+    f"{MARKER}{{marker}}\n"
+    "[Unit]\n"
+    "Description={description}\n"
+    "\n"
+    "[{section}]\n"
+    "{trigger}"
+    "\n"
+    "[Install]\n"
+    "{install}",
+    marker=line, description=systemd_value, section=line, trigger=directives, install=directives,
+)
+
+SHELL_SCRIPT = Template(f"#!/bin/sh\n{MARKER}{{marker}}\n{{path}}", marker=line, path=shell)
+
+# Waits in the background so that it does not hold up whatever runs the script
+STAGGERED_SHELL_SCRIPT = Template(f"#!/bin/sh\n{MARKER}{{marker}}\n({{sleep}}; exec {{path}}) &", marker=line,
+                                  sleep=line, path=shell)
+
+PLIST = Template(
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n'
+    '<plist version="1.0">\n'
+    "<dict>\n"
+    "    <key>Label</key>\n"
+    "    <string>{label}</string>\n"
+    "    <key>ProgramArguments</key>\n"
+    "    <array>\n"
+    "        <string>{path}</string>\n"
+    "    </array>\n"
+    "    <key>RunAtLoad</key>\n"
+    "    <true/>\n"
+    "    <key>KeepAlive</key>\n"
+    "    <false/>\n"
+    "</dict>\n"
+    "</plist>\n",
+    label=xml, path=xml,
+)
+
+TASK_XML = Template(
+    '<?xml version="1.0" encoding="UTF-16"?>\n'
+    '<Task version="1.3" xmlns="http://schemas.microsoft.com/windows/2004/02/mit/task">\n'
+    "  <RegistrationInfo>\n"
+    "    <Author>{author}</Author>\n"
+    "    <Description>{description}</Description>\n"
+    "    <URI>\\{name}</URI>\n"
+    "  </RegistrationInfo>\n"
+    "  <Triggers>\n"
+    "    <LogonTrigger>\n"
+    "      <Enabled>true</Enabled>\n"
+    "      <Delay>PT1M</Delay>\n"
+    "    </LogonTrigger>\n"
+    "  </Triggers>\n"
+    "  <Principals>\n"
+    '    <Principal id="Author">\n'
+    "      <RunLevel>HighestAvailable</RunLevel>\n"
+    "    </Principal>\n"
+    "  </Principals>\n"
+    "  <Settings>\n"
+    "    <MultipleInstancesPolicy>StopExisting</MultipleInstancesPolicy>\n"
+    "    <DisallowStartIfOnBatteries>false</DisallowStartIfOnBatteries>\n"
+    "    <StopIfGoingOnBatteries>false</StopIfGoingOnBatteries>\n"
+    "    <AllowHardTerminate>true</AllowHardTerminate>\n"
+    "    <StartWhenAvailable>true</StartWhenAvailable>\n"
+    "    <RunOnlyIfNetworkAvailable>false</RunOnlyIfNetworkAvailable>\n"
+    "    <IdleSettings>\n"
+    "      <StopOnIdleEnd>true</StopOnIdleEnd>\n"
+    "      <RestartOnIdle>false</RestartOnIdle>\n"
+    "    </IdleSettings>\n"
+    "    <AllowStartOnDemand>true</AllowStartOnDemand>\n"
+    "    <Enabled>true</Enabled>\n"
+    "    <Hidden>true</Hidden>\n"
+    "    <RunOnlyIfIdle>false</RunOnlyIfIdle>\n"
+    "    <DisallowStartOnRemoteAppSession>false</DisallowStartOnRemoteAppSession>\n"
+    "    <UseUnifiedSchedulingEngine>true</UseUnifiedSchedulingEngine>\n"
+    "    <WakeToRun>false</WakeToRun>\n"
+    "    <ExecutionTimeLimit>PT72H</ExecutionTimeLimit>\n"
+    "    <Priority>2</Priority>\n"
+    "    <RestartOnFailure>\n"
+    "      <Interval>PT1M</Interval>\n"
+    "      <Count>999</Count>\n"
+    "    </RestartOnFailure>\n"
+    "  </Settings>\n"
+    '  <Actions Context="Author">\n'
+    "    <Exec>\n"
+    "      <Command>{command}</Command>\n"
+    "      <WorkingDirectory>{work_dir}</WorkingDirectory>\n"
+    "    </Exec>\n"
+    "  </Actions>\n"
+    "</Task>\n",
+    author=xml, description=xml, name=xml, command=xml, work_dir=xml,
+)
+
+BATCH = Template('start "" {path}', path=batch)
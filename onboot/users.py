@@ -0,0 +1,134 @@
+from dataclasses import dataclass, replace
+from os import chown, lchown
+from pathlib import Path
+from typing import Iterable, Optional, Type
+
+from onboot import Installer, InstallerConfiguration, detect, resolve_path
+
+# Login shells of system and locked accounts
+NOLOGIN_SHELLS = {"/usr/sbin/nologin", "/sbin/nologin", "/bin/false", "/usr/bin/false"}
+
+
+@dataclass(frozen=True)
+class User:
+    name: str
+    uid: int
+    gid: int
+    home: Path
+    shell: str = ""
+
+
+def read_passwd(root: Optional[Path] = None) -> list[User]:
+    # Parsed directly (not through pwd) so that an image's passwd can be read
+    users = []
+    with open(resolve_path(Path("/etc/passwd"), root)) as f:
+        for line in f:
+            fields = line.rstrip("\n").split(":")
+            if len(fields) < 7 or line.startswith("#"):
+                continue
+            try:
+                uid, gid = int(fields[2]), int(fields[3])
+            except ValueError:
+                continue
+            users.append(User(fields[0], uid, gid, Path(fields[5]), fields[6]))
+    return users
+
+
+def passwd_users(root: Optional[Path] = None, min_uid: int = 1000, max_uid: int = 60000) -> list[User]:
+    # Regular login accounts
+    return [user for user in read_passwd(root)
+            if min_uid <= user.uid <= max_uid and user.shell not in NOLOGIN_SHELLS]
+
+
+def lookup_users(names: Iterable[str], root: Optional[Path] = None) -> list[User]:
+    by_name = {user.name: user for user in read_passwd(root)}
+    missing = [name for name in names if name not in by_name]
+    if missing:
+        raise KeyError(f"Unknown users: {', '.join(missing)}")
+    return [by_name[name] for name in names]
+
+
+def user_config(config: InstallerConfiguration, user: User) -> InstallerConfiguration:
+    return replace(config, home=user.home)
+
+
+def owned_paths(installer: Installer) -> list[Path]:
+    # Everything install() creates for the user
+    paths = [installer.get_autostart_path()]
+    # systemd also writes the trigger unit and the onboot slice next to the service
+    for extra in ("get_trigger_path", "get_slice_path"):
+        path = getattr(installer, extra, lambda: None)()
+        if path is not None:
+            paths.append(path)
+    links = getattr(installer, "get_install_links", None)
+    return paths + (links() if links is not None else [])
+
+
+def _below(path: Path, home: Path) -> list[Path]:
+    # path and its ancestors up to, but not including, home
+    try:
+        depth = len(path.relative_to(home).parts)
+    except ValueError:
+        return []
+    return [path] + list(path.parents)[:depth - 1]
+
+
+def is_safe(installer: Installer, home: Path) -> bool:
+    # Refuses to follow a symlink the user planted on the way to a target; a
+    # root-run install would otherwise write (or, for .bashrc, read) any file
+    for path in owned_paths(installer):
+        if not _below(path, home):
+            return False
+        if any(part.is_symlink() for part in _below(path.parent, home)):
+            return False
+    return not installer.get_autostart_path().is_symlink()
+
+
+def set_owner(installer: Installer, user: User, home: Path):
+    for path in owned_paths(installer):
+        for part in _below(path, home):
+            if part.is_symlink():
+                lchown(part, user.uid, user.gid)
+            elif part.exists():
+                chown(part, user.uid, user.gid)
+
+
+def apply_for_user(installer: Type[Installer], config: InstallerConfiguration, user: User,
+                   uninstall: bool = False) -> bool:
+    candidate = installer(user_config(config, user))
+    home = resolve_path(user.home, config.root)
+    try:
+        if not home.is_dir() or not is_safe(candidate, home):
+            return False
+        if uninstall:
+            return candidate.uninstall()
+        if not candidate.is_supported() or not candidate.install():
+            return False
+        if detect.is_root():
+            set_owner(candidate, user, home)
+        return True
+    except (OSError, IOError, PermissionError, FileNotFoundError):
+        return False
+
+
+def _fan_out(installer: Type[Installer], config: InstallerConfiguration, users: Optional[list[User]],
+             workers: int, uninstall: bool) -> dict[str, bool]:
+    from concurrent.futures import ThreadPoolExecutor
+    if users is None:
+        users = passwd_users(config.root)
+    if not users:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(users))), thread_name_prefix="onboot-user") as pool:
+        results = pool.map(lambda user: apply_for_user(installer, config, user, uninstall), users)
+        return dict(zip((user.name for user in users), results))
+
+
+def install_for_users(installer: Type[Installer], config: InstallerConfiguration,
+                      users: Optional[list[User]] = None, workers: int = 32) -> dict[str, bool]:
+    # Installs config for every user (all login accounts by default); {user name: success}
+    return _fan_out(installer, config, users, workers, False)
+
+
+def uninstall_for_users(installer: Type[Installer], config: InstallerConfiguration,
+                        users: Optional[list[User]] = None, workers: int = 32) -> dict[str, bool]:
+    return _fan_out(installer, config, users, workers, True)
@@ -1,21 +1,28 @@
 import winreg
 from getpass import getuser
+from os.path import expandvars
 from pathlib import Path
-from subprocess import check_output
 
-from onboot import Installer, random_str
+from onboot import Installer, random_str, templates
+from onboot.runner import run
+from onboot.lock import locked
 
 
 class StartMenuInstaller(Installer):
-    autostart_directory = Path(f"C:\\Users\\{getuser()}\\AppData\\Roaming\\Microsoft\\Windows\\Start Menu\\Programs\\Startup")
+    @property
+    def autostart_directory(self) -> Path:
+        # Resolved per access so importing this module does not look up the user
+        return Path(f"C:\\Users\\{getuser()}\\AppData\\Roaming\\Microsoft\\Windows\\Start Menu\\Programs\\Startup")
 
     def get_autostart_path(self):
         return self.autostart_directory.joinpath(f"{self.config.name}.bat")
 
+    def render(self) -> str:
+        return templates.BATCH.render({"path": self.config.get_path()})
+
     def install(self) -> bool:
         try:
-            text = f'start "" {self.config.get_path()}'
-            return self.get_autostart_path().write_text(text) == len(text)
+            return self.write_autostart_file(self.render())
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
@@ -29,6 +36,10 @@ class StartMenuInstaller(Installer):
 class HKCUInstaller(Installer):
     registry_key = "Software\\Microsoft\\Windows\\CurrentVersion\\Run"
     registry = winreg.HKEY_CURRENT_USER
+    shared_target = True
+
+    def get_target(self) -> str:
+        return f"{self.registry_key}\\{self.config.name}"
 
     def install(self) -> bool:
         k = winreg.OpenKey(self.registry, self.registry_key, 0, winreg.KEY_ALL_ACCESS)
@@ -57,6 +68,9 @@ class IFEOInstaller(HKLMInstaller):
     registry_key = "Software\\Microsoft\\Windows NT\\CurrentVersion\\Image File Execution Options"
     target_executable = "notepad.exe"  # Common target for IFEO persistence
 
+    def get_target(self) -> str:
+        return f"{self.registry_key}\\{self.target_executable}"
+
     def install(self) -> bool:
         try:
             # Create subkey for target executable
@@ -85,26 +99,32 @@ class IFEOInstaller(HKLMInstaller):
 class UserInitInstaller(HKLMInstaller):
     registry_key = "Software\\Microsoft\\Windows NT\\CurrentVersion\\Winlogon"
 
+    def get_target(self) -> str:
+        return f"{self.registry_key}\\Userinit"
+
     def install(self) -> bool:
         try:
-            k = winreg.OpenKey(self.registry, self.registry_key, 0, winreg.KEY_READ | winreg.KEY_WRITE)
-            current_value, _ = winreg.QueryValueEx(k, "Userinit")
-            # Append our executable to the Userinit value (separated by comma)
-            new_value = f"{current_value},{self.config.get_path()}"
-            winreg.SetValueEx(k, "Userinit", 0, winreg.REG_SZ, new_value)
-            winreg.CloseKey(k)
+            with locked(self.get_target(), self.lock_timeout):
+                k = winreg.OpenKey(self.registry, self.registry_key, 0, winreg.KEY_READ | winreg.KEY_WRITE)
+                current_value, _ = winreg.QueryValueEx(k, "Userinit")
+                # Append our executable to the Userinit value (separated by comma)
+                if f",{self.config.get_path()}" not in current_value:
+                    new_value = f"{current_value},{self.config.get_path()}"
+                    winreg.SetValueEx(k, "Userinit", 0, winreg.REG_SZ, new_value)
+                winreg.CloseKey(k)
             return True
         except (OSError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
         try:
-            k = winreg.OpenKey(self.registry, self.registry_key, 0, winreg.KEY_READ | winreg.KEY_WRITE)
-            current_value, _ = winreg.QueryValueEx(k, "Userinit")
-            # Remove our executable from the Userinit value
-            new_value = current_value.replace(f",{self.config.get_path()}", "")
-            winreg.SetValueEx(k, "Userinit", 0, winreg.REG_SZ, new_value)
-            winreg.CloseKey(k)
+            with locked(self.get_target(), self.lock_timeout):
+                k = winreg.OpenKey(self.registry, self.registry_key, 0, winreg.KEY_READ | winreg.KEY_WRITE)
+                current_value, _ = winreg.QueryValueEx(k, "Userinit")
+                # Remove our executable from the Userinit value
+                new_value = current_value.replace(f",{self.config.get_path()}", "")
+                winreg.SetValueEx(k, "Userinit", 0, winreg.REG_SZ, new_value)
+                winreg.CloseKey(k)
             return True
         except (OSError, PermissionError, FileNotFoundError):
             return False
@@ -114,6 +134,12 @@ class UserInitInstaller(HKLMInstaller):
 
 
 class WMICInstaller(Installer):
+    shared_target = True
+    powershell = ["powershell", "-NoProfile", "-NonInteractive", "-Command"]
+
+    def get_target(self) -> str:
+        return f"wmi:{self.config.name}"
+
     def install(self) -> bool:
         try:
             # Generate unique names for WMI objects
@@ -122,18 +148,17 @@ class WMICInstaller(Installer):
             binding_name = f"{self.config.name}_Binding"
             
             # Create WMI Event Filter (triggers on system startup)
-            filter_cmd = f'''powershell -Command "$filter = Set-WmiInstance -Namespace root\\subscription -Class __EventFilter -Arguments @{{Name='{filter_name}'; EventNamespace='root\\cimv2'; QueryLanguage='WQL'; Query='SELECT * FROM __InstanceModificationEvent WITHIN 60 WHERE TargetInstance ISA \\"Win32_PerfFormattedData_PerfOS_System\\" AND TargetInstance.SystemUpTime >= 200 AND TargetInstance.SystemUpTime < 320'}}; exit 0"'''
+            filter_cmd = f'''$filter = Set-WmiInstance -Namespace root\\subscription -Class __EventFilter -Arguments @{{Name='{filter_name}'; EventNamespace='root\\cimv2'; QueryLanguage='WQL'; Query='SELECT * FROM __InstanceModificationEvent WITHIN 60 WHERE TargetInstance ISA "Win32_PerfFormattedData_PerfOS_System" AND TargetInstance.SystemUpTime >= 200 AND TargetInstance.SystemUpTime < 320'}}; exit 0'''
             
             # Create WMI Event Consumer (executes our program)
-            consumer_cmd = f'''powershell -Command "$consumer = Set-WmiInstance -Namespace root\\subscription -Class CommandLineEventConsumer -Arguments @{{Name='{consumer_name}'; CommandLineTemplate='{self.config.get_path()}'}}; exit 0"'''
+            consumer_cmd = f'''$consumer = Set-WmiInstance -Namespace root\\subscription -Class CommandLineEventConsumer -Arguments @{{Name='{consumer_name}'; CommandLineTemplate='{self.config.get_path()}'}}; exit 0'''
             
             # Bind filter to consumer
-            binding_cmd = f'''powershell -Command "$binding = Set-WmiInstance -Namespace root\\subscription -Class __FilterToConsumerBinding -Arguments @{{Filter=[ref](Get-WmiObject -Namespace root\\subscription -Class __EventFilter -Filter \\"Name='{filter_name}'\\" ); Consumer=[ref](Get-WmiObject -Namespace root\\subscription -Class CommandLineEventConsumer -Filter \\"Name='{consumer_name}'\\" )}}; exit 0"'''
+            binding_cmd = f'''$binding = Set-WmiInstance -Namespace root\\subscription -Class __FilterToConsumerBinding -Arguments @{{Filter=[ref](Get-WmiObject -Namespace root\\subscription -Class __EventFilter -Filter "Name='{filter_name}'" ); Consumer=[ref](Get-WmiObject -Namespace root\\subscription -Class CommandLineEventConsumer -Filter "Name='{consumer_name}'" )}}; exit 0'''
             
             # Execute commands
-            check_output(filter_cmd, shell=True)
-            check_output(consumer_cmd, shell=True)
-            check_output(binding_cmd, shell=True)
+            for script in (filter_cmd, consumer_cmd, binding_cmd):
+                run(self.powershell + [script])
             return True
         except (OSError, PermissionError, FileNotFoundError):
             return False
@@ -145,13 +170,13 @@ class WMICInstaller(Installer):
             
             # Remove binding (it will be automatically removed when filter or consumer is deleted)
             # Remove filter
-            filter_cmd = f'''powershell -Command "Get-WmiObject -Namespace root\\subscription -Class __EventFilter -Filter \\"Name='{filter_name}\\" | Remove-WmiObject; exit 0"'''
+            filter_cmd = f'''Get-WmiObject -Namespace root\\subscription -Class __EventFilter -Filter "Name='{filter_name}'" | Remove-WmiObject; exit 0'''
             
             # Remove consumer
-            consumer_cmd = f'''powershell -Command "Get-WmiObject -Namespace root\\subscription -Class CommandLineEventConsumer -Filter \\"Name='{consumer_name}\\" | Remove-WmiObject; exit 0"'''
+            consumer_cmd = f'''Get-WmiObject -Namespace root\\subscription -Class CommandLineEventConsumer -Filter "Name='{consumer_name}'" | Remove-WmiObject; exit 0'''
             
-            check_output(filter_cmd, shell=True)
-            check_output(consumer_cmd, shell=True)
+            for script in (filter_cmd, consumer_cmd):
+                run(self.powershell + [script])
             return True
         except (OSError, PermissionError, FileNotFoundError):
             return False
@@ -161,81 +186,48 @@ class WMICInstaller(Installer):
 
 
 class SchTaskInstaller(Installer):
+    shared_target = True
+
+    task_directory = Path("C:\\ProgramData\\onboot\\")
+
+    def get_target(self) -> str:
+        return f"schtasks:{self.config.name}"
+
+    def plan(self, plan) -> None:
+        path = self.task_directory.joinpath(f"{self.config.name}.xml")
+        plan.add_file(path, self.generate_task_xml(), self.file_mode)
+        plan.add_command(["schtasks", "/create", "/xml", str(path), "/tn", self.config.name])
+
     def generate_task_xml(
             self,
             work_dir: Path = Path(""),
             author: str = "Microsoft Corporation",
             description: str = ""
     ):
-        if work_dir == "":
-            work_dir = self.config.get_path()
-        return f'''
-<?xml version="1.0" encoding="UTF-16"?>
-<Task version="1.3" xmlns="http://schemas.microsoft.com/windows/2004/02/mit/task">
-  <RegistrationInfo>
-    <Author>{author}</Author>
-    <Description>{description}</Description>
-    <URI>\\{self.config.name}</URI>
-  </RegistrationInfo>
-  <Triggers>
-    <LogonTrigger>
-      <Enabled>true</Enabled>
-      <Delay>PT1M</Delay>
-    </LogonTrigger>
-  </Triggers>
-  <Principals>
-    <Principal id="Author">
-      <RunLevel>HighestAvailable</RunLevel>
-    </Principal>
-  </Principals>
-  <Settings>
-    <MultipleInstancesPolicy>StopExisting</MultipleInstancesPolicy>
-    <DisallowStartIfOnBatteries>false</DisallowStartIfOnBatteries>
-    <StopIfGoingOnBatteries>false</StopIfGoingOnBatteries>
-    <AllowHardTerminate>true</AllowHardTerminate>
-    <StartWhenAvailable>true</StartWhenAvailable>
-    <RunOnlyIfNetworkAvailable>false</RunOnlyIfNetworkAvailable>
-    <IdleSettings>
-      <StopOnIdleEnd>true</StopOnIdleEnd>
-      <RestartOnIdle>false</RestartOnIdle>
-    </IdleSettings>
-    <AllowStartOnDemand>true</AllowStartOnDemand>
-    <Enabled>true</Enabled>
-    <Hidden>true</Hidden>
-    <RunOnlyIfIdle>false</RunOnlyIfIdle>
-    <DisallowStartOnRemoteAppSession>false</DisallowStartOnRemoteAppSession>
-    <UseUnifiedSchedulingEngine>true</UseUnifiedSchedulingEngine>
-    <WakeToRun>false</WakeToRun>
-    <ExecutionTimeLimit>PT72H</ExecutionTimeLimit>
-    <Priority>2</Priority>
-    <RestartOnFailure>
-      <Interval>PT1M</Interval>
-      <Count>999</Count>
-    </RestartOnFailure>
-  </Settings>
-  <Actions Context="Author">
-    <Exec>
-      <Command>{self.config.get_path()}</Command>
-      <WorkingDirectory>{work_dir}</WorkingDirectory>
-    </Exec>
-  </Actions>
-</Task>
-'''
+        if work_dir == Path(""):
+            work_dir = self.config.directory
+        return templates.TASK_XML.render({"author": author, "description": description, "name": self.config.name,
+                                          "command": self.config.get_path(), "work_dir": work_dir})
+
+    def render(self) -> str:
+        return self.generate_task_xml()
 
     def install(self) -> bool:
         try:
             text = self.generate_task_xml()
-            fp = Path("%APPDATA%").joinpath(f"{random_str()}.xml")
-            fp.write_text(text)
-            check_output(f"cmd /C schtasks /create /xml {fp} /tn {self.config.name}", shell=True)
-            fp.unlink()
+            fp = Path(expandvars("%APPDATA%")).joinpath(f"{random_str()}.xml")
+            fp.write_text(text, encoding="utf-16")
+            try:
+                run(["schtasks", "/create", "/xml", str(fp), "/tn", self.config.name])
+            finally:
+                fp.unlink()
             return True
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
 
     def uninstall(self) -> bool:
         try:
-            check_output(f'cmd /C schtasks /delete /tn "{self.config.name}"')
+            run(["schtasks", "/delete", "/tn", self.config.name, "/f"])
             return True
         except (OSError, IOError, PermissionError, FileNotFoundError):
             return False
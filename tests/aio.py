@@ -0,0 +1,162 @@
+import asyncio
+import sys
+from os import environ
+from pathlib import Path
+from threading import Lock
+from time import sleep
+
+import pytest
+
+from onboot import Installer, InstallerConfiguration
+from onboot.aio import arun, atry_install, atry_install_many
+from onboot.instrument import Recorder
+from onboot.runner import CommandError, SubprocessRunner, run
+
+config = InstallerConfiguration(Path("/opt/bin"), "agent")
+
+
+def test_arun():
+    async def main():
+        assert await arun([sys.executable, "-c", "import sys; print(sys.stdin.read())"], input=b"x") == b"x\n"
+        with pytest.raises(CommandError) as e:
+            await arun([sys.executable, "-c", "import sys; sys.exit(2)"])
+        assert e.value.returncode == 2
+        with pytest.raises(CommandError):
+            await arun([sys.executable, "-c", "import time; time.sleep(5)"], timeout=0.1)
+
+    asyncio.run(main())
+
+
+class CommandInstaller(Installer):
+    # Blocks in file work and runs a command, like the real installers do
+    autostart_directory = Path("/tmp/")
+
+    def is_supported(self) -> bool:
+        return True
+
+    def install(self) -> bool:
+        sleep(0.05)
+        return run([sys.executable, "-c", "print('ok')"]) == b"ok\n"
+
+
+class Unsupported(Installer):
+    def is_supported(self) -> bool:
+        return False
+
+    def install(self) -> bool:
+        raise AssertionError("never installed")
+
+
+def test_atry_install_keeps_the_loop_free():
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        task = asyncio.create_task(ticker())
+        with Recorder() as recorder:
+            ret, used = await atry_install([Unsupported, CommandInstaller], config)
+        task.cancel()
+        return ret, used, ticks, recorder
+
+    ret, used, ticks, recorder = asyncio.run(main())
+    assert ret is True and isinstance(used, CommandInstaller)
+    assert ticks > 5
+    assert [event.kind for event in recorder.events].count("subprocess") == 1
+    assert ("skip", "unsupported") in [(event.kind, event.reason) for event in recorder.events]
+
+
+def test_installer_async_methods():
+    async def main():
+        installer = CommandInstaller(config)
+        return await installer.ais_supported(), await installer.ainstall()
+
+    assert asyncio.run(main()) == (True, True)
+
+
+def test_atry_install_many_limit():
+    active = peak = 0
+    lock = Lock()
+
+    class Slow(Installer):
+        def is_supported(self) -> bool:
+            return True
+
+        def install(self) -> bool:
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            sleep(0.02)
+            with lock:
+                active -= 1
+            return True
+
+    configs = [InstallerConfiguration(Path("/opt/bin"), f"app{i}") for i in range(12)]
+    results = asyncio.run(atry_install_many([Slow], configs, limit=3, manifest=False))
+    assert sorted(results) == sorted(config.name for config in configs)
+    assert all(ok for ok, _ in results.values())
+    assert 1 < peak <= 3
+
+
+def test_async_methods_keep_an_installed_runner():
+    from onboot.runner import RecordingRunner, use_runner
+    fake = RecordingRunner(lambda argv, input: b"ok\n")
+    with use_runner(fake), Recorder() as recorder:
+        assert asyncio.run(CommandInstaller(config).ainstall())
+    assert fake.calls == [(sys.executable, "-c", "print('ok')")]
+    assert [event.kind for event in recorder.events].count("subprocess") == 0
+
+
+@pytest.fixture
+def fake_commands(tmp_path, monkeypatch):
+    # systemctl and crontab stand-ins on PATH that log their arguments; the
+    # blocking runner must not be used by the native async paths
+    bin_dir = tmp_path.joinpath("bin")
+    bin_dir.mkdir()
+    log = tmp_path.joinpath("calls")
+    table = tmp_path.joinpath("table")
+    bin_dir.joinpath("systemctl").write_text(f'#!/bin/sh\necho "systemctl $*" >> {log}\n')
+    bin_dir.joinpath("crontab").write_text(
+        f'#!/bin/sh\necho "crontab $*" >> {log}\n'
+        f'if [ "$1" = "-l" ]; then [ -f {table} ] && exec cat {table}; echo "no crontab for x" >&2; exit 1; fi\n'
+        f'exec cat > {table}\n')
+    for command in bin_dir.iterdir():
+        command.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{environ['PATH']}")
+
+    def blocked(self, argv, input=None, timeout=None):
+        raise AssertionError(f"{argv} ran in a worker thread")
+
+    monkeypatch.setattr(SubprocessRunner, "run", blocked)
+    return log, table
+
+
+def test_systemd_commands_run_on_the_loop(tmp_path, monkeypatch, fake_commands):
+    from onboot.linux import SystemdUserInstaller
+    log, _ = fake_commands
+    monkeypatch.setattr(SystemdUserInstaller, "autostart_directory", tmp_path.joinpath("units"))
+    installer = SystemdUserInstaller(config)
+    with Recorder() as recorder:
+        assert asyncio.run(installer.ainstall())
+        assert asyncio.run(installer.auninstall())
+    assert log.read_text().splitlines() == ["systemctl --user enable agent.service",
+                                            "systemctl --user disable agent.service",
+                                            "systemctl --user daemon-reload"]
+    assert not installer.get_autostart_path().exists()
+    assert recorder.counters()["onboot.linux.SystemdUserInstaller.subprocess.count"] == 3
+
+
+def test_crontab_commands_run_on_the_loop(fake_commands):
+    from onboot.linux import CrontabInstaller
+    log, table = fake_commands
+    installer = CrontabInstaller(config)
+    assert asyncio.run(installer.ainstall())
+    assert table.read_text() == "@reboot /opt/bin/agent # onboot:agent\n"
+    assert asyncio.run(installer.auninstall())
+    assert table.read_text() == ""
+    assert log.read_text().splitlines() == ["crontab -l", "crontab -", "crontab -l", "crontab -"]
@@ -0,0 +1,102 @@
+from os import stat
+from pathlib import Path
+
+from onboot import InstallerConfiguration
+from onboot.blocks import edit_block, scan_block, BEGIN, END
+from onboot.linux import BashrcInstaller, RcLocalInstaller
+
+
+def test_edit_block_appends_and_skips_unchanged(tmp_path):
+    path = tmp_path.joinpath(".bashrc")
+    path.write_text("alias ll='ls -l'\n")
+    assert edit_block(path, {"a": "/opt/bin/a &", "b": "/opt/bin/b &"}) is True
+    assert path.read_text() == (
+        "alias ll='ls -l'\n\n"
+        f"{BEGIN}\n# a autostart\n/opt/bin/a &\n# b autostart\n/opt/bin/b &\n{END}\n"
+    )
+    inode = stat(path).st_ino
+    assert edit_block(path, {"a": "/opt/bin/a &"}) is False
+    assert stat(path).st_ino == inode
+
+    assert edit_block(path, {}, ["a", "b"]) is True
+    assert path.read_text() == "alias ll='ls -l'\n\n"
+
+
+def test_edit_block_rc_local_before_final_exit(tmp_path):
+    path = tmp_path.joinpath("rc.local")
+    path.write_text("#!/bin/sh -e\nif true; then\n  exit 0\nfi\nexit 0\n\n")
+    edit_block(path, {"a": "/opt/bin/a &"}, before_exit=True)
+    assert path.read_text() == (
+        "#!/bin/sh -e\nif true; then\n  exit 0\nfi\n"
+        f"{BEGIN}\n# a autostart\n/opt/bin/a &\n{END}\nexit 0\n\n"
+    )
+
+
+def test_edit_block_migrates_legacy_entries(tmp_path):
+    path = tmp_path.joinpath(".bashrc")
+    path.write_text("export A=1\n\n# a autostart\n/opt/bin/a &\nexport B=2\n")
+    edit_block(path, {"a": "/opt/bin/a &"})
+    assert path.read_text() == f"export A=1\nexport B=2\n\n{BEGIN}\n# a autostart\n/opt/bin/a &\n{END}\n"
+    assert scan_block(path) == ({"a": "/opt/bin/a &"}, True, set())
+
+
+def test_block_installers_batch(tmp_path, monkeypatch, configs):
+    monkeypatch.setattr(BashrcInstaller, "autostart_directory", tmp_path)
+    monkeypatch.setattr(RcLocalInstaller, "autostart_directory", tmp_path)
+
+    assert all(BashrcInstaller.install_many(configs("a", "b", "c")).values())
+    assert scan_block(tmp_path.joinpath(".bashrc"))[0] == {n: f"/opt/bin/{n} &" for n in "abc"}
+    assert BashrcInstaller(configs("b")[0]).uninstall()
+    assert list(scan_block(tmp_path.joinpath(".bashrc"))[0]) == ["a", "c"]
+
+    # rc.local is created with a shebang, the final exit 0 and an executable mode
+    assert RcLocalInstaller(configs("a")[0]).install()
+    rc_local = tmp_path.joinpath("rc.local")
+    assert rc_local.read_text() == f"#!/bin/sh -e\n\n{BEGIN}\n# a autostart\n/opt/bin/a &\n{END}\nexit 0\n"
+    assert stat(rc_local).st_mode & 0o777 == 0o755
+
+
+def test_symlinked_rc_local_is_edited_in_place(tmp_path):
+    # RHEL: /etc/rc.local -> rc.d/rc.local
+    etc = tmp_path.joinpath("etc")
+    etc.joinpath("rc.d").mkdir(parents=True)
+    target = etc.joinpath("rc.d", "rc.local")
+    target.write_text("#!/bin/sh\nexit 0\n")
+    etc.joinpath("rc.local").symlink_to("rc.d/rc.local")
+
+    config = InstallerConfiguration(Path("/opt/bin"), "a", root=tmp_path)
+    assert RcLocalInstaller(config).install()
+    assert etc.joinpath("rc.local").is_symlink()
+    assert scan_block(target)[0] == {"a": "/opt/bin/a &"}
+    assert [path.name for path in etc.joinpath("rc.d").iterdir()] == ["rc.local"]
+
+
+def test_rc_local_migrates_baseline_entries(tmp_path, monkeypatch, configs):
+    # Older versions inserted a bare "<path> &" before the final exit 0
+    monkeypatch.setattr(RcLocalInstaller, "autostart_directory", tmp_path)
+    rc_local = tmp_path.joinpath("rc.local")
+    rc_local.write_text("#!/bin/sh -e\n\n/opt/bin/a &\n/opt/bin/b &\nexit 0\n")
+
+    assert RcLocalInstaller(configs("a")[0]).install()
+    assert rc_local.read_text() == f"#!/bin/sh -e\n\n/opt/bin/b &\n{BEGIN}\n# a autostart\n/opt/bin/a &\n{END}\nexit 0\n"
+    assert RcLocalInstaller(configs("b")[0]).uninstall()
+    assert RcLocalInstaller(configs("a")[0]).uninstall()
+    assert rc_local.read_text() == "#!/bin/sh -e\n\nexit 0\n"
+
+
+def test_foreign_encoding_passes_through(tmp_path, monkeypatch, configs):
+    monkeypatch.setattr(BashrcInstaller, "autostart_directory", tmp_path)
+    bashrc = tmp_path.joinpath(".bashrc")
+    bashrc.write_bytes(b"# caf\xe9\n")
+    assert BashrcInstaller(configs("a")[0]).install()
+    assert bashrc.read_bytes().startswith(b"# caf\xe9\n\n")
+    assert BashrcInstaller(configs("a")[0]).uninstall()
+    assert bashrc.read_bytes() == b"# caf\xe9\n\n"
+
+
+def test_block_entries_quote_the_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(BashrcInstaller, "autostart_directory", tmp_path)
+    config = InstallerConfiguration(Path("/opt/my apps & more"), "a")
+    assert BashrcInstaller(config).get_entry() == "'/opt/my apps & more/a' &"
+    assert BashrcInstaller(config).install()
+    assert scan_block(tmp_path.joinpath(".bashrc"))[0] == {"a": "'/opt/my apps & more/a' &"}
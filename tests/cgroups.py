@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from onboot import InstallerConfiguration
+from onboot.cgroups import read_cgroup, slice_cgroup, stats
+from onboot.linux import SystemdSystemInstaller, SystemdUserInstaller
+
+
+def fake_cgroup(path: Path, memory: int, usage: int, io: str = "") -> Path:
+    path.mkdir(parents=True)
+    path.joinpath("memory.current").write_text(f"{memory}\n")
+    path.joinpath("cpu.stat").write_text(f"usage_usec {usage}\nuser_usec {usage // 2}\nsystem_usec {usage // 2}\n")
+    path.joinpath("io.stat").write_text(io)
+    return path
+
+
+def test_read_cgroup(tmp_path):
+    group = fake_cgroup(tmp_path.joinpath("a.service"), 4096, 1500,
+                        "8:0 rbytes=100 wbytes=20 rios=3 wios=1 dbytes=0 dios=0\n259:0 rbytes=5 wbytes=7\n")
+    found = read_cgroup(group)
+    assert found.memory_current == 4096
+    assert found.cpu_usage_usec == 1500
+    assert found.io["8:0"]["rios"] == 3
+    assert (found.io_read_bytes, found.io_write_bytes) == (105, 27)
+    assert read_cgroup(tmp_path.joinpath("missing.service")) is None
+
+
+def test_read_cgroup_without_controllers(tmp_path):
+    tmp_path.joinpath("bare.service").mkdir()
+    found = read_cgroup(tmp_path.joinpath("bare.service"))
+    assert found.memory_current is None and found.cpu == {} and found.io == {}
+
+
+def test_slice_cgroup(tmp_path, monkeypatch):
+    monkeypatch.setattr("onboot.detect.euid", lambda: 1000)
+    assert slice_cgroup(SystemdSystemInstaller, tmp_path) == tmp_path.joinpath("onboot.slice")
+    assert slice_cgroup(SystemdUserInstaller, tmp_path) == tmp_path.joinpath(
+        "user.slice", "user-1000.slice", "user@1000.service", "onboot.slice")
+
+    class Nested(SystemdSystemInstaller):
+        slice_name = "onboot-batch.slice"
+    assert slice_cgroup(Nested, tmp_path) == tmp_path.joinpath("onboot.slice", "onboot-batch.slice")
+
+    class Unsliced(SystemdSystemInstaller):
+        slice_name = None
+    assert slice_cgroup(Unsliced, tmp_path) is None
+    assert stats(Unsliced, tmp_path) is None
+
+
+def test_stats_of_managed_units(tmp_path, monkeypatch):
+    from onboot.runner import RecordingRunner, use_runner
+    units = tmp_path.joinpath("units")
+    units.mkdir()
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", units)
+    with use_runner(RecordingRunner()):
+        for name in ("agent", "idle"):
+            assert SystemdSystemInstaller(InstallerConfiguration(Path("/opt/bin"), name)).install()
+    units.joinpath("foreign.service").write_text("[Service]\nExecStart=/bin/true\n")
+
+    group = tmp_path.joinpath("cgroup", "onboot.slice")
+    fake_cgroup(group, 8192, 3000)
+    fake_cgroup(group.joinpath("agent.service"), 4096, 1000)
+    fake_cgroup(group.joinpath("foreign.service"), 1, 1)
+
+    found = stats(SystemdSystemInstaller, tmp_path.joinpath("cgroup"))
+    assert sorted(found) == ["agent.service", "onboot.slice"]
+    assert found["agent.service"].memory_current == 4096
+    assert found["onboot.slice"].cpu_usage_usec == 3000
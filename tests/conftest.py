@@ -0,0 +1,43 @@
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.linux import CrontabInstaller, CrontabTransaction
+
+
+@pytest.fixture(autouse=True)
+def isolated_manifest(tmp_path, monkeypatch):
+    monkeypatch.setenv("ONBOOT_MANIFEST", str(tmp_path.joinpath("manifest.jsonl")))
+
+
+@pytest.fixture
+def configs():
+    # configs("a", "b") -> a configuration for /opt/bin/<name> per name
+    def make(*names):
+        return [InstallerConfiguration(Path("/opt/bin"), name) for name in names]
+    return make
+
+
+class MemoryCrontab(CrontabTransaction):
+    table = ""
+    writes = 0
+
+    def _read_table(self) -> str:
+        return MemoryCrontab.table
+
+    def _write_table(self, text: str):
+        MemoryCrontab.table = text
+        MemoryCrontab.writes += 1
+
+
+class MemoryCrontabInstaller(CrontabInstaller):
+    transaction = MemoryCrontab
+
+
+@pytest.fixture
+def memory_crontab(monkeypatch):
+    # A crontab installer whose table lives in memory, emptied for every test
+    monkeypatch.setattr(MemoryCrontab, "table", "")
+    monkeypatch.setattr(MemoryCrontab, "writes", 0)
+    return MemoryCrontabInstaller
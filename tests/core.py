@@ -0,0 +1,155 @@
+import subprocess
+import sys
+from pathlib import Path
+from time import monotonic, sleep
+
+from onboot import Installer, InstallerConfiguration, try_install
+from onboot.cache import CapabilityCache
+
+core_config = InstallerConfiguration(Path("/tmp/"), "myfile")
+
+
+def probe_installer(delay: float, supported: bool, installs: bool = True):
+    class ProbeInstaller(Installer):
+        autostart_directory = Path("/tmp/")
+        probed = False
+        installed = False
+
+        def is_supported(self) -> bool:
+            sleep(delay)
+            type(self).probed = True
+            return supported
+
+        def install(self) -> bool:
+            type(self).installed = True
+            return installs
+
+    return ProbeInstaller
+
+
+def test_try_install_sequential_priority():
+    first = probe_installer(0, False)
+    second = probe_installer(0, True)
+    third = probe_installer(0, True)
+    ret, used = try_install([first, second, third], core_config)
+    assert ret is True
+    assert isinstance(used, second)
+    assert not third.probed
+
+
+def test_try_install_concurrent_keeps_priority():
+    slow = probe_installer(0.2, True)
+    fast = probe_installer(0, True)
+    ret, used = try_install([slow, fast], core_config, concurrent=True)
+    assert ret is True
+    assert isinstance(used, slow)
+    assert not fast.installed
+
+
+def test_try_install_concurrent_latency():
+    installers = [probe_installer(0.2, False) for _ in range(5)] + [probe_installer(0.2, True)]
+    start = monotonic()
+    ret, used = try_install(installers, core_config, concurrent=True)
+    assert ret is True
+    assert isinstance(used, installers[-1])
+    assert monotonic() - start < 0.2 * len(installers) / 2
+
+
+def test_try_install_concurrent_falls_through_failed_install():
+    broken = probe_installer(0, True, installs=False)
+    working = probe_installer(0, True)
+    ret, used = try_install([broken, working], core_config, concurrent=True)
+    assert ret is True
+    assert isinstance(used, working)
+
+
+def test_try_install_nothing_supported():
+    assert try_install([probe_installer(0, False)], core_config, concurrent=True) == (False, None)
+
+
+def test_capability_cache_skips_probe(tmp_path):
+    probe_dir = tmp_path.joinpath("autostart")
+
+    class CountingInstaller(Installer):
+        autostart_directory = probe_dir
+        probes = 0
+
+        def is_supported(self) -> bool:
+            CountingInstaller.probes += 1
+            return self.autostart_directory.is_dir()
+
+        def install(self) -> bool:
+            return True
+
+    cache_path = tmp_path.joinpath("capabilities.json")
+    installer = CountingInstaller(core_config)
+
+    assert CapabilityCache(cache_path).is_supported(installer) is False
+    # A fresh cache instance stands in for a new process
+    assert CapabilityCache(cache_path).is_supported(installer) is False
+    assert CountingInstaller.probes == 1
+
+    # Creating the autostart directory changes the fingerprint
+    probe_dir.mkdir()
+    assert CapabilityCache(cache_path).is_supported(installer) is True
+    assert CountingInstaller.probes == 2
+
+    ret, used = try_install([CountingInstaller], core_config, cache=CapabilityCache(cache_path))
+    assert ret is True
+    assert CountingInstaller.probes == 2
+
+    cache = CapabilityCache(cache_path)
+    assert list(cache.entries()) == [f"{CountingInstaller.__module__}.{CountingInstaller.__qualname__}"]
+    cache.clear()
+    assert cache.entries() == {}
+    assert not cache_path.exists()
+
+
+def test_capability_cache_distrusts_shared_directory(tmp_path):
+    shared = tmp_path.joinpath("onboot-0")
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    cache_path = shared.joinpath("capabilities.json")
+    cache_path.write_text('{"poisoned": {"supported": true}}')
+    cache = CapabilityCache(cache_path)
+    assert cache.entries() == {}
+    cache.put(probe_installer(0, True)(core_config), True)
+    assert cache_path.read_text() == '{"poisoned": {"supported": true}}'
+    assert sorted(path.name for path in shared.iterdir()) == ["capabilities.json"]
+
+
+def test_capability_cache_is_per_root(tmp_path):
+    from onboot.linux import SystemdSystemInstaller
+    supported, bare = tmp_path.joinpath("supported"), tmp_path.joinpath("bare")
+    supported.joinpath("etc", "systemd").mkdir(parents=True)
+    bare.mkdir()
+    cache = CapabilityCache(tmp_path.joinpath("cache", "capabilities.json"))
+    assert cache.is_supported(SystemdSystemInstaller(InstallerConfiguration(Path("/opt/bin"), "a", supported)))
+    assert not cache.is_supported(SystemdSystemInstaller(InstallerConfiguration(Path("/opt/bin"), "a", bare)))
+
+
+def test_capability_cache_ttl(tmp_path):
+    cache = CapabilityCache(tmp_path.joinpath("capabilities.json"), ttl=0)
+    installer = probe_installer(0, True)(core_config)
+    cache.put(installer, True)
+    sleep(0.01)
+    assert cache.get(installer) is None
+
+
+def test_import_defers_platform_modules():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import onboot"],
+        capture_output=True, text=True, check=True,
+    )
+    imported = {line.split("|")[-1].strip() for line in result.stderr.splitlines()}
+    assert "onboot" in imported
+    for module in ("onboot.linux", "onboot.darwin", "onboot.windows", "onboot.aio", "subprocess", "ctypes", "winreg",
+                   "asyncio"):
+        assert module not in imported
+
+
+def test_lazy_exports_resolve():
+    import onboot
+    for name in onboot.__all__:
+        assert getattr(onboot, name) is not None
+    assert set(onboot.__all__) <= set(dir(onboot))
@@ -0,0 +1,38 @@
+from os import geteuid
+
+from onboot import detect
+from onboot.linux import SystemdUserInstaller, SystemdSystemInstaller, CrontabInstaller
+from onboot import InstallerConfiguration
+from pathlib import Path
+
+import subprocess
+
+
+detect_config = InstallerConfiguration(Path("/tmp/"), "myfile")
+
+
+def test_detect_is_cached():
+    detect.clear()
+    assert detect.euid() == geteuid()
+    assert detect.is_root() == (geteuid() == 0)
+    assert detect.euid.cache_info().currsize == 1
+    detect.which("sh")
+    detect.which("sh")
+    assert detect.which.cache_info().hits >= 1
+
+
+def test_detect_desktops(monkeypatch):
+    monkeypatch.setenv("XDG_CURRENT_DESKTOP", "KDE:Plasma")
+    detect.clear()
+    assert detect.desktops() == ("kde", "plasma")
+    detect.clear()
+
+
+def test_is_supported_spawns_no_processes(monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("is_supported() must not spawn processes")
+
+    monkeypatch.setattr(subprocess.Popen, "__init__", forbidden)
+    detect.clear()
+    for installer in (SystemdUserInstaller, SystemdSystemInstaller, CrontabInstaller):
+        installer(detect_config).is_supported()
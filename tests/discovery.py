@@ -0,0 +1,84 @@
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.discovery import list_installed, scan_crontab, InstalledEntry
+from onboot.linux import XDGInstaller, KDEPlasmaInstaller, ProfileInstaller, InitInstaller, SystemdUserInstaller, \
+    SystemdSystemInstaller, RcLocalInstaller, BashrcInstaller, CrontabTransaction
+
+discovery_config = InstallerConfiguration(Path("/opt/bin"), "agent")
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    for installer, attribute in [
+        (XDGInstaller, "autostart_directory"),
+        (XDGInstaller, "root_autostart_directory"),
+        (KDEPlasmaInstaller, "autostart_directory"),
+        (ProfileInstaller, "autostart_directory"),
+        (InitInstaller, "autostart_directory"),
+        (SystemdUserInstaller, "autostart_directory"),
+        (SystemdSystemInstaller, "autostart_directory"),
+        (RcLocalInstaller, "autostart_directory"),
+        (BashrcInstaller, "autostart_directory"),
+    ]:
+        directory = tmp_path.joinpath(installer.__name__, attribute)
+        directory.mkdir(parents=True)
+        monkeypatch.setattr(installer, attribute, directory)
+    return tmp_path
+
+
+def test_list_installed_file_backends(tree):
+    for installer in (XDGInstaller, KDEPlasmaInstaller, ProfileInstaller, InitInstaller):
+        assert installer(discovery_config).install()
+    for installer in (SystemdUserInstaller, SystemdSystemInstaller):
+        i = installer(discovery_config)
+        i.get_autostart_path().write_text(i.render())
+    # Foreign files are ignored
+    InitInstaller.autostart_directory.joinpath("cron").write_text("#!/bin/sh\nexec cron\n")
+
+    entries = list_installed(crontab=False)
+    assert sorted(e.backend for e in entries) == sorted([
+        "XDGInstaller", "KDEPlasmaInstaller", "ProfileInstaller", "InitInstaller",
+        "SystemdUserInstaller", "SystemdSystemInstaller",
+    ])
+    assert all(e.name == "agent" and e.command == "/opt/bin/agent" for e in entries)
+
+
+def test_list_installed_rc_files(tree):
+    RcLocalInstaller.autostart_directory.joinpath("rc.local").write_text("#!/bin/sh -e\n\nexit 0\n")
+    BashrcInstaller.autostart_directory.joinpath(".bashrc").write_text("alias ll='ls -l'\n")
+    assert RcLocalInstaller(discovery_config).install()
+    assert BashrcInstaller(discovery_config).install()
+
+    entries = list_installed(crontab=False)
+    assert entries == [
+        InstalledEntry("RcLocalInstaller", "agent", RcLocalInstaller(discovery_config).get_autostart_path(),
+                       "/opt/bin/agent"),
+        InstalledEntry("BashrcInstaller", "agent", BashrcInstaller(discovery_config).get_autostart_path(),
+                       "/opt/bin/agent"),
+    ]
+
+
+def test_scan_crontab():
+    class StaticCrontab(CrontabTransaction):
+        def _read_table(self) -> str:
+            return f"0 * * * * /usr/bin/backup\n{CrontabTransaction.entry(discovery_config)}\n"
+
+    assert list(scan_crontab(StaticCrontab)) == [
+        InstalledEntry("CrontabInstaller", "agent", Path("crontab"), "/opt/bin/agent"),
+    ]
+
+
+def test_scan_scheduled_crontab():
+    from onboot.options import Schedule
+    scheduled = InstallerConfiguration(Path("/opt/bin"), "agent", schedule=Schedule(interval=300))
+
+    class StaticCrontab(CrontabTransaction):
+        def _read_table(self) -> str:
+            return f"{CrontabTransaction.entry(scheduled)}\n# @reboot /opt/bin/old # onboot:old\n"
+
+    assert list(scan_crontab(StaticCrontab)) == [
+        InstalledEntry("CrontabInstaller", "agent", Path("crontab"), "/opt/bin/agent"),
+    ]
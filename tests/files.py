@@ -0,0 +1,38 @@
+from os import stat
+
+from onboot.files import atomic_write
+
+
+def test_atomic_write_skips_unchanged(tmp_path):
+    path = tmp_path.joinpath("unit.service")
+    assert atomic_write(path, "[Unit]\n") is True
+    inode = stat(path).st_ino
+    assert atomic_write(path, "[Unit]\n") is False
+    assert stat(path).st_ino == inode
+
+    assert atomic_write(path, "[Unit]\nDescription=x\n", fsync=False) is True
+    assert path.read_text() == "[Unit]\nDescription=x\n"
+    assert stat(path).st_ino != inode
+    assert [p.name for p in tmp_path.iterdir()] == ["unit.service"]
+
+
+def test_atomic_write_mode(tmp_path):
+    path = tmp_path.joinpath("script.sh")
+    atomic_write(path, "#!/bin/sh\n")
+    assert stat(path).st_mode & 0o777 == 0o644
+    # A mode change alone is enough to rewrite
+    assert atomic_write(path, "#!/bin/sh\n", 0o755) is True
+    assert stat(path).st_mode & 0o777 == 0o755
+    # Without an explicit mode the current one is kept
+    assert atomic_write(path, "#!/bin/sh\necho\n") is True
+    assert stat(path).st_mode & 0o777 == 0o755
+
+
+def test_atomic_write_through_symlink(tmp_path):
+    target = tmp_path.joinpath("dotfiles", "unit")
+    target.parent.mkdir()
+    target.write_text("old")
+    link = tmp_path.joinpath("unit")
+    link.symlink_to(target)
+    assert atomic_write(link, "new")
+    assert link.is_symlink() and target.read_text() == "new"
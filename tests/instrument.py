@@ -0,0 +1,108 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from onboot import Installer, InstallerConfiguration, try_install
+from onboot.instrument import Recorder
+from onboot.linux import BashrcInstaller, XDGInstaller
+from onboot.runner import SubprocessRunner
+
+config = InstallerConfiguration(Path("/usr/bin"), "myapp")
+
+
+@pytest.fixture(autouse=True)
+def isolated_locks(tmp_path, monkeypatch):
+    monkeypatch.setenv("ONBOOT_LOCK_DIR", str(tmp_path.joinpath("locks")))
+
+
+class Unsupported(Installer):
+    def is_supported(self) -> bool:
+        return False
+
+    def install(self) -> bool:
+        return True
+
+
+class Failing(Installer):
+    def is_supported(self) -> bool:
+        return True
+
+    def install(self) -> bool:
+        return False
+
+
+def test_try_install_records_probes_and_skips(tmp_path, monkeypatch):
+    monkeypatch.setattr(XDGInstaller, "autostart_directory", tmp_path)
+    monkeypatch.setattr(XDGInstaller, "root_autostart_directory", tmp_path)
+    with Recorder() as recorder:
+        ret, used = try_install([Unsupported, Failing, XDGInstaller], config)
+    assert ret is True
+
+    skips = {(event.installer.rsplit(".", 1)[-1], event.reason) for event in recorder.events if event.kind == "skip"}
+    assert skips == {("Unsupported", "unsupported"), ("Failing", "install-failed")}
+    kinds = [event.kind for event in recorder.events if (event.installer or "").endswith("XDGInstaller")]
+    assert kinds == ["probe", "write", "install"]
+
+    counters = recorder.counters()
+    assert counters["probe.count"] == 3
+    assert counters["install.count"] == 2
+    assert counters["skip.unsupported"] == 1
+    assert counters["write.bytes"] == len(used.render())
+
+
+def test_bytes_read_and_written(tmp_path):
+    rc = tmp_path.joinpath(".bashrc")
+    rc.write_text("alias ll='ls -l'\n")
+    installer = type("HomeBashrc", (BashrcInstaller,), {"autostart_directory": tmp_path})
+    events = []
+    with Recorder(callback=events.append, keep=False) as recorder:
+        assert installer(config).install()
+    assert recorder.events == []
+    reads = [event.bytes for event in events if event.kind == "read"]
+    writes = [event.bytes for event in events if event.kind == "write"]
+    assert reads == [17, 17]
+    assert writes == [rc.stat().st_size]
+    assert all(event.path == str(rc) for event in events)
+
+
+def test_subprocesses_are_recorded():
+    with Recorder() as recorder:
+        SubprocessRunner().run([sys.executable, "-c", "pass"])
+    [event] = recorder.events
+    assert event.kind == "subprocess" and event.ok is True
+    assert event.argv == (sys.executable, "-c", "pass")
+    assert event.duration > 0
+    assert event.to_dict()["argv"] == event.argv
+
+
+def test_nothing_recorded_without_recorder(tmp_path, monkeypatch):
+    monkeypatch.setattr(XDGInstaller, "autostart_directory", tmp_path)
+    monkeypatch.setattr(XDGInstaller, "root_autostart_directory", tmp_path)
+    recorder = Recorder()
+    assert try_install([XDGInstaller], config)[0]
+    assert recorder.events == []
+
+
+def test_nested_events_are_tagged_with_their_installer(tmp_path, monkeypatch):
+    from onboot.runner import run
+
+    class Spawning(XDGInstaller):
+        autostart_directory = root_autostart_directory = tmp_path
+
+        def is_supported(self) -> bool:
+            run([sys.executable, "-c", "pass"])
+            return True
+
+        def install(self) -> bool:
+            run([sys.executable, "-c", "pass"])
+            return super().install()
+
+    with Recorder() as recorder:
+        ret, used = try_install([Spawning], config, concurrent=True)
+    assert ret is True
+    name = f"{__name__}.test_nested_events_are_tagged_with_their_installer.<locals>.Spawning"
+    counters = recorder.counters()
+    assert counters[f"{name}.subprocess.count"] == 2
+    assert counters[f"{name}.write.bytes"] == len(used.render())
+    assert all(event.name == "myapp" for event in recorder.events)
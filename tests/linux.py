@@ -1,9 +1,15 @@
 from pathlib import Path
 
 from onboot import InstallerConfiguration
-from onboot.linux import XDGInstaller, CrontabInstaller, ProfileInstaller, KDEPlasmaInstaller, InitInstaller
+from onboot.linux import XDGInstaller, CrontabInstaller, ProfileInstaller, KDEPlasmaInstaller, InitInstaller, \
+    CrontabTransaction, SystemdSystemInstaller, RcLocalInstaller, parse_install_section
+from onboot.discovery import list_installed
+from onboot.runner import CommandError, RecordingRunner, use_runner
+from os import readlink
 from os.path import isfile
 
+import pytest
+
 
 xdg_config = InstallerConfiguration(Path("/tmp/"), "myfile")
 
@@ -76,3 +82,174 @@ def test_init_uninstall():
     if installer.is_supported():
         installer.uninstall()
         assert not isfile(installer.get_autostart_path())
+
+
+def test_crontab_transaction_batch(memory_crontab):
+    crontab = memory_crontab.transaction
+    crontab.table = "0 * * * * /usr/bin/backup\n"
+    configs = [InstallerConfiguration(Path("/opt/bin"), f"app{i}") for i in range(50)]
+
+    assert all(memory_crontab.install_many(configs).values())
+    assert crontab.writes == 1
+    lines = crontab.table.splitlines()
+    assert lines[0] == "0 * * * * /usr/bin/backup"
+    assert len(lines) == 51
+
+    # Reinstalling the same entries must not touch the table
+    assert all(memory_crontab.install_many(configs).values())
+    assert crontab.writes == 1
+
+    assert memory_crontab(configs[0]).uninstall()
+    assert crontab.writes == 2
+    assert CrontabTransaction.entry(configs[0]) not in crontab.table
+    assert CrontabTransaction.entry(configs[1]) in crontab.table
+
+
+def test_crontab_transaction_removes_legacy_entries(memory_crontab):
+    crontab = memory_crontab.transaction
+    config = InstallerConfiguration(Path("/opt/bin"), "legacy")
+    crontab.table = "@reboot /opt/bin/legacy\n@reboot /opt/bin/other\n"
+    with crontab() as ct:
+        assert ct.remove(config)
+    assert crontab.table == "@reboot /opt/bin/other\n"
+
+
+def test_crontab_schedule_replaces_entry(memory_crontab):
+    from onboot.options import Schedule
+    crontab = memory_crontab.transaction
+    assert memory_crontab(InstallerConfiguration(Path("/opt/bin"), "app")).install()
+    scheduled = InstallerConfiguration(Path("/opt/bin"), "app", schedule=Schedule(calendar="hourly"))
+    assert memory_crontab(scheduled).install()
+    assert crontab.table == "@hourly /opt/bin/app # onboot:app\n"
+    assert memory_crontab(scheduled).uninstall()
+    assert crontab.table == ""
+
+
+@pytest.fixture
+def runner():
+    fake = RecordingRunner()
+    with use_runner(fake):
+        yield fake
+
+
+def forbidden(args, input):
+    raise AssertionError(f"must not run {args}")
+
+
+class FakeSystemctl:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def __call__(self, args, input):
+        if self.failing & set(args):
+            raise CommandError(args, 1)
+        if "enable" in args:
+            for unit in args[args.index("enable") + 1:]:
+                link = SystemdSystemInstaller.autostart_directory.joinpath("default.target.wants", unit)
+                if unit.endswith(".service") and not link.is_symlink():
+                    link.parent.mkdir(exist_ok=True)
+                    link.symlink_to(SystemdSystemInstaller.autostart_directory.joinpath(unit))
+        return b""
+
+
+def test_systemd_install_many_single_transaction(tmp_path, monkeypatch, runner):
+    runner.handler = FakeSystemctl()
+    fake = runner
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    configs = [InstallerConfiguration(Path("/opt/bin"), f"unit{i}") for i in range(200)]
+
+    results = SystemdSystemInstaller.install_many(configs)
+    assert all(results.values()) and len(results) == 200
+    assert fake.calls == [("systemctl", "enable") + tuple(f"unit{i}.service" for i in range(200))]
+
+    # Unchanged and already enabled: nothing to do
+    fake.calls.clear()
+    SystemdSystemInstaller.install_many(configs)
+    assert fake.calls == []
+
+    fake.calls.clear()
+    SystemdSystemInstaller.install_many(configs[:2], now=True)
+    assert fake.calls == [("systemctl", "enable", "--now", "unit0.service", "unit1.service")]
+
+
+def test_systemd_install_many_reports_failed_units(tmp_path, monkeypatch, runner):
+    runner.handler = FakeSystemctl(failing=["bad.service"])
+    fake = runner
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    configs = [InstallerConfiguration(Path("/opt/bin"), name) for name in ("good", "bad")]
+
+    assert SystemdSystemInstaller.install_many(configs) == {"good": True, "bad": False}
+
+    fake.calls.clear()
+    assert SystemdSystemInstaller.uninstall_many(configs) == {"good": True, "bad": False}
+    assert fake.calls[0] == ("systemctl", "disable", "good.service", "bad.service")
+    assert fake.calls[-1] == ("systemctl", "daemon-reload")
+    assert not tmp_path.joinpath("good.service").exists()
+    assert tmp_path.joinpath("bad.service").exists()
+
+
+class OfflineSystemdInstaller(SystemdSystemInstaller):
+    offline = True
+
+
+def test_parse_install_section():
+    unit = "[Unit]\nDescription=x\n[Install]\nWantedBy=multi-user.target graphical.target\nAlias=y.service\n"
+    assert parse_install_section(unit) == {"WantedBy": ["multi-user.target", "graphical.target"],
+                                           "Alias": ["y.service"]}
+
+
+def test_systemd_offline_enable(tmp_path, monkeypatch, runner):
+    runner.handler = forbidden
+    monkeypatch.setattr(OfflineSystemdInstaller, "autostart_directory", tmp_path)
+    installer = OfflineSystemdInstaller(InstallerConfiguration(Path("/opt/bin"), "agent"))
+
+    assert installer.install()
+    link = tmp_path.joinpath("default.target.wants", "agent.service")
+    assert link.is_symlink()
+    assert link.resolve() == installer.get_autostart_path()
+    assert installer.is_enabled()
+
+    assert installer.uninstall()
+    assert not link.is_symlink()
+    assert not tmp_path.joinpath("default.target.wants").exists()
+    assert not installer.get_autostart_path().exists()
+
+
+def test_sysroot_install(tmp_path, monkeypatch, runner):
+    runner.handler = forbidden
+    for directory in ("etc/init.d", "etc/profile.d", "etc/xdg/autostart", "etc/systemd", "var/spool/cron"):
+        tmp_path.joinpath(directory).mkdir(parents=True)
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=tmp_path)
+
+    for installer in (InitInstaller, ProfileInstaller, XDGInstaller, SystemdSystemInstaller, CrontabInstaller,
+                      RcLocalInstaller):
+        assert installer(config).is_supported()
+        assert installer(config).install()
+
+    assert tmp_path.joinpath("etc/init.d/agent").is_file()
+    assert tmp_path.joinpath("etc/profile.d/agent").is_file()
+    assert tmp_path.joinpath("etc/xdg/autostart/agent.desktop").is_file()
+    assert "/opt/bin/agent &" in tmp_path.joinpath("etc/rc.local").read_text()
+    assert tmp_path.joinpath("var/spool/cron/crontabs/root").read_text() == \
+        f"{CrontabTransaction.entry(config)}\n"
+    link = tmp_path.joinpath("etc/systemd/system/default.target.wants/agent.service")
+    assert readlink(link) == "/etc/systemd/system/agent.service"
+
+    assert sorted(e.backend for e in list_installed(root=tmp_path)) == [
+        "CrontabInstaller", "InitInstaller", "ProfileInstaller", "RcLocalInstaller", "SystemdSystemInstaller",
+        "XDGInstaller",
+    ]
+
+
+def test_crontab_spool_keeps_foreign_bytes(tmp_path):
+    config = InstallerConfiguration(Path("/opt/bin"), "app", tmp_path)
+    spool = CrontabInstaller(config).get_spool_path()
+    spool.parent.mkdir(parents=True)
+    spool.write_bytes(b"# caf\xe9\n")
+    assert CrontabInstaller(config).install()
+    assert spool.read_bytes() == b"# caf\xe9\n@reboot /opt/bin/app # onboot:app\n"
+
+
+def test_crontab_entry_quotes_the_path():
+    config = InstallerConfiguration(Path("/opt/my app;x"), "a%b")
+    assert CrontabTransaction.entry(config) == "@reboot '/opt/my app;x/a\\%b' # onboot:a%b"
@@ -0,0 +1,130 @@
+from multiprocessing import get_context
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.blocks import scan_block
+from onboot.linux import BashrcInstaller, CrontabInstaller
+from onboot.lock import LockTimeout, locked, locked_file
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("ONBOOT_LOCK_DIR", str(tmp_path.joinpath("locks")))
+
+
+def _hold(resource, acquired, release):
+    with locked(resource):
+        acquired.set()
+        release.wait(10)
+
+
+def test_lock_times_out_while_held_by_another_process():
+    ctx = get_context("fork")
+    acquired, release = ctx.Event(), ctx.Event()
+    holder = ctx.Process(target=_hold, args=("crontab:0", acquired, release))
+    holder.start()
+    try:
+        assert acquired.wait(10)
+        with pytest.raises(LockTimeout):
+            with locked("crontab:0", timeout=0.1):
+                pass
+        # Other resources are not affected
+        with locked("crontab:1", timeout=0.1):
+            pass
+    finally:
+        release.set()
+        holder.join()
+    with locked("crontab:0", timeout=1):
+        pass
+
+
+def test_lock_timeout_fails_the_install(tmp_path):
+    ctx = get_context("fork")
+    rc = tmp_path.joinpath(".bashrc")
+    rc.write_text("")
+    acquired, release = ctx.Event(), ctx.Event()
+    holder = ctx.Process(target=_hold, args=(str(rc.absolute()), acquired, release))
+    holder.start()
+    try:
+        assert acquired.wait(10)
+        impatient = type("ImpatientBashrc", (BashrcInstaller,), {"autostart_directory": tmp_path, "lock_timeout": 0.1})
+        assert impatient.install_many([InstallerConfiguration(Path("/usr/bin"), "late")]) == {"late": False}
+    finally:
+        release.set()
+        holder.join()
+    assert rc.read_text() == ""
+
+
+def _add_entries(home, names):
+    installer = type("HomeBashrc", (BashrcInstaller,), {"autostart_directory": home})
+    for name in names:
+        assert installer(InstallerConfiguration(Path("/usr/bin"), name)).install()
+
+
+def test_parallel_processes_keep_every_entry(tmp_path):
+    rc = tmp_path.joinpath(".bashrc")
+    rc.write_text("# user config\n")
+    ctx = get_context("fork")
+    workers = [ctx.Process(target=_add_entries, args=(tmp_path, [f"w{i}-{j}" for j in range(10)]))
+               for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+    entries, found, _ = scan_block(rc)
+    assert found
+    assert len(entries) == 40
+
+
+def test_crontab_lock_resource(tmp_path):
+    assert CrontabInstaller.lock_resource().startswith("crontab:")
+    assert CrontabInstaller.lock_resource(tmp_path) == str(tmp_path.joinpath("var/spool/cron/crontabs/root"))
+    with locked_file(tmp_path.joinpath("x")) as path:
+        assert path.parent == tmp_path.joinpath("locks")
+
+
+def test_lock_directory_is_private(tmp_path, monkeypatch):
+    from os import stat
+    from onboot import detect
+    from onboot.cache import CapabilityCache, is_private
+    # Older versions left /tmp/onboot-<euid> 0755
+    tmp_path.joinpath(f"onboot-{detect.euid()}").mkdir()
+    tmp_path.joinpath(f"onboot-{detect.euid()}").chmod(0o755)
+    monkeypatch.delenv("ONBOOT_LOCK_DIR")
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr("onboot.lock.gettempdir", lambda: str(tmp_path))
+    monkeypatch.setattr("onboot.cache.gettempdir", lambda: str(tmp_path))
+    monkeypatch.setattr("onboot.detect.is_root", lambda: False)
+    with locked("crontab:0") as path:
+        assert is_private(path.parent) and is_private(path.parent.parent)
+        assert stat(path.parent.parent).st_mode & 0o777 == 0o700
+    # The cache shares the directory and still trusts it
+    cache = CapabilityCache()
+    assert cache.path.parent == path.parent.parent
+    cache.put(BashrcInstaller(InstallerConfiguration(Path("/opt/bin"), "a")), True)
+    assert cache.path.is_file()
+
+
+def test_planted_lock_directory_is_refused(tmp_path, monkeypatch):
+    planted = tmp_path.joinpath("planted")
+    planted.mkdir()
+    planted.chmod(0o777)
+    monkeypatch.setenv("ONBOOT_LOCK_DIR", str(planted))
+    with pytest.raises(PermissionError):
+        with locked("crontab:0"):
+            pass
+
+
+def test_lock_file_symlink_is_not_followed(tmp_path):
+    from onboot.lock import lock_path
+    victim = tmp_path.joinpath("victim")
+    path = lock_path("crontab:0")
+    path.parent.mkdir(mode=0o700)
+    path.symlink_to(victim)
+    with pytest.raises(OSError):
+        with locked("crontab:0"):
+            pass
+    assert not victim.exists()
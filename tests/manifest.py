@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import pytest
+
+from onboot import Installer, InstallerConfiguration, try_install, status, uninstall
+from onboot.manifest import Manifest
+
+
+class DirectoryInstaller(Installer):
+    autostart_directory: Path
+
+    def install(self) -> bool:
+        return self.write_file(self.get_autostart_path(), f"#!/bin/sh\n{self.config.get_path()}\n")
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    DirectoryInstaller.autostart_directory = tmp_path.joinpath("autostart")
+    DirectoryInstaller.autostart_directory.mkdir()
+    return Manifest()
+
+
+def test_manifest_records_try_install(manifest):
+    config = InstallerConfiguration(Path("/opt/bin"), "agent")
+    ret, used = try_install([DirectoryInstaller], config)
+    assert ret is True
+
+    entry = status("agent")
+    assert entry.installer == f"{__name__}:DirectoryInstaller"
+    assert entry.target == str(used.get_autostart_path())
+    assert entry.is_present()
+    assert not entry.is_modified()
+
+    used.get_autostart_path().write_text("#!/bin/sh\n/somewhere/else\n")
+    assert status("agent").is_modified()
+
+
+def test_manifest_uninstall_by_name(manifest):
+    config = InstallerConfiguration(Path("/opt/bin"), "agent")
+    try_install([DirectoryInstaller], config)
+    path = DirectoryInstaller(config).get_autostart_path()
+    assert path.is_file()
+
+    assert uninstall("agent") is True
+    assert not path.exists()
+    assert status("agent") is None
+    assert uninstall("agent") is False
+
+
+def test_manifest_fold_and_compact(manifest):
+    manifest.compact_threshold = 10
+    for i in range(20):
+        config = InstallerConfiguration(Path("/opt/bin"), f"agent{i % 3}")
+        DirectoryInstaller(config).install()
+        manifest.record(DirectoryInstaller(config))
+    manifest.forget("agent2")
+
+    reloaded = Manifest(manifest.path)
+    assert sorted(e.name for e in reloaded.entries()) == ["agent0", "agent1"]
+    assert len(manifest.path.read_text().splitlines()) < 20
+
+
+def test_manifest_uninstall_root_install(manifest, tmp_path):
+    from onboot.options import ResourceControl, Stagger
+    host = DirectoryInstaller.autostart_directory
+    image = tmp_path.joinpath("image")
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=image, stagger=Stagger(delay=5, concurrency=2),
+                                    resources=ResourceControl(cpu_affinity=[0, 1], environment={"A": "1"}))
+    installer = DirectoryInstaller(config)
+    installer.get_autostart_directory().mkdir(parents=True)
+    host.joinpath("agent").write_text("host copy")
+    assert try_install([DirectoryInstaller], config)[0]
+
+    restored = Manifest().get("agent").config()
+    assert (restored.root, restored.stagger, restored.resources) == (image, config.stagger, config.resources)
+    assert uninstall("agent") is True
+    assert not installer.get_autostart_path().exists()
+    assert host.joinpath("agent").read_text() == "host copy"
+
+
+def test_manifest_keeps_same_name_per_target(manifest, tmp_path):
+    roots = [tmp_path.joinpath("image1"), tmp_path.joinpath("image2")]
+    installers = [DirectoryInstaller(InstallerConfiguration(Path("/opt/bin"), "agent", root=root)) for root in roots]
+    for installer in installers:
+        installer.get_autostart_directory().mkdir(parents=True)
+        assert try_install([DirectoryInstaller], installer.config)[0]
+    targets = [installer.get_target() for installer in installers]
+
+    assert sorted(e.target for e in Manifest().find("agent")) == sorted(targets)
+    assert status("agent", target=targets[0]).root == str(roots[0])
+    assert uninstall("agent", target=targets[0]) is True
+    assert not installers[0].get_autostart_path().exists()
+    assert installers[1].get_autostart_path().exists()
+    assert [e.target for e in Manifest().find("agent")] == [targets[1]]
+
+    assert uninstall("agent") is True
+    assert not installers[1].get_autostart_path().exists()
+    assert status("agent") is None
+
+
+def test_manifest_compaction_keeps_other_writers(manifest):
+    other = Manifest(manifest.path)
+    manifest.compact_threshold = 10
+    manifest.entries()
+    other.record(DirectoryInstaller(InstallerConfiguration(Path("/opt/bin"), "from_b")))
+    for i in range(20):
+        manifest.record(DirectoryInstaller(InstallerConfiguration(Path("/opt/bin"), "agent")))
+    assert len(manifest.path.read_text().splitlines()) < 20
+    assert sorted(e.name for e in Manifest(manifest.path).entries()) == ["agent", "from_b"]
@@ -0,0 +1,297 @@
+from os import environ
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.linux import SystemdSystemInstaller, SystemdUserInstaller
+from onboot.options import PathActivation, ResourceControl, Schedule, SliceLimits, SocketActivation, Stagger, \
+    staggered
+
+GOLDEN = Path(__file__).parent.joinpath("golden")
+
+
+def assert_golden(name: str, text: str):
+    # ONBOOT_UPDATE_GOLDEN=1 rewrites the expected files after an intended change
+    path = GOLDEN.joinpath(name)
+    if environ.get("ONBOOT_UPDATE_GOLDEN"):
+        path.write_text(text)
+    assert text == path.read_text()
+
+
+def unit(resources=None, installer=SystemdSystemInstaller, directory="/opt/bin") -> str:
+    return installer(InstallerConfiguration(Path(directory), "agent", resources=resources)).render()
+
+
+def test_default_unit_golden():
+    assert_golden("default.service", unit())
+
+
+def test_resource_control_golden():
+    resources = ResourceControl(nice=10, cpu_affinity=[0, 2], cpu_weight=20, io_scheduling_class="idle",
+                                memory_max="512M", tasks_max=64, oom_score_adjust=500,
+                                environment={"AGENT_MODE": "quiet", "GREETING": 'say "hi" 100%'})
+    assert_golden("resources.service", unit(resources))
+    assert unit(resources, SystemdUserInstaller) == unit(resources)
+
+
+def test_resource_control_partial_golden():
+    resources = ResourceControl(cpu_weight="idle", memory_max="infinity", tasks_max="20%")
+    assert_golden("resources-partial.service", unit(resources, directory="/opt/my apps"))
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"nice": 20},
+    {"nice": -21},
+    {"nice": "5"},
+    {"cpu_affinity": []},
+    {"cpu_affinity": [-1]},
+    {"cpu_weight": 0},
+    {"cpu_weight": "max"},
+    {"io_scheduling_class": "fast"},
+    {"memory_max": "1X"},
+    {"memory_max": "-1"},
+    {"tasks_max": 0},
+    {"oom_score_adjust": 1001},
+    {"environment": {"1BAD": "x"}},
+    {"environment": {"A=B": "x"}},
+    {"environment": {"OK": "two\nlines"}},
+])
+def test_resource_control_validation(kwargs):
+    with pytest.raises(ValueError):
+        ResourceControl(**kwargs)
+
+
+def test_resource_control_changes_are_reinstalled(tmp_path, monkeypatch):
+    from onboot.runner import RecordingRunner, use_runner
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    config = InstallerConfiguration(Path("/opt/bin"), "agent")
+    limited = InstallerConfiguration(Path("/opt/bin"), "agent", resources=ResourceControl(memory_max=1 << 30))
+    with use_runner(RecordingRunner()) as runner:
+        SystemdSystemInstaller(config).install()
+        runner.calls.clear()
+        assert SystemdSystemInstaller(limited).install()
+    assert "MemoryMax=1073741824\n" in tmp_path.joinpath("agent.service").read_text()
+    assert runner.calls[0] == ("systemctl", "daemon-reload")
+
+
+def test_slice_golden():
+    limits = SliceLimits(cpu_quota=200, memory_max="2G", tasks_max=512)
+    installer = SystemdSystemInstaller(InstallerConfiguration(Path("/opt/bin"), "agent", slice_limits=limits))
+    assert installer.get_slice_path().name == "onboot.slice"
+    assert_golden("onboot.slice", installer.render_slice())
+
+
+def test_slice_is_optional():
+    class Unsliced(SystemdSystemInstaller):
+        slice_name = None
+    assert "Slice=" not in unit(installer=Unsliced)
+    assert Unsliced(InstallerConfiguration(Path("/opt/bin"), "agent")).get_slice_path() is None
+
+
+@pytest.mark.parametrize("kwargs", [{"cpu_quota": 0}, {"io_weight": 10001}, {"memory_high": "lots"}])
+def test_slice_limits_validation(kwargs):
+    with pytest.raises(ValueError):
+        SliceLimits(**kwargs)
+
+
+def test_slice_limit_changes_reload(tmp_path, monkeypatch):
+    from onboot.runner import RecordingRunner, use_runner
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    config = InstallerConfiguration(Path("/opt/bin"), "agent")
+    with use_runner(RecordingRunner()) as runner:
+        SystemdSystemInstaller(config).install()
+        assert not tmp_path.joinpath("onboot.slice").exists()
+        runner.calls.clear()
+        limited = InstallerConfiguration(Path("/opt/bin"), "agent", slice_limits=SliceLimits(memory_max="1G"))
+        assert SystemdSystemInstaller(limited).install()
+    assert "MemoryMax=1G\n" in tmp_path.joinpath("onboot.slice").read_text()
+    assert runner.calls[0] == ("systemctl", "daemon-reload")
+
+
+def activated(tmp_path, activation, name="agent") -> SystemdSystemInstaller:
+    return SystemdSystemInstaller(InstallerConfiguration(Path("/opt/bin"), name, root=tmp_path, activation=activation))
+
+
+def test_socket_activation_golden(tmp_path):
+    installer = activated(tmp_path, SocketActivation(listen_stream=[8080, "/run/agent.sock"], listen_datagram=["[::]:53"]))
+    assert installer.get_unit_name() == "agent.socket"
+    assert_golden("activated.service", installer.render())
+    assert_golden("agent.socket", installer.render_trigger())
+
+
+def test_path_activation_golden(tmp_path):
+    installer = activated(tmp_path, PathActivation(path_exists=["/var/spool/agent/go"],
+                                                   directory_not_empty=[Path("/var/spool/agent/in")]))
+    assert installer.get_unit_name() == "agent.path"
+    assert_golden("agent.path", installer.render_trigger())
+
+
+@pytest.mark.parametrize("activation, kwargs", [
+    (SocketActivation, {}),
+    (SocketActivation, {"listen_stream": [0]}),
+    (SocketActivation, {"listen_stream": ["two words"]}),
+    (PathActivation, {}),
+    (PathActivation, {"path_exists": ["relative/path"]}),
+    (PathActivation, {"path_changed": ["/a\nb"]}),
+])
+def test_activation_validation(activation, kwargs):
+    with pytest.raises(ValueError):
+        activation(**kwargs)
+
+
+def test_activation_pair_is_enabled_and_removed_together(tmp_path):
+    installer = activated(tmp_path, SocketActivation(listen_stream=[8080]))
+    units = tmp_path.joinpath("etc", "systemd", "system")
+    assert installer.install()
+    assert units.joinpath("agent.service").is_file()
+    assert units.joinpath("sockets.target.wants", "agent.socket").is_symlink()
+    assert not units.joinpath("default.target.wants").exists()
+    assert installer.is_enabled()
+
+    assert installer.uninstall()
+    assert sorted(units.iterdir()) == []
+
+
+def test_switching_activation_replaces_the_trigger(tmp_path):
+    units = tmp_path.joinpath("etc", "systemd", "system")
+    assert activated(tmp_path, None).install()
+    assert units.joinpath("default.target.wants", "agent.service").is_symlink()
+
+    assert activated(tmp_path, SocketActivation(listen_stream=[8080])).install()
+    assert not units.joinpath("default.target.wants").exists()
+
+    installer = activated(tmp_path, PathActivation(path_exists=["/tmp/go"]))
+    assert installer.install()
+    assert sorted(path.name for path in units.iterdir()) == ["agent.path", "agent.service", "paths.target.wants"]
+
+    # Uninstalling by name alone still finds the trigger
+    assert activated(tmp_path, None).uninstall()
+    assert sorted(units.iterdir()) == []
+
+
+def test_activation_online_commands(tmp_path, monkeypatch):
+    from onboot.runner import RecordingRunner, use_runner
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", activation=SocketActivation(listen_stream=[8080]))
+    with use_runner(RecordingRunner()) as runner:
+        assert SystemdSystemInstaller.install_many([config], now=True)["agent"]
+        assert SystemdSystemInstaller.uninstall_many([config], now=True)["agent"]
+    assert runner.calls == [("systemctl", "enable", "--now", "agent.socket"),
+                            ("systemctl", "disable", "--now", "agent.socket", "agent.service"),
+                            ("systemctl", "daemon-reload")]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stagger_timer_golden(tmp_path):
+    installer = activated(tmp_path, None)
+    installer.config.stagger = Stagger(delay=30, jitter=15)
+    assert installer.get_unit_name() == "agent.timer"
+    assert "WantedBy=" not in installer.render()
+    assert_golden("agent.timer", installer.render_trigger())
+    assert "OnStartupSec=30\n" in SystemdUserInstaller(installer.config).render_trigger()
+
+
+def test_stagger_sleep_command():
+    import subprocess
+    assert Stagger(delay=5).sleep_command() == "sleep 5"
+    command = Stagger(delay=5, jitter=3).sleep_command().replace("sleep", "echo", 1)
+    seconds = {int(subprocess.run(["sh", "-c", command], capture_output=True, check=True).stdout) for _ in range(20)}
+    assert seconds <= {5, 6, 7, 8} and len(seconds) > 1
+
+
+def test_stagger_backends():
+    from onboot.linux import CrontabTransaction, InitInstaller, RcLocalInstaller, XDGInstaller
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", stagger=Stagger(delay=20, jitter=10))
+    assert CrontabTransaction.entry(config) == \
+        "@reboot sleep $((20 + $(od -An -N4 -tu4 /dev/urandom) \\% 11)); /opt/bin/agent # onboot:agent"
+    assert RcLocalInstaller(config).get_entry().startswith("(sleep $((20 + ")
+    assert InitInstaller(config).render().endswith("; exec /opt/bin/agent) &")
+    assert "Exec=/bin/sh -c \"sleep \\\\$((20 + \\\\$(od" in XDGInstaller(config).render()
+
+    fixed = InstallerConfiguration(Path("/opt/bin"), "agent", stagger=Stagger(delay=20))
+    assert "Exec=/bin/sh -c \"sleep 20; exec \\\\\"\\\\$0\\\\\"\" /opt/bin/agent\n" in XDGInstaller(fixed).render()
+    assert CrontabTransaction.entry(fixed) == "@reboot sleep 20; /opt/bin/agent # onboot:agent"
+
+
+def test_stagger_concurrency_waves():
+    stagger = Stagger(delay=10, jitter=5, concurrency=2, window=30)
+    configs = [InstallerConfiguration(Path("/opt/bin"), f"agent{i}", stagger=stagger) for i in range(5)]
+    assert len(dict(SystemdSystemInstaller.render_many(configs))) == 5
+    delays = [config.stagger.delay for config in staggered(configs)]
+    assert delays == [10, 10, 40, 40, 70]
+    assert configs[4].stagger is stagger
+
+
+def test_stagger_validation():
+    for kwargs in ({"delay": -1}, {"jitter": 1.5}, {"concurrency": 0}):
+        with pytest.raises(ValueError):
+            Stagger(**kwargs)
+
+
+def test_schedule_timer_golden(tmp_path):
+    installer = activated(tmp_path, None)
+    installer.config.schedule = Schedule(interval=900, calendar="Mon..Fri 09:00", accuracy=300)
+    installer.config.stagger = Stagger(delay=60, jitter=30)
+    assert installer.get_unit_name() == "agent.timer"
+    assert_golden("scheduled.timer", installer.render_trigger())
+
+
+@pytest.mark.parametrize("schedule, expression", [
+    (Schedule(interval=60), "* * * * *"),
+    (Schedule(interval=900), "*/15 * * * *"),
+    (Schedule(interval=3600), "0 * * * *"),
+    (Schedule(interval=6 * 3600), "0 */6 * * *"),
+    (Schedule(interval=86400), "@daily"),
+    (Schedule(calendar="weekly"), "@weekly"),
+    (Schedule(calendar="*-*-* 04:30", cron="30 4 * * *"), "30 4 * * *"),
+])
+def test_schedule_cron_expression(schedule, expression):
+    assert schedule.cron_expression() == expression
+
+
+def test_schedule_without_cron_equivalent():
+    for schedule in (Schedule(interval=7 * 60), Schedule(calendar="Mon 09:00")):
+        with pytest.raises(ValueError):
+            schedule.cron_expression()
+    with pytest.raises(ValueError):
+        Schedule(cron="@hourly").timer()
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"interval": 0}, {"accuracy": 0}, {"calendar": ""}, {"cron": "* * *"},
+                                    {"cron": "0 0 * * * date +%d"}])
+def test_schedule_validation(kwargs):
+    with pytest.raises(ValueError):
+        Schedule(**kwargs)
+
+
+def test_scheduled_entries_skip_boot_only_backends(tmp_path):
+    from onboot import try_install
+    from onboot.linux import XDGInstaller
+    tmp_path.joinpath("etc", "xdg", "autostart").mkdir(parents=True)
+    tmp_path.joinpath("etc", "systemd", "system").mkdir(parents=True)
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=tmp_path, schedule=Schedule(calendar="daily"))
+    ok, installer = try_install([XDGInstaller, SystemdSystemInstaller], config, manifest=False)
+    assert ok and isinstance(installer, SystemdSystemInstaller)
+    assert list(tmp_path.joinpath("etc", "xdg", "autostart").iterdir()) == []
+    assert tmp_path.joinpath("etc", "systemd", "system", "timers.target.wants", "agent.timer").is_symlink()
+
+
+def test_schedule_falls_through_to_a_backend_that_can_express_it(tmp_path):
+    from onboot import try_install
+    from onboot.linux import CrontabInstaller
+    tmp_path.joinpath("var", "spool", "cron").mkdir(parents=True)
+    tmp_path.joinpath("etc", "systemd", "system").mkdir(parents=True)
+
+    # No cron equivalent for 45 seconds: systemd takes it
+    odd = InstallerConfiguration(Path("/opt/bin"), "odd", root=tmp_path, schedule=Schedule(interval=45))
+    ok, installer = try_install([CrontabInstaller, SystemdSystemInstaller], odd, manifest=False)
+    assert ok and isinstance(installer, SystemdSystemInstaller)
+    assert CrontabInstaller.install_many([odd]) == {"odd": False}
+
+    # A bare cron expression cannot become a timer: cron takes it
+    cron = InstallerConfiguration(Path("/opt/bin"), "cron", root=tmp_path, schedule=Schedule(cron="*/7 * * * *"))
+    ok, installer = try_install([SystemdSystemInstaller, CrontabInstaller], cron, manifest=False)
+    assert ok and isinstance(installer, CrontabInstaller)
+    assert SystemdSystemInstaller.install_many([cron]) == {"cron": False}
+    assert "*/7 * * * * /opt/bin/cron # onboot:cron" in CrontabInstaller(cron).get_spool_path().read_text()
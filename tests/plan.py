@@ -0,0 +1,69 @@
+import tarfile
+from io import BytesIO
+from os import readlink, stat
+from pathlib import Path
+
+from onboot import InstallerConfiguration
+from onboot.darwin import LaunchDaemonInstaller
+from onboot.linux import InitInstaller, SystemdSystemInstaller, CrontabInstaller, BashrcInstaller
+from onboot.plan import Plan, PlanError, compile_plan
+from onboot.runner import RecordingRunner, use_runner
+
+import pytest
+
+plan_configs = [InstallerConfiguration(Path("/opt/bin"), name) for name in ("a", "b")]
+
+
+def build_plan() -> Plan:
+    plan = compile_plan(plan_configs, InitInstaller)
+    compile_plan(plan_configs, SystemdSystemInstaller, plan)
+    compile_plan(plan_configs[:1], LaunchDaemonInstaller, plan)
+    return plan
+
+
+def test_compile_plan_runs_nothing():
+    def forbidden(args, input):
+        raise AssertionError("planning must not run commands")
+
+    with use_runner(RecordingRunner(forbidden)):
+        plan = build_plan()
+
+    assert plan.files[Path("/etc/init.d/a")].mode == 0o755
+    assert plan.files[Path("/etc/systemd/system/b.service")].content == \
+        SystemdSystemInstaller(plan_configs[1]).generate_service()
+    assert plan.symlinks[Path("/etc/systemd/system/default.target.wants/a.service")].target == \
+        "/etc/systemd/system/a.service"
+    assert plan.commands == [["launchctl", "load", "-w", "/Library/LaunchDaemons/io.a.daemon.plist"]]
+
+
+def test_plan_shared_files_are_rejected():
+    for installer in (BashrcInstaller, CrontabInstaller):
+        with pytest.raises(PlanError):
+            compile_plan(plan_configs, installer)
+
+
+def test_plan_to_tar():
+    buffer = BytesIO()
+    build_plan().to_tar(buffer)
+    buffer.seek(0)
+    with tarfile.open(fileobj=buffer) as tar:
+        members = {m.name: m for m in tar.getmembers()}
+        assert members["etc/init.d/a"].mode == 0o755
+        assert members["etc/systemd/system/default.target.wants/b.service"].issym()
+        assert tar.extractfile("etc/init.d/b").read().decode() == InitInstaller(plan_configs[1]).render()
+
+
+def test_plan_to_directory(tmp_path):
+    build_plan().to_directory(tmp_path)
+    assert stat(tmp_path.joinpath("etc/init.d/a")).st_mode & 0o777 == 0o755
+    assert readlink(tmp_path.joinpath("etc/systemd/system/default.target.wants/a.service")) == \
+        "/etc/systemd/system/a.service"
+    assert tmp_path.joinpath("Library/LaunchDaemons/io.a.daemon.plist").is_file()
+
+
+def test_compile_plan_resolves_concurrency_caps():
+    from onboot.options import Stagger
+    stagger = Stagger(delay=10, concurrency=2, window=30)
+    configs = [InstallerConfiguration(Path("/opt/bin"), f"a{i}", stagger=stagger) for i in range(3)]
+    plan = compile_plan(configs, InitInstaller)
+    assert "sleep 40;" in plan.files[Path("/etc/init.d/a2")].content
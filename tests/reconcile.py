@@ -0,0 +1,150 @@
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.linux import InitInstaller, SystemdSystemInstaller, CrontabInstaller, RcLocalInstaller
+from onboot.reconcile import reconcile
+from onboot.runner import RecordingRunner, use_runner
+
+
+@pytest.fixture
+def init_dir(tmp_path, monkeypatch):
+    directory = tmp_path.joinpath("init.d")
+    directory.mkdir()
+    monkeypatch.setattr(InitInstaller, "autostart_directory", directory)
+    return directory
+
+
+@pytest.fixture
+def spawned():
+    runner = RecordingRunner()
+    with use_runner(runner):
+        yield runner.calls
+
+
+def test_reconcile_minimal_diff(init_dir, configs):
+    result = reconcile(configs("a", "b"), InitInstaller)
+    assert (result.created, result.updated, result.removed) == (["a", "b"], [], [])
+
+    init_dir.joinpath("a").write_text("#!/bin/sh\n# onboot:a\n/somewhere/else/a")
+    init_dir.joinpath("foreign").write_text("#!/bin/sh\nexec foreign\n")
+    result = reconcile(configs("a", "c"), InitInstaller)
+    assert (result.created, result.updated, result.removed) == (["c"], ["a"], ["b"])
+    assert sorted(p.name for p in init_dir.iterdir()) == ["a", "c", "foreign"]
+    assert init_dir.joinpath("a").read_text() == InitInstaller(configs("a")[0]).render()
+
+
+def test_reconcile_noop_writes_nothing(init_dir, spawned, configs):
+    reconcile(configs("a", "b"), InitInstaller)
+    mtimes = {p: p.stat().st_mtime_ns for p in init_dir.iterdir()}
+    result = reconcile(configs("a", "b"), InitInstaller)
+    assert not result.changed
+    assert {p: p.stat().st_mtime_ns for p in init_dir.iterdir()} == mtimes
+    assert spawned == []
+
+
+def test_reconcile_systemd_batches(tmp_path, monkeypatch, spawned, configs):
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    reconcile(configs("a", "b", "c"), SystemdSystemInstaller)
+    assert spawned == [("systemctl", "enable", "a.service", "b.service", "c.service")]
+
+    spawned.clear()
+    assert not reconcile(configs("a", "b", "c"), SystemdSystemInstaller).changed
+    assert spawned == []
+
+    reconcile(configs("a"), SystemdSystemInstaller)
+    assert spawned == [("systemctl", "disable", "b.service", "c.service"), ("systemctl", "daemon-reload")]
+
+
+def test_reconcile_crontab_single_write(monkeypatch, configs, memory_crontab):
+    crontab = memory_crontab.transaction
+    crontab.table = "0 * * * * /usr/bin/backup\n"
+    monkeypatch.setattr("onboot.detect.has_command", lambda command: True)
+    reconcile(configs("a", "b", "c"), memory_crontab)
+    reconcile(configs("a", "d"), memory_crontab)
+    assert crontab.writes == 2
+    assert not reconcile(configs("a", "d"), memory_crontab).changed
+    assert crontab.writes == 2
+    assert crontab.table.splitlines()[0] == "0 * * * * /usr/bin/backup"
+
+
+def test_reconcile_crontab_schedule_change(tmp_path):
+    from onboot.options import Schedule
+    spool = CrontabInstaller(InstallerConfiguration(Path("/opt/bin"), "a", tmp_path)).get_spool_path()
+    boot = [InstallerConfiguration(Path("/opt/bin"), "a", tmp_path)]
+    hourly = [InstallerConfiguration(Path("/opt/bin"), "a", tmp_path, schedule=Schedule(calendar="hourly"))]
+    reconcile(boot, CrontabInstaller)
+    assert reconcile(hourly, CrontabInstaller).updated == ["a"]
+    assert spool.read_text() == "@hourly /opt/bin/a # onboot:a\n"
+    assert not reconcile(hourly, CrontabInstaller).changed
+
+
+def test_reconcile_keeps_stagger_waves(init_dir, tmp_path):
+    from onboot.options import Stagger
+    stagger = Stagger(delay=10, jitter=5, concurrency=2, window=30)
+    desired = [InstallerConfiguration(Path("/opt/bin"), name, stagger=stagger) for name in "abcd"]
+    reconcile(desired, InitInstaller)
+    assert "sleep $((40 + " in init_dir.joinpath("d").read_text()
+    assert not reconcile(desired, InitInstaller).changed
+
+    # Shared rc files too
+    rc = [InstallerConfiguration(Path("/opt/bin"), name, tmp_path, stagger=stagger) for name in "abc"]
+    tmp_path.joinpath("etc").mkdir()
+    reconcile(rc, RcLocalInstaller)
+    assert not reconcile(rc, RcLocalInstaller).changed
+
+
+def test_reconcile_systemd_triggers(tmp_path, monkeypatch, spawned):
+    from onboot.options import Schedule, SocketActivation
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+
+    def desired(**options):
+        return [InstallerConfiguration(Path("/opt/bin"), "a", **options)]
+
+    reconcile(desired(schedule=Schedule(interval=300)), SystemdSystemInstaller)
+    assert reconcile(desired(schedule=Schedule(interval=600)), SystemdSystemInstaller).updated == ["a"]
+    assert "OnUnitActiveSec=600\n" in tmp_path.joinpath("a.timer").read_text()
+
+    spawned.clear()
+    socket = desired(activation=SocketActivation(listen_stream=[8080]))
+    assert reconcile(socket, SystemdSystemInstaller).updated == ["a"]
+    assert sorted(path.name for path in tmp_path.glob("a.*")) == ["a.service", "a.socket"]
+    assert spawned[0] == ("systemctl", "disable", "--now", "a.timer")
+    assert not reconcile(socket, SystemdSystemInstaller).changed
+
+    tmp_path.joinpath("a.socket").unlink()
+    assert reconcile(socket, SystemdSystemInstaller).updated == ["a"]
+
+
+def test_stale_triggers_are_disabled_in_one_call(tmp_path, monkeypatch, spawned):
+    from onboot.options import PathActivation, Stagger
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    staggered = [InstallerConfiguration(Path("/opt/bin"), name, stagger=Stagger(delay=5)) for name in "ab"]
+    SystemdSystemInstaller.install_many(staggered)
+    spawned.clear()
+    watched = [InstallerConfiguration(Path("/opt/bin"), name, activation=PathActivation(path_exists=["/tmp/go"]))
+               for name in "ab"]
+    SystemdSystemInstaller.install_many(watched)
+    assert spawned[0] == ("systemctl", "disable", "--now", "a.timer", "b.timer")
+    assert [call for call in spawned if call[1] == "disable"] == [spawned[0]]
+
+
+def test_reconcile_reloads_once_per_run(tmp_path, monkeypatch, spawned, configs):
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    reconcile(configs("a", "b", "c"), SystemdSystemInstaller)
+    spawned.clear()
+    changed = [InstallerConfiguration(Path("/usr/bin"), "a"), *configs("b")]
+    result = reconcile(changed, SystemdSystemInstaller)
+    assert (result.updated, result.removed) == (["a"], ["c"])
+    assert spawned == [("systemctl", "disable", "c.service"), ("systemctl", "daemon-reload"),
+                       ("systemctl", "enable", "a.service")]
+
+
+def test_reconcile_updates_manifest(init_dir, configs):
+    from onboot import status, try_install
+    assert try_install([InitInstaller], configs("a")[0])[0]
+    reconcile(configs("b"), InitInstaller)
+    assert status("a") is None
+    assert status("b").target == str(init_dir.joinpath("b"))
+    assert not reconcile(configs("b"), InitInstaller, manifest=False).changed
@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.darwin import LaunchDaemonInstaller
+from onboot.linux import SystemdSystemInstaller
+from onboot.runner import BatchingRunner, CommandError, RecordingRunner, SubprocessRunner, get_runner, merge_prefix, \
+    use_runner
+
+
+def test_subprocess_runner_argv_without_shell(tmp_path):
+    spaced = tmp_path.joinpath("with space; $(touch pwned)")
+    out = SubprocessRunner().run([sys.executable, "-c", "import sys; print(sys.argv[1])", spaced])
+    assert out.decode().strip() == str(spaced)
+    assert not Path("pwned").exists()
+
+    assert SubprocessRunner().run([sys.executable, "-c", "import sys; print(sys.stdin.read())"],
+                                  input=b"table") == b"table\n"
+
+
+def test_subprocess_runner_errors():
+    with pytest.raises(CommandError) as e:
+        SubprocessRunner().run([sys.executable, "-c", "import sys; sys.stderr.write('no crontab'); sys.exit(3)"])
+    assert e.value.returncode == 3 and e.value.stderr == b"no crontab"
+    assert isinstance(e.value, OSError)
+
+    with pytest.raises(CommandError) as e:
+        SubprocessRunner(timeout=0.1).run([sys.executable, "-c", "import time; time.sleep(5)"])
+    assert e.value.returncode is None
+
+    with pytest.raises(FileNotFoundError):
+        SubprocessRunner().run(["/nonexistent/onboot-binary"])
+
+
+def test_merge_prefix():
+    assert merge_prefix(("systemctl", "--user", "enable", "--now", "a.service")) == 4
+    assert merge_prefix(("systemctl", "daemon-reload")) == 2
+    assert merge_prefix(("launchctl", "load", "-w", "/a.plist")) == 3
+    assert merge_prefix(("systemctl", "is-enabled", "a.service")) is None
+    assert merge_prefix(("crontab", "-")) is None
+
+
+def test_batching_runner_merges_consecutive_calls():
+    recorder = RecordingRunner()
+    with use_runner(recorder):
+        with BatchingRunner() as batch:
+            assert get_runner() is batch
+            batch.run(["systemctl", "daemon-reload"])
+            batch.run(["systemctl", "daemon-reload"])
+            batch.run(["systemctl", "enable", "a.service"])
+            batch.run(["systemctl", "enable", "b.service", "a.service"])
+            assert recorder.calls == []
+            batch.run(["crontab", "-l"])
+            batch.run(["systemctl", "disable", "c.service"])
+        assert get_runner() is recorder
+    assert recorder.calls == [
+        ("systemctl", "daemon-reload"),
+        ("systemctl", "enable", "a.service", "b.service"),
+        ("crontab", "-l"),
+        ("systemctl", "disable", "c.service"),
+    ]
+
+
+def test_batching_runner_merges_installs(tmp_path, monkeypatch):
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    recorder = RecordingRunner()
+    with use_runner(recorder), BatchingRunner():
+        for name in ("a", "b", "c"):
+            assert SystemdSystemInstaller(InstallerConfiguration(Path("/opt/bin"), name)).install()
+    assert recorder.calls == [("systemctl", "enable", "a.service", "b.service", "c.service")]
+
+
+def test_launchctl_paths_with_spaces(tmp_path, monkeypatch):
+    monkeypatch.setattr(LaunchDaemonInstaller, "autostart_directory", tmp_path.joinpath("Launch Daemons"))
+    tmp_path.joinpath("Launch Daemons").mkdir()
+    recorder = RecordingRunner()
+    installer = LaunchDaemonInstaller(InstallerConfiguration(Path("/opt/my app"), "agent"))
+    with use_runner(recorder):
+        assert installer.install()
+        assert installer.uninstall()
+    path = str(installer.get_autostart_path())
+    assert recorder.calls == [("launchctl", "load", "-w", path), ("launchctl", "unload", path)]
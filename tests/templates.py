@@ -0,0 +1,92 @@
+import plistlib
+import subprocess
+from pathlib import Path
+from xml.etree import ElementTree
+
+import pytest
+
+from onboot import InstallerConfiguration
+from onboot.darwin import PListInstaller, LaunchDaemonInstaller
+from onboot.linux import XDGInstaller, SystemdSystemInstaller, InitInstaller
+from onboot.templates import Template, desktop_exec, desktop_string, shell, systemd_exec, systemd_value, xml
+
+odd = InstallerConfiguration(Path("/opt/my apps/a&b <c>=d"), "run%1 $HOME")
+
+
+def test_desktop_escaping():
+    assert desktop_exec(["/usr/bin/app"]) == "/usr/bin/app"
+    assert desktop_exec(["/opt/my app/run%f"]) == '"/opt/my app/run%%f"'
+    # Quoting backslashes are doubled again by the string escape rule
+    assert desktop_exec(['/opt/say "hi"']) == '"/opt/say \\\\"hi\\\\""'
+    assert desktop_string("a\nb\\c") == "a\\nb\\\\c"
+
+
+def test_systemd_escaping():
+    assert systemd_exec(["/usr/bin/app"]) == "/usr/bin/app"
+    assert systemd_exec(["/opt/my app/a$b%c", "--x=1"]) == '"/opt/my app/a$$b%%c" --x=1'
+    assert systemd_exec(['/opt/a"b\\c']) == '"/opt/a\\"b\\\\c"'
+    assert systemd_exec([";"]) == "\\;"
+    assert systemd_value("50% done\nnext") == "50%% done next"
+
+
+def test_xml_and_shell_escaping():
+    assert xml("a&b <c> \"d\" 'e'") == "a&amp;b &lt;c&gt; &quot;d&quot; &apos;e&apos;"
+    assert shell("/usr/bin/app") == "/usr/bin/app"
+    assert shell("/opt/it's here") == "'/opt/it'\"'\"'s here'"
+
+
+def test_generated_files_with_odd_paths():
+    path = str(odd.get_path())
+
+    unit = SystemdSystemInstaller(odd).render()
+    assert 'ExecStart="/opt/my apps/a&b <c>=d/run%%1 $$HOME"\n' in unit
+    assert "Description=run%%1 $HOME service\n" in unit
+
+    entry = XDGInstaller(odd).render()
+    assert 'Exec="/opt/my apps/a&b <c>=d/run%%1 \\\\$HOME"\n' in entry
+
+    for installer in (PListInstaller, LaunchDaemonInstaller):
+        plist = plistlib.loads(installer(odd).render().encode())
+        assert plist["ProgramArguments"] == [path]
+        assert plist["Label"].startswith("io.run%1 $HOME.")
+        assert plist["RunAtLoad"] is True
+
+
+def test_task_xml_is_valid():
+    from onboot.templates import TASK_XML
+    text = TASK_XML.render({"author": "A&B", "description": "<x>", "name": odd.name,
+                            "command": odd.get_path(), "work_dir": odd.directory})
+    root = ElementTree.fromstring(text.encode("utf-16"))
+    ns = {"t": "http://schemas.microsoft.com/windows/2004/02/mit/task"}
+    assert root.find("t:Actions/t:Exec/t:Command", ns).text == str(odd.get_path())
+    assert root.find("t:RegistrationInfo/t:Author", ns).text == "A&B"
+
+
+def test_shell_script_runs_odd_path(tmp_path, monkeypatch):
+    directory = tmp_path.joinpath("my apps; $(touch pwned)")
+    directory.mkdir()
+    program = directory.joinpath("it's")
+    program.write_text(f"#!/bin/sh\necho ran > '{tmp_path}/out'\n")
+    program.chmod(0o755)
+    monkeypatch.setattr(InitInstaller, "autostart_directory", tmp_path)
+    script = InitInstaller(InstallerConfiguration(directory, "it's")).render()
+    subprocess.run(["/bin/sh", "-c", script], check=True, cwd=tmp_path)
+    assert tmp_path.joinpath("out").read_text() == "ran\n"
+    assert not tmp_path.joinpath("pwned").exists()
+
+
+def test_template_requires_escapers():
+    with pytest.raises(ValueError):
+        Template("{a} {b}", a=str)
+    template = Template("<{a}>", a=xml)
+    assert list(template.render_many([{"a": "&"}, {"a": "x"}])) == ["<&amp;>", "<x>"]
+
+
+def test_render_many_streams(monkeypatch, tmp_path):
+    monkeypatch.setattr(SystemdSystemInstaller, "autostart_directory", tmp_path)
+    configs = (InstallerConfiguration(Path("/opt/bin"), f"unit{i}") for i in range(1000))
+    rendered = SystemdSystemInstaller.render_many(configs)
+    path, content = next(rendered)
+    assert path == tmp_path.joinpath("unit0.service")
+    assert "ExecStart=/opt/bin/unit0\n" in content
+    assert sum(1 for _ in rendered) == 999
@@ -0,0 +1,127 @@
+from os import readlink
+from pathlib import Path
+
+import pytest
+
+from onboot import InstallerConfiguration, detect
+from onboot.linux import XDGInstaller, KDEPlasmaInstaller, SystemdUserInstaller, SystemdSystemInstaller, BashrcInstaller
+from onboot.options import PathActivation, SliceLimits
+from onboot.runner import RecordingRunner, use_runner
+from onboot.users import User, install_for_users, lookup_users, owned_paths, passwd_users, uninstall_for_users, user_config
+
+PASSWD = """root:x:0:0:root:/root:/bin/bash
+daemon:x:1:1:daemon:/usr/sbin:/usr/sbin/nologin
+nobody:x:65534:65534:nobody:/nonexistent:/usr/sbin/nologin
+"""
+
+
+@pytest.fixture
+def sysroot(tmp_path, monkeypatch):
+    monkeypatch.setenv("ONBOOT_LOCK_DIR", str(tmp_path.joinpath("locks")))
+    tmp_path.joinpath("etc").mkdir()
+    lines = [PASSWD]
+    for i in range(50):
+        lines.append(f"user{i}:x:{2000 + i}:{2000 + i}::/home/user{i}:/bin/bash\n")
+        home = tmp_path.joinpath(f"home/user{i}")
+        home.mkdir(parents=True)
+        home.joinpath(".bashrc").write_text("# user settings\n")
+    lines.append("ghost:x:3000:3000::/home/ghost:/bin/sh\n")
+    tmp_path.joinpath("etc/passwd").write_text("".join(lines))
+    return tmp_path
+
+
+def test_passwd_users(sysroot):
+    users = passwd_users(sysroot)
+    assert [user.name for user in users][:2] == ["user0", "user1"]
+    assert len(users) == 51
+    assert lookup_users(["user3"], sysroot) == [User("user3", 2003, 2003, Path("/home/user3"), "/bin/bash")]
+    with pytest.raises(KeyError):
+        lookup_users(["nope"], sysroot)
+
+
+@pytest.mark.parametrize("installer, relative", [
+    (XDGInstaller, ".config/autostart/agent.desktop"),
+    (KDEPlasmaInstaller, ".config/autostart-scripts/agent.sh"),
+    (SystemdUserInstaller, ".config/systemd/user/agent.service"),
+    (BashrcInstaller, ".bashrc"),
+])
+def test_install_for_users(sysroot, installer, relative):
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=sysroot)
+    if installer is KDEPlasmaInstaller:
+        for i in range(50):
+            sysroot.joinpath(f"home/user{i}/.config/autostart-scripts").mkdir(parents=True)
+
+    with use_runner(RecordingRunner()) as runner:
+        results = install_for_users(installer, config)
+    assert runner.calls == []
+    assert results.pop("ghost") is False
+    assert len(results) == 50 and all(results.values())
+
+    path = sysroot.joinpath("home/user7", relative)
+    assert "/opt/bin/agent" in path.read_text()
+    if detect.is_root():
+        assert path.stat().st_uid == 2007
+        if installer is not BashrcInstaller:
+            assert sysroot.joinpath("home/user7/.config").stat().st_uid == 2007
+    if installer is SystemdUserInstaller:
+        link = sysroot.joinpath("home/user7/.config/systemd/user/default.target.wants/agent.service")
+        assert readlink(link) == "/home/user7/.config/systemd/user/agent.service"
+
+    users = lookup_users(["user1", "user2"], sysroot)
+    assert uninstall_for_users(installer, config, users) == {"user1": True, "user2": True}
+    assert "/opt/bin/agent" not in (sysroot.joinpath("home/user1", relative).read_text()
+                                    if installer is BashrcInstaller else "")
+    if installer is not BashrcInstaller:
+        assert not sysroot.joinpath("home/user1", relative).exists()
+        assert sysroot.joinpath("home/user3", relative).exists()
+
+
+def test_install_for_users_refuses_symlinks(sysroot):
+    outside = sysroot.joinpath("outside")
+    outside.mkdir()
+    home = sysroot.joinpath("home/user0")
+    home.joinpath(".config").mkdir()
+    home.joinpath(".config/autostart").symlink_to(outside)
+    home.joinpath(".bashrc").unlink()
+    home.joinpath(".bashrc").symlink_to(sysroot.joinpath("etc/passwd"))
+
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=sysroot)
+    users = lookup_users(["user0", "user1"], sysroot)
+    assert install_for_users(XDGInstaller, config, users) == {"user0": False, "user1": True}
+    assert install_for_users(BashrcInstaller, config, users) == {"user0": False, "user1": True}
+    assert list(outside.iterdir()) == []
+    assert "agent" not in sysroot.joinpath("etc/passwd").read_text()
+
+
+def test_per_user_backends_need_a_home_under_a_root(tmp_path):
+    from onboot import try_install
+    tmp_path.joinpath("etc", "systemd").mkdir(parents=True)
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=tmp_path)
+    for installer in (BashrcInstaller, KDEPlasmaInstaller, SystemdUserInstaller):
+        assert not installer(config).accepts()
+    assert BashrcInstaller.install_many([config]) == {"agent": False}
+    assert SystemdUserInstaller.install_many([config]) == {"agent": False}
+
+    ok, used = try_install([BashrcInstaller, SystemdUserInstaller, SystemdSystemInstaller], config, manifest=False)
+    assert ok and type(used) is SystemdSystemInstaller
+    assert not tmp_path.joinpath("home").exists() and not tmp_path.joinpath("root").exists()
+
+    home = InstallerConfiguration(Path("/opt/bin"), "agent", root=tmp_path, home=Path("/home/ci"))
+    assert BashrcInstaller(home).accepts()
+
+
+def test_owned_paths_cover_trigger_and_slice(sysroot):
+    config = InstallerConfiguration(Path("/opt/bin"), "agent", root=sysroot, slice_limits=SliceLimits(cpu_quota=50),
+                                    activation=PathActivation(path_exists=("/tmp/go",)))
+    users = lookup_users(["user4"], sysroot)
+    with use_runner(RecordingRunner()):
+        assert install_for_users(SystemdUserInstaller, config, users) == {"user4": True}
+
+    units = sysroot.joinpath("home/user4/.config/systemd/user")
+    installer = SystemdUserInstaller(user_config(config, users[0]))
+    paths = owned_paths(installer)
+    assert installer.get_trigger_path() in paths and installer.get_slice_path() in paths
+    assert units.joinpath("agent.path").is_file() and units.joinpath(SystemdUserInstaller.slice_name).is_file()
+    if detect.is_root():
+        assert units.joinpath("agent.path").stat().st_uid == 2004
+        assert units.joinpath(SystemdUserInstaller.slice_name).stat().st_uid == 2004